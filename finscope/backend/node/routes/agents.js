@@ -409,26 +409,22 @@ router.post('/report', async (req, res) => {
     } catch (_) {}
     run.steps.push({ name: 'BankSummary', type: 'context', status: personal_finance ? 'ok' : 'empty' })
 
-    // Step 3.5: Forecasts (call Python /forecast for each symbol) — parallelized and skippable in fast mode
+    // Step 3.5: Forecasts (one Python /forecast/batch call for the whole portfolio) — skippable in fast mode
     const forecast = {}
     if (!isFast) {
-      const fResults = await mapLimit(okSymbols, 4, async (sym) => {
-        try {
-          const r = await withCache({
-            key: `py:forecast:${sym}:14`,
-            ttlSec: 600,
-            task: async () => {
-              const r = await axios.get(`${PY_URL}/forecast`, { params: { symbol: sym, horizon: 14 }, timeout: 15000 })
-              return r
-            }
-          })
-          const f = r.data
-          return (!f?.error && Array.isArray(f?.forecast)) ? { sym, f } : { sym }
-        } catch (e) {
-          return { sym, error: e?.message || String(e) }
+      try {
+        const batch = await withCache({
+          key: `py:forecast:batch:${[...okSymbols].sort().join(',')}:14`,
+          ttlSec: 600,
+          task: async () => {
+            const r = await axios.post(`${PY_URL}/forecast/batch`, { symbols: okSymbols, horizons: [14] }, { timeout: 15000 })
+            return r.data
+          }
+        })
+        for (const [sym, f] of Object.entries(batch?.forecasts || {})) {
+          if (Array.isArray(f?.forecast)) forecast[sym] = f
         }
-      })
-      fResults.forEach(r => { if (r && r.f) forecast[r.sym] = r.f })
+      } catch (_) {}
       run.steps.push({ name: 'ForecasterAgent', type: 'forecast', status: Object.keys(forecast).length ? 'ok' : 'empty', output: Object.keys(forecast) })
     } else {
       run.steps.push({ name: 'ForecasterAgent', type: 'forecast', status: 'skipped' })
@@ -129,7 +129,8 @@ router.post('/webhook', async (req, res) => {
         const tx = await plaid.transactionsGet({ access_token, start_date: fmt(start), end_date: fmt(end) })
         const transactions = tx?.data?.transactions || []
         if (transactions.length) {
-          await axios.post(`${PY_URL}/bank/transactions`, { transactions }, { timeout: 15000 })
+          // Fire-and-forget: the webhook only needs the write queued, not committed
+          await axios.post(`${PY_URL}/bank/transactions`, { transactions }, { params: { durable: false }, timeout: 15000 })
         }
       } catch (e) {
         // swallow errors; webhook should still ack
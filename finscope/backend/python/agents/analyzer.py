@@ -0,0 +1,26 @@
+"""Analyzer agent: z-scores and anomaly flags for collected price series."""
+from anomaly import score_batch
+
+
+class Analyzer:
+    def run(self, market_data):
+        """Score every series in one vectorized pass.
+
+        Args:
+            market_data (dict): Symbol -> list of closing prices.
+
+        Returns:
+            dict: Symbol -> {"z_score_last", "recent_anomalies", "insights"}.
+        """
+        symbols = [s for s, v in market_data.items() if v]
+        scores = score_batch([market_data[s] for s in symbols])
+        out = {}
+        for sym, res in zip(symbols, scores):
+            if "error" in res:
+                continue
+            out[sym] = {
+                "z_score_last": round(res["z_score_last"], 4),
+                "recent_anomalies": int(sum(res["anomaly_flags"][-5:])),
+                "insights": res["insights"],
+            }
+        return out
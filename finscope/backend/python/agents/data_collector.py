@@ -1,19 +1,28 @@
 """Data collection agent for fetching market data."""
-import yfinance as yf
+from market_data import get_history_many
 
 class DataCollector:
+    def __init__(self):
+        self.errors = {}
+
     def run(self, symbols=["SPY", "QQQ", "DIA"]):
         """Fetch market data for the given symbols.
-        
+
+        Symbols are fetched concurrently; any that fail are left out of the
+        result and recorded in ``self.errors`` (symbol -> message).
+
         Args:
             symbols (list): List of ticker symbols to fetch data for.
-            
+
         Returns:
             dict: Symbol -> list of closing prices mapping.
         """
+        histories, self.errors = get_history_many(symbols, period="1mo", interval="1d")
         data = {}
         for sym in symbols:
-            ticker = yf.Ticker(sym)
-            hist = ticker.history(period="1mo", interval="1d")
-            data[sym] = hist["Close"].tolist()
-        return data
\ No newline at end of file
+            hist = histories.get(str(sym).strip().upper())
+            if hist is None:
+                continue
+            # Adjusted closes, matching yfinance's auto_adjust default used previously
+            data[sym] = hist["Adj Close"].fillna(hist["Close"]).tolist()
+        return data
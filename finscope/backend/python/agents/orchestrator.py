@@ -1,8 +1,126 @@
-"""Orchestrator for running financial analysis pipeline."""
+"""Orchestrator for running financial analysis pipeline.
+
+Agents run as a dependency graph: each one starts as soon as the agents it
+depends on have finished, so independent agents run concurrently. Every agent
+has its own deadline; one that times out or fails is reported in ``warnings``,
+its dependents are skipped, and the rest of the report is still returned.
+"""
+from agents.analyzer import Analyzer
 from agents.data_collector import DataCollector
+from agents.risk import RiskAssessor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import metrics
 from datetime import datetime
+import functools
+import os
+import time
 import uuid
-from typing import Dict, List, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# Seconds each agent may run, measured from when it starts
+DEFAULT_DEADLINES = {
+    "data": float(os.environ.get("REPORT_DEADLINE_DATA", "25")),
+    "analyzer": float(os.environ.get("REPORT_DEADLINE_ANALYZER", "5")),
+    "risk": float(os.environ.get("REPORT_DEADLINE_RISK", "10")),
+}
+REPORT_AGENT_WORKERS = int(os.environ.get("REPORT_AGENT_WORKERS", "8"))
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(1, REPORT_AGENT_WORKERS), thread_name_prefix="report-agent")
+    return _pool
+
+
+class AgentNode:
+    """One step of the report: ``fn`` receives the results of ``deps`` keyword-by-name."""
+
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = (), deadline: float = 10.0):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.deadline = deadline
+
+
+def _check_acyclic(nodes: List[AgentNode]):
+    """Raise ValueError if the dependencies contain a cycle (Kahn's topological sort)."""
+    waiting = {n.name: len(set(n.deps)) for n in nodes}
+    dependents: Dict[str, List[str]] = {}
+    for n in nodes:
+        for d in set(n.deps):
+            dependents.setdefault(d, []).append(n.name)
+    ready = [name for name, k in waiting.items() if k == 0]
+    while ready:
+        for dep in dependents.get(ready.pop(), []):
+            waiting[dep] -= 1
+            if waiting[dep] == 0:
+                ready.append(dep)
+    cyclic = sorted(name for name, k in waiting.items() if k > 0)
+    if cyclic:
+        raise ValueError(f"Agent dependencies form a cycle: {', '.join(cyclic)}")
+
+
+def run_dag(nodes: List[AgentNode], pool: Optional[ThreadPoolExecutor] = None):
+    """Run ``nodes`` respecting dependencies and deadlines.
+
+    Returns ``(results, status, timings_ms, warnings)``. A timed-out agent keeps
+    running in the background, but its result is dropped. Raises ValueError for
+    unknown or cyclic dependencies.
+    """
+    pool = pool or _get_pool()
+    by_name = {n.name: n for n in nodes}
+    for n in nodes:
+        unknown = [d for d in n.deps if d not in by_name]
+        if unknown:
+            raise ValueError(f"{n.name} depends on unknown agent(s): {', '.join(unknown)}")
+    _check_acyclic(nodes)
+    results: Dict[str, Any] = {}
+    status: Dict[str, str] = {}
+    timings: Dict[str, float] = {}
+    warnings: List[str] = []
+    running = {}
+    started: Dict[str, float] = {}
+
+    def settle(name: str, state: str, message: Optional[str] = None):
+        status[name] = state
+        if name in started:
+            timings[name] = round((time.perf_counter() - started[name]) * 1000, 1)
+        if message:
+            warnings.append(message)
+
+    while len(status) < len(nodes):
+        for node in nodes:
+            if node.name in status or node.name in started:
+                continue
+            failed = [d for d in node.deps if status.get(d, "ok") != "ok"]
+            if failed:
+                settle(node.name, "skipped", f"{node.name} agent skipped: {', '.join(failed)} unavailable")
+            elif all(d in status for d in node.deps):
+                started[node.name] = time.perf_counter()
+                call = functools.partial(node.fn, **{d: results[d] for d in node.deps})
+                running[pool.submit(metrics.bind(call))] = node.name
+        if not running:
+            continue
+        now = time.perf_counter()
+        next_deadline = min(started[n] + by_name[n].deadline for n in running.values())
+        done, _ = wait(list(running), timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = running.pop(fut)
+            try:
+                results[name] = fut.result()
+                settle(name, "ok")
+            except Exception as e:
+                settle(name, "error", f"{name} agent failed: {str(e) or e.__class__.__name__}")
+        now = time.perf_counter()
+        for fut, name in list(running.items()):
+            if now - started[name] >= by_name[name].deadline:
+                running.pop(fut)
+                settle(name, "timeout", f"{name} agent timed out after {by_name[name].deadline:g}s")
+    return results, status, timings, warnings
+
 
 def _extract_symbols(portfolio: Union[Dict[str, List[float]], List[str], None]) -> List[str]:
     """Extract a list of symbols from multiple accepted input shapes.
@@ -20,18 +138,33 @@ def _extract_symbols(portfolio: Union[Dict[str, List[float]], List[str], None])
         return [str(s).upper() for s in portfolio if isinstance(s, str) and s.strip()]
     return ["SPY"]
 
-def generate_report(user_portfolio: Union[Dict[str, List[float]], List[str], None]):
+def generate_report(user_portfolio: Union[Dict[str, List[float]], List[str], None],
+                    weights: Optional[Dict[str, float]] = None,
+                    deadlines: Optional[Dict[str, float]] = None):
     """Generate a financial analysis report.
-    
+
     Args:
         user_portfolio: Either a dict mapping symbol->price series, a list of symbols, or None.
-        
+        weights: Optional symbol->weight for the tail-risk section (equal weight if omitted).
+        deadlines: Optional per-agent overrides of ``DEFAULT_DEADLINES`` (seconds).
+
     Returns:
-        dict: Report containing market data samples and metadata.
+        dict: Report containing market data samples, analysis, tail risk, warnings
+        and per-agent ``timings_ms``. Sections whose agent did not finish are None.
     """
+    t0 = time.perf_counter()
     symbols = _extract_symbols(user_portfolio)
+    limits = {**DEFAULT_DEADLINES, **(deadlines or {})}
     data_agent = DataCollector()
-    market_data = data_agent.run(symbols=symbols)
+
+    nodes = [
+        AgentNode("data", lambda: data_agent.run(symbols=symbols), deadline=limits["data"]),
+        AgentNode("analyzer", lambda data: Analyzer().run(data), deps=["data"], deadline=limits["analyzer"]),
+        AgentNode("risk", lambda data: RiskAssessor(weights).run(data), deps=["data"], deadline=limits["risk"]),
+    ]
+    results, status, timings, warnings = run_dag(nodes)
+    market_data = results.get("data") or {}
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 1)
 
     report = {
         "run_id": str(uuid.uuid4()),
@@ -39,7 +172,11 @@ def generate_report(user_portfolio: Union[Dict[str, List[float]], List[str], Non
         "input_symbols": symbols,
         "market_data_keys": list(market_data.keys()),
         "market_data_samples": {k: (v[:5] if isinstance(v, list) else v) for k, v in market_data.items()},
-        "warnings": [],
+        "analysis": results.get("analyzer"),
+        "tail_risk": results.get("risk"),
+        "warnings": [f"{sym}: {err}" for sym, err in data_agent.errors.items()] + warnings,
+        "agents": status,
+        "timings_ms": timings,
     }
     return report
 
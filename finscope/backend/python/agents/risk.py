@@ -0,0 +1,22 @@
+"""Risk agent: Monte Carlo tail risk for the collected price series."""
+from montecarlo import portfolio_tail_risk
+
+
+class RiskAssessor:
+    def __init__(self, weights=None, n_paths=5000):
+        self.weights = weights
+        self.n_paths = n_paths
+
+    def run(self, market_data):
+        """VaR/CVaR and drawdown distribution for the portfolio.
+
+        Uses ``weights`` when given, else equal weights; the seed is fixed so
+        re-running a report gives the same numbers.
+
+        Args:
+            market_data (dict): Symbol -> list of closing prices.
+
+        Returns:
+            dict: The ``montecarlo.portfolio_tail_risk`` summary.
+        """
+        return portfolio_tail_risk(market_data, self.weights, n_paths=self.n_paths, seed=0)
@@ -0,0 +1,177 @@
+"""Anomaly detection for /analyze: cached detectors, streaming EWMA and batch scoring.
+
+- ``isolation_flags`` fits an IsolationForest once per distinct series; fitted
+  detectors and their flags are kept in an LRU keyed by a content hash, so a
+  re-posted series costs one hash.
+- ``EwmaStreams`` keeps per-stream exponentially weighted mean/variance and
+  scores new points incrementally, with no refitting.
+- ``score_batch`` scores many series in one vectorized pass (z-scores with the
+  same 95th-percentile cut the single-series path uses).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from forecasting import stack_right_aligned
+
+ANOMALY_CACHE_SIZE = int(os.environ.get("ANOMALY_CACHE_SIZE", "256"))
+ANOMALY_MAX_STREAMS = int(os.environ.get("ANOMALY_MAX_STREAMS", "1024"))
+
+
+class LRU:
+    """Small thread-safe LRU map with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Any, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Any):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_detectors = LRU(ANOMALY_CACHE_SIZE)
+
+
+def series_key(ser: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(ser, dtype=np.float64).tobytes()).hexdigest()
+
+
+def cached_flags(ser: np.ndarray) -> Tuple[str, Optional[np.ndarray]]:
+    """``(key, flags)`` for a series whose detector is already fitted, else ``(key, None)``.
+
+    Cheap enough to call on the event loop; pass ``key`` on to ``isolation_flags`` on a miss.
+    """
+    key = series_key(ser)
+    hit = _detectors.get(key)
+    return key, (hit[1] if hit is not None else None)
+
+
+def isolation_flags(ser: np.ndarray, key: Optional[str] = None) -> np.ndarray:
+    """IsolationForest anomaly flags (top 5% of scores, read-only bool array), reusing a cached fit for identical series.
+
+    A ``key`` from ``cached_flags`` means the lookup already missed, so the fit runs directly.
+    """
+    if key is None:
+        key, flags = cached_flags(ser)
+        if flags is not None:
+            return flags
+    from sklearn.ensemble import IsolationForest
+    iso = IsolationForest(contamination=0.05, random_state=42)
+    iso.fit(ser.reshape(-1, 1))
+    scores = -iso.score_samples(ser.reshape(-1, 1))
+    flags = scores > np.percentile(scores, 95)
+    # Shared by every response for this series
+    flags.setflags(write=False)
+    _detectors.put(key, (iso, flags))
+    return flags
+
+
+def insights_for(z: np.ndarray, flags: Sequence[bool]) -> List[str]:
+    insights = []
+    if np.mean(z[-5:]) > 0.5:
+        insights.append("Portfolio trending upward lately vs baseline.")
+    if any(flags[-5:]):
+        insights.append("Recent anomaly detected; review recent exposures.")
+    return insights or ["No significant anomalies detected."]
+
+
+class EwmaStreams:
+    """Per-stream EWMA mean/variance; each point is scored against the state before it is absorbed."""
+
+    def __init__(self, max_streams: int = ANOMALY_MAX_STREAMS):
+        self._states = LRU(max_streams)
+        self._lock = threading.Lock()
+
+    def update(self, stream_id: str, values: Sequence[float], alpha: float = 0.1,
+               threshold: float = 3.0, warmup: int = 10, reset: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            if reset:
+                self._states.pop(stream_id)
+            state = self._states.get(stream_id) or {"n": 0, "mean": 0.0, "var": 0.0}
+            n, mean, var = state["n"], state["mean"], state["var"]
+            z_scores: List[Optional[float]] = []
+            flags: List[bool] = []
+            for x in values:
+                x = float(x)
+                if n == 0:
+                    mean, var, z = x, 0.0, None
+                else:
+                    std = var ** 0.5
+                    z = (x - mean) / std if std > 0 else 0.0
+                    diff = x - mean
+                    incr = alpha * diff
+                    mean += incr
+                    var = (1 - alpha) * (var + diff * incr)
+                n += 1
+                z_scores.append(z)
+                flags.append(bool(z is not None and n > warmup and abs(z) > threshold))
+            self._states.put(stream_id, {"n": n, "mean": mean, "var": var})
+        return {
+            "stream_id": stream_id,
+            "z_scores": z_scores,
+            "anomaly_flags": flags,
+            "n": n,
+            "mean": mean,
+            "std": var ** 0.5,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return self._states.stats()
+
+
+streams = EwmaStreams()
+
+
+def score_batch(series: Sequence[Sequence[float]]) -> List[Dict[str, Any]]:
+    """Score many series at once: z-scores per series and flags above each series' 95th percentile of |z|."""
+    if not series:
+        return []
+    mat = stack_right_aligned(series)
+    with np.errstate(invalid="ignore"):
+        z = (mat - np.nanmean(mat, axis=0)) / (np.nanstd(mat, axis=0) + 1e-9)
+        score = np.abs(z)
+        cut = np.nanpercentile(score, 95, axis=0)
+        flagged = score > cut
+    out = []
+    n_max = mat.shape[0]
+    for j, s in enumerate(series):
+        if not len(s):
+            out.append({"error": "empty series"})
+            continue
+        zj = z[n_max - len(s):, j]
+        flags = flagged[n_max - len(s):, j].tolist()
+        out.append({"z_score_last": float(zj[-1]), "anomaly_flags": flags, "insights": insights_for(zj, flags)})
+    return out
+
+
+def stats() -> Dict[str, Any]:
+    return {"detector_cache": _detectors.stats(), "streams": streams.stats()}
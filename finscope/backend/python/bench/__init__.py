@@ -0,0 +1 @@
+"""Offline benchmarks for the Python service (see ``bench/README.md``)."""
@@ -0,0 +1,46 @@
+"""Compare two benchmark result files.
+
+    python -m bench.compare bench/results/old.json bench/results/new.json
+
+Prints p50/p99 latency and throughput per (mode, scale, scenario) with the
+relative change; rows present in only one file are listed as such.
+"""
+import argparse
+import json
+from typing import Any, Dict, Optional, Tuple
+
+
+def _rows(path: str) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["mode"], r["scale"], r["scenario"]): r for r in report["results"]}
+
+
+def _delta(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare two bench.run result files.")
+    ap.add_argument("old")
+    ap.add_argument("new")
+    args = ap.parse_args()
+    old, new = _rows(args.old), _rows(args.new)
+    header = f"{'mode':<10} {'scale':<6} {'scenario':<20} {'p50 ms':>18} {'p99 ms':>18} {'req/s':>18}"
+    print(header)
+    print("-" * len(header))
+    for key in sorted(set(old) | set(new)):
+        a, b = old.get(key), new.get(key)
+        if a is None or b is None:
+            print(f"{key[0]:<10} {key[1]:<6} {key[2]:<20} only in {'new' if a is None else 'old'}")
+            continue
+        cols = []
+        for get in (lambda r: r["latency_ms"]["p50"], lambda r: r["latency_ms"]["p99"], lambda r: r["throughput_rps"]):
+            cols.append(f"{get(b):>9} {_delta(get(a), get(b)):>8}")
+        print(f"{key[0]:<10} {key[1]:<6} {key[2]:<20} " + " ".join(cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Offline throughput/latency benchmark for the Python service.
+
+Run from ``backend/python``::
+
+    python -m bench.run --scales 10k,1m --modes inprocess,uvicorn
+
+For each scale the database is seeded (or reused) with ``bench.seed``, the
+upstream is replaced by ``bench.synthetic``, and every scenario is driven at
+``--concurrency`` with ``--requests`` timed requests after ``--warmup``
+untimed ones. ``inprocess`` calls the ASGI app directly (no sockets, so it
+isolates handler cost); ``uvicorn`` starts a local server and goes over HTTP.
+Each (mode, scale) runs in a fresh process so module-level state and caches
+do not leak between runs. Results are written as JSON (see ``bench.compare``).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bench import seed as seeding
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(HERE)
+
+# (method, path, params, json body) for request number i
+Request = Tuple[str, str, Optional[Dict[str, Any]], Optional[Any]]
+
+
+def _ts(epoch: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+class Context:
+    """What scenarios need to build requests against a seeded database."""
+
+    def __init__(self, manifest: Dict[str, Any], symbols: int):
+        self.symbols = [f"SYN{i:03d}" for i in range(symbols)]
+        self.metrics = manifest["ts_metrics"]
+        self.ts_start = manifest["ts_start"]
+        self.ts_end = manifest["ts_end"]
+
+    def window(self, i: int, seconds: int) -> Dict[str, str]:
+        """A ``seconds``-long [start, end] inside the seeded span, moving with ``i``."""
+        span = self.ts_end - self.ts_start
+        seconds = min(seconds, span)
+        offset = random.Random(i).randint(0, max(0, span - seconds))
+        return {"start": _ts(self.ts_start + offset), "end": _ts(self.ts_start + offset + seconds)}
+
+    def metric(self, i: int) -> str:
+        return self.metrics[i % len(self.metrics)]
+
+
+def _series(i: int, n: int = 120) -> Dict[str, Any]:
+    rng = np.random.default_rng(i)
+    values = (100 + np.cumsum(rng.normal(0, 1, n))).round(4).tolist()
+    return {"labels": [str(k) for k in range(n)], "values": values}
+
+
+def _points(i: int, c: Context, n: int = 100) -> List[Dict[str, Any]]:
+    """``n`` new points for a metric the read scenarios never query (ingest scenarios run last)."""
+    base = c.ts_end + i * n
+    return [{"source": "bench", "metric": f"bench_ingest_{i % 8}", "timestamp": _ts(base + k), "value": float(k)}
+            for k in range(n)]
+
+
+SECTORS = ["tech", "healthcare", "financials", "energy", "industrials", "utilities"]
+
+# Each scenario maps (request number, context) to a request. Parameters vary with i
+# so response caches see a realistic mix instead of one hot key.
+SCENARIOS: Dict[str, Callable[[int, Context], Request]] = {
+    "forecast": lambda i, c: ("GET", "/forecast", {"symbol": c.symbols[i % len(c.symbols)], "horizon": 7 + i % 24}, None),
+    "analyze": lambda i, c: ("POST", "/analyze", None, {"portfolio": _series(i)}),
+    "simulate": lambda i, c: ("POST", "/simulate", None, {
+        "weights": {"tech": 40, "healthcare": 30, "energy": 10},
+        "shifts": [{"from_sector": "tech", "to_sector": SECTORS[1 + i % 5], "shift_pct": 5 + i % 20}],
+    }),
+    "invest": lambda i, c: ("POST", "/invest", None, {
+        "positions": [{"symbol": c.symbols[(i + k) % len(c.symbols)], "weight": w} for k, w in enumerate((0.4, 0.3, 0.2, 0.1))],
+    }),
+    "bank_summary": lambda i, c: ("GET", "/bank/summary", {"days": (7, 30, 90, 365)[i % 4] + i // 4 % 7}, None),
+    "ts_query_raw": lambda i, c: ("GET", "/timeseries/query", {"metric": c.metric(i), **c.window(i, 86400)}, None),
+    "ts_query_compact": lambda i, c: ("GET", "/timeseries/query", {
+        "metric": c.metric(i), "format": "compact", **c.window(i, 86400)}, None),
+    "ts_query_bucketed": lambda i, c: ("GET", "/timeseries/query", {
+        "metric": c.metric(i), "bucket": "1h", "agg": "avg", **c.window(i, 7 * 86400)}, None),
+    "ts_query_max_points": lambda i, c: ("GET", "/timeseries/query", {
+        "metric": c.metric(i), "max_points": 500, **c.window(i, 7 * 86400)}, None),
+    "ts_multi": lambda i, c: ("GET", "/timeseries/multi", {
+        "metric": f"{c.metric(i)},{c.metric(i + 1)}", "bucket": "1h", **c.window(i, 7 * 86400)}, None),
+    "ts_ingest": lambda i, c: ("POST", "/timeseries/ingest", None, _points(i, c)),
+    "ts_ingest_queued": lambda i, c: ("POST", "/timeseries/ingest", {"durable": "false"}, _points(i, c)),
+}
+
+
+def _summary(latencies: List[float], elapsed: float, errors: int, cache_hits: int) -> Dict[str, Any]:
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "cache_hits": cache_hits,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p90": round(float(np.percentile(ms, 90)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "mean": round(float(ms.mean()), 3),
+            "max": round(float(ms.max()), 3),
+        },
+    }
+
+
+def _failed(resp) -> bool:
+    if resp.status_code >= 400:
+        return True
+    if "json" in resp.headers.get("content-type", ""):
+        try:
+            body = resp.json()
+        except ValueError:
+            return True
+        return isinstance(body, dict) and "error" in body
+    return False
+
+
+async def run_scenario(client, name: str, ctx: Context, requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    make = SCENARIOS[name]
+
+    async def send(i: int):
+        method, path, params, body = make(i, ctx)
+        t0 = time.perf_counter()
+        resp = await client.request(method, path, params=params, json=body)
+        return time.perf_counter() - t0, resp
+
+    # Warm-up uses indices past the timed range, so it does not pre-fill caches for timed requests
+    for i in range(warmup):
+        await send(requests + i)
+
+    latencies: List[float] = []
+    counts = {"errors": 0, "hits": 0}
+    pending = iter(range(requests))
+
+    async def worker():
+        for i in pending:
+            elapsed, resp = await send(i)
+            latencies.append(elapsed)
+            counts["errors"] += _failed(resp)
+            counts["hits"] += resp.headers.get("x-fastapi-cache", "").upper() == "HIT"
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return {"scenario": name, **_summary(latencies, time.perf_counter() - t0, counts["errors"], counts["hits"])}
+
+
+async def _prime(client, ctx: Context):
+    """Load a year of bars for every benchmark symbol, so timed requests read the local store."""
+    for sym in ctx.symbols:
+        await client.get("/market", params={"symbol": sym, "period": "1y"})
+
+
+async def drive(client, ctx: Context, args) -> List[Dict[str, Any]]:
+    await _prime(client, ctx)
+    out = []
+    for name in args.scenarios:
+        out.append(await run_scenario(client, name, ctx, args.requests, args.concurrency, args.warmup))
+        print(f"  {name}: p50 {out[-1]['latency_ms']['p50']} ms, p99 {out[-1]['latency_ms']['p99']} ms, "
+              f"{out[-1]['throughput_rps']} req/s", file=sys.stderr)
+    return out
+
+
+async def _inprocess(args) -> List[Dict[str, Any]]:
+    import httpx
+    import main
+
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            return await drive(client, Context(seeding.load_manifest(args.db_dir), args.symbols), args)
+    finally:
+        await main.app.router.shutdown()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _over_http(args, env: Dict[str, str]) -> List[Dict[str, Any]]:
+    import httpx
+
+    port = args.port or _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    server = subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        limits = httpx.Limits(max_connections=max(1, args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=base, timeout=args.timeout, limits=limits) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not become healthy within 60s")
+                await asyncio.sleep(0.2)
+            return await drive(client, Context(seeding.load_manifest(args.db_dir), args.symbols), args)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def _service_env(args, db_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop("REDIS_URL", None)  # in-memory response cache: no external services
+    env.update({
+        "DB_DIR": db_dir,
+        "MARKET_DATA_SOURCE": "bench.synthetic:source",
+        "BENCH_UPSTREAM_MS": str(args.upstream_ms),
+        # Rollups would rewrite the seeded timeseries under the benchmark
+        "TS_MAINTENANCE_SECONDS": "0",
+        "PYTHONPATH": os.pathsep.join(p for p in (SERVICE_DIR, env.get("PYTHONPATH")) if p),
+    })
+    if not args.warm:
+        env["WARM_ENABLED"] = "0"
+    return env
+
+
+def _child_args(args, mode: str, db_dir: str) -> List[str]:
+    return [sys.executable, "-m", "bench.run", "--child", mode, "--db-dir", db_dir,
+            "--scenarios", ",".join(args.scenarios), "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency), "--warmup", str(args.warmup), "--symbols", str(args.symbols),
+            "--workers", str(args.workers), "--port", str(args.port), "--timeout", str(args.timeout),
+            "--upstream-ms", str(args.upstream_ms)] + (["--warm"] if args.warm else [])
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(args) -> Dict[str, Any]:
+    results = []
+    seeds = {}
+    for scale in args.scales:
+        rows = seeding.parse_scale(scale)
+        db_dir = os.path.join(args.bench_dir, scale)
+        env = _service_env(args, db_dir)
+        print(f"seeding {scale} ({rows} rows per table) in {db_dir}", file=sys.stderr)
+        subprocess.run([sys.executable, "-m", "bench.seed", "--scale", scale, "--dir", db_dir],
+                       cwd=SERVICE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        seeds[scale] = seeding.load_manifest(db_dir)
+        for mode in args.modes:
+            print(f"{mode} @ {scale}", file=sys.stderr)
+            proc = subprocess.run(_child_args(args, mode, db_dir), cwd=SERVICE_DIR, env=env, check=True,
+                                  stdout=subprocess.PIPE, text=True)
+            for row in json.loads(proc.stdout):
+                results.append({"mode": mode, "scale": scale, "rows": rows, "concurrency": args.concurrency, **row})
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("child", "db_dir")},
+            "seeds": seeds,
+        },
+        "results": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline throughput/latency benchmark for the Python service.")
+    ap.add_argument("--scales", default="10k", help="Comma-separated rows per table: 10k, 1m, 10m or numbers")
+    ap.add_argument("--modes", default="inprocess,uvicorn", help="inprocess and/or uvicorn")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Subset of: {', '.join(SCENARIOS)}")
+    ap.add_argument("--requests", type=int, default=200, help="Timed requests per scenario")
+    ap.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    ap.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario before timing")
+    ap.add_argument("--symbols", type=int, default=20, help="Synthetic tickers requests rotate through")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--port", type=int, default=0, help="uvicorn port (default: a free one)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    ap.add_argument("--upstream-ms", type=float, default=0.0, help="Simulated upstream latency per fetch")
+    ap.add_argument("--warm", action="store_true", help="Keep the background warm-up scheduler running")
+    ap.add_argument("--bench-dir", default=os.environ.get("BENCH_DIR", "/tmp/finscope-bench"),
+                    help="Where seeded databases are kept (one directory per scale)")
+    ap.add_argument("--out", default=None, help="Output JSON (default: bench/results/<timestamp>.json)")
+    ap.add_argument("--child", choices=("inprocess", "uvicorn"), help=argparse.SUPPRESS)
+    ap.add_argument("--db-dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    args.scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS] + [m for m in args.modes if m not in ("inprocess", "uvicorn")]
+    if unknown:
+        ap.error(f"unknown scenario/mode: {', '.join(unknown)}")
+
+    if args.child == "inprocess":
+        print(json.dumps(asyncio.run(_inprocess(args))))
+        return
+    if args.child == "uvicorn":
+        print(json.dumps(asyncio.run(_over_http(args, dict(os.environ)))))
+        return
+
+    report = run(args)
+    out = args.out or os.path.join(HERE, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Build a benchmark database: synthetic transactions and time series at a given scale.
+
+Run from ``backend/python``::
+
+    python -m bench.seed --scale 1m --dir /tmp/finscope-bench/1m
+
+``--scale`` is the row count of each table (``10k``, ``1m``, ``10m`` or a
+number). A database already seeded at that scale is reused unless ``--force``.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+TS_METRICS = 10
+TS_STEP_SECONDS = 60
+# Rows per write transaction, so a 10M-row seed never holds a whole table in memory
+SEED_BATCH = 100_000
+
+MANIFEST = "seeded.json"
+
+
+def parse_scale(scale: str) -> int:
+    return SCALES.get(scale.lower()) or int(float(scale))
+
+
+def load_manifest(directory: str) -> Dict[str, Any]:
+    """The manifest written by ``seed`` (row counts and the time series span), or ``{}``."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def seed(rows: int, directory: str, force: bool = False) -> Dict[str, Any]:
+    """Seed ``directory``/finscope.db with ``rows`` transactions and ``rows`` time series points."""
+    manifest = load_manifest(directory)
+    if manifest.get("rows") == rows and not force:
+        return manifest
+    os.makedirs(directory, exist_ok=True)
+    for name in ("finscope.db", "finscope.db-wal", "finscope.db-shm", MANIFEST):
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    # db reads DB_DIR at import time
+    os.environ["DB_DIR"] = directory
+    import itertools
+    import db
+    from bench import synthetic
+
+    t0 = time.perf_counter()
+    db.init_db()
+    txns = synthetic.transactions(rows)
+    while True:
+        batch = list(itertools.islice(txns, SEED_BATCH))
+        if not batch:
+            break
+        db.upsert_transactions(batch)
+    t_txn = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    end = int(time.time()) // TS_STEP_SECONDS * TS_STEP_SECONDS
+    points = synthetic.timeseries(rows, metrics=TS_METRICS, step_seconds=TS_STEP_SECONDS, end=end)
+    while db.insert_timeseries(itertools.islice(points, SEED_BATCH)):
+        pass
+    t_ts = time.perf_counter() - t1
+    with db.get_conn() as c:
+        c.execute("ANALYZE")
+        c.commit()
+    db.close_all()
+
+    per_metric = max(1, rows // TS_METRICS)
+    manifest = {
+        "rows": rows,
+        "transactions": rows,
+        "timeseries": rows,
+        "ts_metrics": [f"bench.m{k}" for k in range(TS_METRICS)],
+        "ts_start": end - per_metric * TS_STEP_SECONDS,
+        "ts_end": end,
+        "ts_step_seconds": TS_STEP_SECONDS,
+        "seed_seconds": {"transactions": round(t_txn, 2), "timeseries": round(t_ts, 2)},
+        "db_bytes": os.path.getsize(os.path.join(directory, "finscope.db")),
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--scale", default="10k", help="Rows per table: 10k, 1m, 10m or a number")
+    ap.add_argument("--dir", required=True, help="Directory for finscope.db")
+    ap.add_argument("--force", action="store_true", help="Re-seed even if the manifest matches")
+    args = ap.parse_args()
+    print(json.dumps(seed(parse_scale(args.scale), args.dir, args.force), indent=2))
+
+
+if __name__ == "__main__":
+    main()
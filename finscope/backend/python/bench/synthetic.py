@@ -0,0 +1,127 @@
+"""Deterministic, offline stand-ins for the upstream price feed and the user data.
+
+``source`` has the ``market_data.PriceSource`` signature, so the service runs
+with ``MARKET_DATA_SOURCE=bench.synthetic:source``. Prices are a seeded random
+walk per (symbol, interval) anchored at a fixed origin: overlapping requests
+return the same bars, and runs on different days agree on shared dates.
+``BENCH_UPSTREAM_MS`` adds a fixed delay per call to mimic network latency.
+"""
+import functools
+import os
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BENCH_UPSTREAM_MS = float(os.environ.get("BENCH_UPSTREAM_MS", "0"))
+
+ORIGIN = pd.Timestamp("2010-01-04")
+# Intraday walks start this many days before today (yfinance serves ~60 days of intraday bars)
+INTRADAY_DAYS = 60
+
+CATEGORIES = ["Food and Drink", "Travel", "Shops", "Transfer", "Payment", "Recreation", "Service", "Healthcare"]
+MERCHANTS = [f"Merchant {i:03d}" for i in range(200)]
+
+
+def _seed(*parts: Any) -> int:
+    return zlib.crc32("|".join(map(str, parts)).encode())
+
+
+def _frame(idx: pd.DatetimeIndex, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = len(idx)
+    start = 20 + seed % 480
+    vol = 0.005 + (seed % 30) / 1000.0
+    close = start * np.exp(np.cumsum(rng.normal(0.0002, vol, n)))
+    open_ = close * np.exp(rng.normal(0, vol / 4, n))
+    spread = np.abs(rng.normal(0, vol / 2, n)) * close
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) + spread,
+        "Low": np.minimum(open_, close) - spread,
+        "Close": close,
+        "Adj Close": close,
+        "Volume": rng.integers(100_000, 5_000_000, n).astype(float),
+    }, index=idx)
+
+
+@functools.lru_cache(maxsize=1024)
+def _daily(symbol: str, today: date) -> pd.DataFrame:
+    idx = pd.bdate_range(ORIGIN, pd.Timestamp(today) + timedelta(days=1), tz="UTC")
+    return _frame(idx, _seed(symbol, "1d"))
+
+
+@functools.lru_cache(maxsize=256)
+def _intraday(symbol: str, interval: str, today: date) -> pd.DataFrame:
+    freq = interval.replace("m", "min") if interval.endswith("m") else interval
+    first = pd.Timestamp(today) - timedelta(days=INTRADAY_DAYS)
+    idx = pd.date_range(first, pd.Timestamp(today) + timedelta(days=1), freq=freq, tz="UTC", inclusive="left")
+    # Anchored per day so the walk is stable while the window slides
+    return _frame(idx, _seed(symbol, interval, first.date()))
+
+
+def _utc(ts) -> pd.Timestamp:
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def source(symbol: str, start: datetime, end: Optional[datetime], interval: str) -> pd.DataFrame:
+    """Bars for ``symbol`` in ``[start, end)``, shaped like ``yfinance.Ticker.history``."""
+    if BENCH_UPSTREAM_MS > 0:
+        time.sleep(BENCH_UPSTREAM_MS / 1000.0)
+    today = date.today()
+    intraday = (interval.endswith("m") and not interval.endswith("mo")) or interval.endswith("h")
+    bars = _intraday(symbol, interval, today) if intraday else _daily(symbol, today)
+    lo = _utc(start)
+    hi = _utc(end) if end is not None else _utc(datetime.utcnow()) + timedelta(days=1)
+    return bars[(bars.index >= lo) & (bars.index < hi)]
+
+
+def symbols(n: int) -> List[str]:
+    """``n`` synthetic tickers (``SYN000`` ...)."""
+    return [f"SYN{i:03d}" for i in range(n)]
+
+
+def transactions(n: int, days: int = 730, seed: int = 7) -> Iterator[Tuple]:
+    """``n`` transaction rows in ``db.normalize_transaction`` tuple form, spread over the last ``days`` days."""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    batch = 100_000
+    for lo in range(0, n, batch):
+        m = min(batch, n - lo)
+        offsets = rng.integers(0, days, m)
+        amounts = np.round(rng.lognormal(3.0, 1.0, m), 2)
+        # About one in eight rows is income (negative amount in Plaid's convention)
+        amounts[rng.random(m) < 0.125] *= -8
+        cats = rng.integers(0, len(CATEGORIES), m)
+        merch = rng.integers(0, len(MERCHANTS), m)
+        for i in range(m):
+            yield (
+                f"bench-{lo + i}", (today - timedelta(days=int(offsets[i]))).isoformat(), float(amounts[i]), "USD",
+                MERCHANTS[merch[i]], CATEGORIES[cats[i]], "bench-account", None,
+            )
+
+
+def timeseries(n: int, metrics: int = 10, step_seconds: int = 60, end: Optional[int] = None,
+               seed: int = 11) -> Iterator[Dict[str, Any]]:
+    """``n`` points split across ``metrics`` metrics (``bench.m0`` ...), one every ``step_seconds``, ending at ``end`` (epoch, default now)."""
+    rng = np.random.default_rng(seed)
+    per_metric = max(1, n // metrics)
+    if end is None:
+        end = int(time.time()) // step_seconds * step_seconds
+    start = end - per_metric * step_seconds
+    for k in range(metrics):
+        count = per_metric if k < metrics - 1 else n - per_metric * (metrics - 1)
+        values = 100 + np.cumsum(rng.normal(0, 1, count))
+        for i in range(count):
+            yield {
+                "source": "bench",
+                "metric": f"bench.m{k}",
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start + i * step_seconds)),
+                "value": float(values[i]),
+                "ingest_ts": None,
+                "meta": None,
+            }
@@ -1,32 +1,184 @@
+import itertools
+import logging
+import math
 import os
 import sqlite3
+import threading
 from contextlib import contextmanager
-from typing import Iterable, Dict, Any, List, Optional
+from datetime import date, datetime, timezone
+from typing import Iterable, Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
 
 DB_DIR = os.environ.get("DB_DIR", "/app/data")
 DB_PATH = os.path.join(DB_DIR, "finscope.db")
+# Rows per executemany statement in bulk transaction upserts
+TXN_UPSERT_CHUNK = int(os.environ.get("TXN_UPSERT_CHUNK", "500"))
+# Rows per executemany statement (and per streamed ingest batch) for timeseries writes
+TS_INGEST_CHUNK = int(os.environ.get("TS_INGEST_CHUNK", "5000"))
+
+# Connection tuning (applied to every pooled connection)
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "16384"))
+SQLITE_MMAP_BYTES = int(os.environ.get("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
 os.makedirs(DB_DIR, exist_ok=True)
 
+_local = threading.local()
+_all_conns: List[sqlite3.Connection] = []
+_all_conns_lock = threading.Lock()
+_generation = 0
+
+
+def _connect(readonly: bool, pooled: bool = True) -> sqlite3.Connection:
+    # Each connection is only ever used by the thread that opened it; check_same_thread
+    # is off so close_all() can close them from the shutdown thread.
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    if not readonly:
+        # Lets retention maintenance return freed pages to the OS; only takes effect before the
+        # file's first table exists (convert older files with ``python db.py vacuum``)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL is persistent in the file: readers no longer block on writers and vice versa
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    if pooled:
+        with _all_conns_lock:
+            _all_conns.append(conn)
+    return conn
+
+
+def _thread_conn(readonly: bool) -> sqlite3.Connection:
+    key = (os.getpid(), _generation, DB_PATH, readonly)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = _connect(readonly)
+    return conn
+
+
 @contextmanager
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+def get_conn(readonly: bool = False):
+    """Yield this thread's pooled connection (read-write, or query-only when ``readonly``).
+
+    Connections are reused across calls. Work that the caller does not commit is
+    rolled back on exit, as it was when every call closed its own connection.
+    """
+    conn = _thread_conn(readonly)
     try:
         yield conn
     finally:
-        conn.close()
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def open_writer() -> sqlite3.Connection:
+    """A dedicated, unpooled read-write connection in autocommit mode (transactions are explicit).
+
+    Used by the ``writer`` thread, which owns it; the caller must close it.
+    """
+    conn = _connect(readonly=False, pooled=False)
+    conn.isolation_level = None
+    return conn
+
+
+def open_reader() -> sqlite3.Connection:
+    """A dedicated, unpooled read-only connection for long-lived streaming reads.
+
+    It may be used from any thread (one at a time); the caller must close it.
+    """
+    return _connect(readonly=True, pooled=False)
+
+
+def open_lock() -> int:
+    """File descriptor of ``finscope.db.lock``, the cross-process lock writers take around each transaction."""
+    return os.open(DB_PATH + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def hold_lock(fd: int):
+    """Hold an exclusive ``flock`` on ``fd`` (see ``open_lock``) for the block; a no-op without fcntl."""
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def close_all():
+    """Close every pooled connection (call on shutdown); later calls open fresh ones."""
+    global _generation
+    with _all_conns_lock:
+        _generation += 1
+        conns = list(_all_conns)
+        _all_conns.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
 
 SCHEMA = """
-CREATE TABLE IF NOT EXISTS timeseries (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  source TEXT,
-  metric TEXT,
-  ts TEXT,
+-- Timeseries: a series is one (metric, source), interned to an integer id; times are Unix seconds.
+-- Points before raw_from have been rolled into hourly buckets, hourly buckets before hourly_from into
+-- daily ones (see retention.py); queries read each range from the tier that holds it.
+CREATE TABLE IF NOT EXISTS ts_series (
+  id INTEGER PRIMARY KEY,
+  metric TEXT NOT NULL,
+  source TEXT NOT NULL DEFAULT '',
+  raw_from INTEGER NOT NULL DEFAULT -4611686018427387904,
+  hourly_from INTEGER NOT NULL DEFAULT -4611686018427387904,
+  UNIQUE (metric, source)
+);
+
+CREATE TABLE IF NOT EXISTS ts_points (
+  series_id INTEGER NOT NULL,
+  t INTEGER NOT NULL,
   value REAL,
-  ingest_ts TEXT,
-  meta TEXT
+  ingested INTEGER,
+  meta TEXT,
+  PRIMARY KEY (series_id, t)
+) WITHOUT ROWID;
+
+-- Hourly (tier 3600) and daily (tier 86400) buckets; first/last keep the time of the point they came from
+CREATE TABLE IF NOT EXISTS ts_rollups (
+  series_id INTEGER NOT NULL,
+  tier INTEGER NOT NULL,
+  t INTEGER NOT NULL,
+  n INTEGER NOT NULL,
+  sum REAL,
+  min REAL,
+  max REAL,
+  first REAL,
+  first_t INTEGER NOT NULL,
+  last REAL,
+  last_t INTEGER NOT NULL,
+  PRIMARY KEY (series_id, tier, t)
+) WITHOUT ROWID;
+
+-- Per-metric retention overrides in days (NULL: the TS_*_RETENTION_DAYS default, 0: keep forever)
+CREATE TABLE IF NOT EXISTS ts_retention (
+  metric TEXT PRIMARY KEY,
+  raw_days REAL,
+  hourly_days REAL,
+  daily_days REAL
 );
-CREATE INDEX IF NOT EXISTS idx_timeseries_metric_ts ON timeseries(metric, ts);
 
 CREATE TABLE IF NOT EXISTS transactions (
   id TEXT PRIMARY KEY,
@@ -38,47 +190,372 @@ CREATE TABLE IF NOT EXISTS transactions (
   account_id TEXT,
   raw JSON
 );
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+
+-- Daily spend/income rollups maintained by upsert_transaction (see rebuild_spend_rollups)
+CREATE TABLE IF NOT EXISTS spend_daily_category (
+  day TEXT NOT NULL,
+  category TEXT NOT NULL,
+  spend REAL NOT NULL DEFAULT 0,
+  spend_count INTEGER NOT NULL DEFAULT 0,
+  income REAL NOT NULL DEFAULT 0,
+  income_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS spend_daily_merchant (
+  day TEXT NOT NULL,
+  merchant TEXT NOT NULL,
+  spend REAL NOT NULL DEFAULT 0,
+  spend_count INTEGER NOT NULL DEFAULT 0,
+  income REAL NOT NULL DEFAULT 0,
+  income_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, merchant)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ohlcv_bars (
+  symbol TEXT NOT NULL,
+  interval TEXT NOT NULL,
+  ts TEXT NOT NULL,
+  open REAL,
+  high REAL,
+  low REAL,
+  close REAL,
+  adj_close REAL,
+  volume REAL,
+  PRIMARY KEY (symbol, interval, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ohlcv_sync (
+  symbol TEXT NOT NULL,
+  interval TEXT NOT NULL,
+  covered_from TEXT,
+  last_ts TEXT,
+  fetched_at REAL,
+  PRIMARY KEY (symbol, interval)
+);
 """
 
 def init_db():
-    with get_conn() as c:
-        c.executescript(SCHEMA)
-        c.commit()
+    # Under the writers' lock so concurrent workers do not race the timeseries migration
+    fd = open_lock()
+    try:
+        with hold_lock(fd), get_conn() as c:
+            c.executescript(SCHEMA)
+            _migrate_timeseries(c)
+            c.commit()
+    finally:
+        os.close(fd)
+
+
+def _migrate_timeseries(c):
+    """Move points from the old ``timeseries`` table (text names and ISO times per row) into ``ts_series``/``ts_points``.
+
+    Newest row wins per (series, second). Rows whose ``ts`` SQLite cannot parse
+    are left in ``timeseries_unparsed``.
+    """
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='timeseries'").fetchone():
+        return
+    c.execute(
+        "INSERT INTO ts_series(metric, source) SELECT DISTINCT metric, COALESCE(source, '') FROM timeseries "
+        "WHERE metric IS NOT NULL ON CONFLICT(metric, source) DO NOTHING"
+    )
+    moved = c.execute(
+        "INSERT INTO ts_points(series_id, t, value, ingested, meta) "
+        "SELECT s.id, CAST(strftime('%s', o.ts) AS INTEGER) AS e, o.value, CAST(strftime('%s', o.ingest_ts) AS INTEGER), o.meta "
+        "FROM timeseries o JOIN ts_series s ON s.metric = o.metric AND s.source = COALESCE(o.source, '') "
+        "WHERE e IS NOT NULL ORDER BY o.id "
+        "ON CONFLICT(series_id, t) DO UPDATE SET value=excluded.value, ingested=excluded.ingested, meta=excluded.meta"
+    ).rowcount
+    c.execute("DELETE FROM timeseries WHERE metric IS NOT NULL AND strftime('%s', ts) IS NOT NULL")
+    left = c.execute("SELECT COUNT(*) FROM timeseries").fetchone()[0]
+    if left:
+        c.execute("ALTER TABLE timeseries RENAME TO timeseries_unparsed")
+        log.warning("timeseries migration: %d rows without a metric or a parseable timestamp kept in timeseries_unparsed", left)
+    else:
+        c.execute("DROP TABLE timeseries")
+    log.info("timeseries migration: moved %d points", moved)
+
+
+def parse_epoch(value: Any) -> int:
+    """A timestamp -> Unix seconds (floored): ISO-8601 text (naive means UTC), a datetime/date, or a number."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value):
+            raise ValueError(f"Invalid timestamp '{value}'")
+        return math.floor(value)
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, date):
+        dt = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError(f"Invalid timestamp '{value}'. Use ISO-8601, e.g. 2024-01-31T12:00:00Z") from None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return math.floor(dt.timestamp())
+
+
+def series_id(c: sqlite3.Connection, metric: str, source: str = "") -> int:
+    """The id of (metric, source), creating the series on first use."""
+    row = c.execute("SELECT id FROM ts_series WHERE metric=? AND source=?", (metric, source)).fetchone()
+    if row is not None:
+        return row[0]
+    return c.execute("INSERT INTO ts_series(metric, source) VALUES(?,?)", (metric, source)).lastrowid
+
+
+_TS_UPSERT = (
+    "INSERT INTO ts_points(series_id, t, value, ingested, meta) VALUES(?,?,?,?,?) "
+    "ON CONFLICT(series_id, t) DO UPDATE SET value=excluded.value, ingested=excluded.ingested, meta=excluded.meta"
+)
 
 
-def insert_timeseries(rows: Iterable[Dict[str, Any]]):
-    sql = "INSERT INTO timeseries(source, metric, ts, value, ingest_ts, meta) VALUES(?,?,?,?,?,?)"
+def _ts_row(r: Dict[str, Any], ids: Dict[Tuple[str, str], int], c: sqlite3.Connection) -> Tuple:
+    meta = r.get("meta")
+    key = (r.get("metric"), r.get("source") or "")
+    if not key[0]:
+        raise ValueError("metric is required")
+    sid = ids.get(key)
+    if sid is None:
+        sid = ids[key] = series_id(c, *key)
+    return (
+        sid,
+        parse_epoch(r.get("timestamp")),
+        float(r.get("value")) if r.get("value") is not None else None,
+        parse_epoch(r["ingest_ts"]) if r.get("ingest_ts") is not None else None,
+        (meta if isinstance(meta, str) else json_dumps_safe(meta)) if meta is not None else None,
+    )
+
+
+def write_timeseries(c: sqlite3.Connection, rows: Iterable[Dict[str, Any]], chunk_size: Optional[int] = None) -> int:
+    """Upsert points keyed by (metric, source, timestamp); re-sent points overwrite instead of duplicating.
+
+    Timestamps are stored as whole Unix seconds (see ``parse_epoch``).
+    ``rows`` may be any iterable (e.g. a generator); it is consumed in chunks of
+    ``chunk_size`` (default ``TS_INGEST_CHUNK``). ``meta`` is stored as JSON.
+    Runs in the caller's transaction (a ``writer`` job); returns the number of rows written.
+    """
+    chunk_size = max(1, chunk_size or TS_INGEST_CHUNK)
+    n = 0
+    it = iter(rows)
+    ids: Dict[Tuple[str, str], int] = {}
+    while True:
+        chunk = [_ts_row(r, ids, c) for r in itertools.islice(it, chunk_size)]
+        if not chunk:
+            break
+        c.executemany(_TS_UPSERT, chunk)
+        n += len(chunk)
+    return n
+
+
+def insert_timeseries(rows: Iterable[Dict[str, Any]], chunk_size: Optional[int] = None) -> int:
+    """``write_timeseries`` in its own transaction on this thread's connection (offline tools; the API uses ``writer``)."""
     with get_conn() as c:
-        c.executemany(sql, [
-            (
-                r.get("source"),
-                r.get("metric"),
-                r.get("timestamp"),
-                float(r.get("value")) if r.get("value") is not None else None,
-                r.get("ingest_ts"),
-                str(r.get("meta")) if r.get("meta") is not None else None,
-            ) for r in rows
-        ])
-        c.commit()
+        try:
+            n = write_timeseries(c, rows, chunk_size)
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+    return n
+
+
+# A metric's stored rows, whatever their tier, as (t, n, total, lo, hi, first, last, v): a raw point is
+# a bucket of one; v is the point's value or the bucket's mean. Series of a metric read raw points from
+# raw_from on, hourly buckets in [hourly_from, raw_from) and daily buckets before hourly_from.
+_TS_RAW = (
+    "SELECT t, value IS NOT NULL AS n, value AS total, value AS lo, value AS hi, value AS first, value AS last, "
+    "value AS v FROM ts_points WHERE series_id = ? AND t >= ? AND t < ?"
+)
+_TS_ROLLUP = (
+    "SELECT t, n, sum AS total, min AS lo, max AS hi, first, last, sum / n AS v "
+    "FROM ts_rollups WHERE series_id = ? AND tier = ? AND t >= ? AND t < ?"
+)
+_TS_MIN, _TS_MAX = -(1 << 62), 1 << 62
+
+# ISO-8601 label of ``t``
+_TS_LABEL = "strftime('%Y-%m-%dT%H:%M:%SZ', t, 'unixepoch')"
+
+
+def _ts_source(c: sqlite3.Connection, metric: str, start: Optional[Any], end: Optional[Any]) -> Tuple[str, List[Any]]:
+    """A subquery over ``metric``'s rows in [start, end] (any ``parse_epoch`` input), and its parameters.
+
+    Only the tiers the window reaches are read, so a window of recent data is a
+    single primary-key range scan. Call with ``c`` in a transaction (one snapshot
+    for the boundaries and the rows; see ``_ts_read``).
+    """
+    lo = parse_epoch(start) if start not in (None, "") else _TS_MIN
+    hi = parse_epoch(end) + 1 if end not in (None, "") else _TS_MAX
+    parts: List[str] = []
+    params: List[Any] = []
+    for sid, raw_from, hourly_from in c.execute("SELECT id, raw_from, hourly_from FROM ts_series WHERE metric=?", (metric,)):
+        for sql, args, a, b in (
+            (_TS_RAW, (sid,), raw_from, _TS_MAX),
+            (_TS_ROLLUP, (sid, 3600), hourly_from, raw_from),
+            (_TS_ROLLUP, (sid, 86400), _TS_MIN, hourly_from),
+        ):
+            a, b = max(a, lo), min(b, hi)
+            if a < b:
+                parts.append(sql)
+                params.extend((*args, a, b))
+    if not parts:
+        return f"({_TS_RAW})", [0, 1, 0]
+    return "(" + " UNION ALL ".join(parts) + ")", params
+
+
+@contextmanager
+def _ts_read(c: Optional[sqlite3.Connection] = None):
+    """A connection (this thread's query-only one unless ``c`` is given) inside a read transaction."""
+    if c is not None:
+        if not c.in_transaction:
+            c.execute("BEGIN")
+        yield c
+        return
+    with get_conn(readonly=True) as c:
+        c.execute("BEGIN")
+        yield c
+
+
+def query_timeseries_rows(metric: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, float]]:
+    """``(timestamp, value)`` rows in time order (rolled-up ranges give one bucket-mean row per bucket)."""
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        return c.execute(f"SELECT {_TS_LABEL}, v FROM {src} ORDER BY t", params).fetchall()
 
 
 def query_timeseries(metric: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
-    q = "SELECT ts, value FROM timeseries WHERE metric=?"
-    params: List[Any] = [metric]
-    if start:
-        q += " AND ts>=?"; params.append(start)
-    if end:
-        q += " AND ts<=?"; params.append(end)
-    q += " ORDER BY ts ASC"
-    with get_conn() as c:
-        cur = c.execute(q, params)
-        rows = cur.fetchall()
-        return [{"timestamp": r[0], "value": r[1]} for r in rows]
+    return [{"timestamp": ts, "value": value} for ts, value in query_timeseries_rows(metric, start, end)]
 
 
-def upsert_transaction(txn: Dict[str, Any]):
+# Aggregates over _ts_source rows, so buckets built from rollups give the same answer as from raw points
+TS_SQL_AGGS = {
+    "avg": "SUM(total) / SUM(n)",
+    "min": "MIN(lo)",
+    "max": "MAX(hi)",
+    "sum": "SUM(total)",
+    "count": "SUM(n)",
+}
+
+
+def query_timeseries_points(metric: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[int, float]]:
+    """``(epoch_seconds, value)`` rows in time order."""
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        return c.execute(f"SELECT t, v FROM {src} ORDER BY t", params).fetchall()
+
+
+def query_timeseries_stats(metric: str, start: Optional[str] = None,
+                           end: Optional[str] = None) -> List[Tuple[int, float, float, float, float]]:
+    """``(epoch_seconds, first, low, high, last)`` per stored row in time order (all equal for raw points)."""
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        return c.execute(f"SELECT t, first, lo, hi, last FROM {src} ORDER BY t", params).fetchall()
+
+
+def query_timeseries_buckets(metric: str, bucket_secs: int, agg: str,
+                             start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[int, float]]:
+    """``(bucket_start_epoch, aggregate)`` rows, aggregated in SQL with one of ``TS_SQL_AGGS``."""
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        q = f"SELECT (t / ?) * ? AS b, {TS_SQL_AGGS[agg]} FROM {src} GROUP BY b ORDER BY b ASC"
+        return c.execute(q, [bucket_secs, bucket_secs] + params).fetchall()
+
+
+def query_timeseries_extrema(metric: str, bucket_secs: int,
+                             start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[int, float]]:
+    """The min and the max point (``(epoch, value)``) of every ``bucket_secs`` bucket, unordered.
+
+    Relies on SQLite returning the bare columns of the row that produced MIN()/MAX().
+    """
+    rows: List[Tuple[int, float]] = []
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        for fn, col in (("MIN", "lo"), ("MAX", "hi")):
+            q = f"SELECT t, {fn}({col}) FROM {src} GROUP BY t / ?"
+            rows.extend(c.execute(q, params + [bucket_secs]).fetchall())
+    return rows
+
+
+def iter_metric_points(conn: sqlite3.Connection, metric: str, start: Optional[str] = None, end: Optional[str] = None,
+                       bucket_secs: Optional[int] = None, agg: str = "avg") -> Iterable[Tuple[Any, float]]:
+    """Lazily yield ``(epoch, value)`` in time order, or ``(bucket_epoch, aggregate)`` when ``bucket_secs`` is set.
+
+    Leaves ``conn`` in a read transaction, so every metric read on it sees the same snapshot.
+    """
+    with _ts_read(conn) as c:
+        src, params = _ts_source(c, metric, start, end)
+    if bucket_secs:
+        q = f"SELECT (t / ?) * ? AS b, {TS_SQL_AGGS[agg]} FROM {src} GROUP BY b ORDER BY b ASC"
+        params = [bucket_secs, bucket_secs] + params
+    else:
+        q = f"SELECT t, v FROM {src} ORDER BY t"
+    yield from conn.execute(q, params)
+
+
+def timeseries_span(metric: str, start: Optional[str] = None, end: Optional[str] = None) -> Tuple[Optional[int], Optional[int], int]:
+    """``(first_epoch, last_epoch, count)`` for the matching rows."""
+    with _ts_read() as c:
+        src, params = _ts_source(c, metric, start, end)
+        return tuple(c.execute(f"SELECT MIN(t), MAX(t), COUNT(*) FROM {src}", params).fetchone())
+
+
+def storage_stats() -> Dict[str, Any]:
+    """File size, free pages and auto-vacuum mode of ``finscope.db``."""
+    with get_conn(readonly=True) as c:
+        page_size, pages, free, mode = (c.execute(f"PRAGMA {p}").fetchone()[0]
+                                        for p in ("page_size", "page_count", "freelist_count", "auto_vacuum"))
+    return {"bytes": page_size * pages, "free_bytes": page_size * free,
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode, mode)}
+
+
+def incremental_vacuum(pages: int) -> int:
+    """Give up to ``pages`` free pages back to the filesystem; returns how many (0 unless auto_vacuum is incremental)."""
+    conn = _connect(readonly=False, pooled=False)
+    fd = open_lock()
+    try:
+        with hold_lock(fd):
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion (execute() frees a single page)
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        os.close(fd)
+        conn.close()
+
+
+def vacuum():
+    """Rebuild the file with incremental auto-vacuum (older files were created without it); takes the writers' lock."""
+    conn = _connect(readonly=False, pooled=False)
+    fd = open_lock()
+    try:
+        with hold_lock(fd):
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        os.close(fd)
+        conn.close()
+
+
+_TXN_UPSERT = (
+    "INSERT INTO transactions(id, date, amount, currency, name, category, account_id, raw) "
+    "VALUES(?,?,?,?,?,?,?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET date=excluded.date, amount=excluded.amount, currency=excluded.currency, "
+    "name=excluded.name, category=excluded.category, account_id=excluded.account_id, raw=excluded.raw"
+)
+
+
+def normalize_transaction(txn: Dict[str, Any]) -> Tuple:
+    """Map a Plaid or generic transaction payload to a ``transactions`` row tuple.
+
+    Raises ValueError/TypeError when the payload has no id or no numeric amount.
+    """
     # Accept Plaid transaction payloads and generic ones
     txn_id = txn.get("id") or txn.get("transaction_id") or txn.get("transactionId")
+    if not txn_id:
+        raise ValueError("transaction has no id")
     currency = txn.get("currency") or txn.get("iso_currency_code") or txn.get("unofficial_currency_code")
     category_val = txn.get("category")
     if isinstance(category_val, list):
@@ -87,21 +564,185 @@ def upsert_transaction(txn: Dict[str, Any]):
         category_str = None
     else:
         category_str = str(category_val)
-
-    sql = (
-        "INSERT INTO transactions(id, date, amount, currency, name, category, account_id, raw) "
-        "VALUES(?,?,?,?,?,?,?, ?) "
-        "ON CONFLICT(id) DO UPDATE SET date=excluded.date, amount=excluded.amount, currency=excluded.currency, "
-        "name=excluded.name, category=excluded.category, account_id=excluded.account_id, raw=excluded.raw"
+    return (
+        str(txn_id), txn.get("date"), float(txn.get("amount")), currency, txn.get("name"),
+        category_str,
+        txn.get("account_id"),
+        json_dumps_safe(txn)
     )
+
+
+def upsert_transaction(txn: Dict[str, Any]):
+    upsert_transactions([normalize_transaction(txn)])
+
+
+def normalize_transactions(txns: Iterable[Any]) -> Tuple[List[Tuple], int]:
+    """``(rows, failed)``: payloads (or rows from ``normalize_transaction``) as row tuples; bad payloads are counted."""
+    rows: List[Tuple] = []
+    failed = 0
+    for t in txns:
+        try:
+            rows.append(t if isinstance(t, tuple) else normalize_transaction(t))
+        except Exception:
+            failed += 1
+    return rows, failed
+
+
+def write_transactions(c: sqlite3.Connection, rows: List[Tuple], chunk_size: Optional[int] = None) -> Dict[str, int]:
+    """Upsert normalized transaction rows and adjust the daily rollups, in the caller's transaction.
+
+    Rows are written with ``executemany`` in chunks of ``chunk_size`` (default
+    ``TXN_UPSERT_CHUNK``) and the rollups are adjusted once per chunk.
+    """
+    chunk_size = max(1, chunk_size or TXN_UPSERT_CHUNK)
+    inserted = updated = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        ids = list({r[0] for r in chunk})
+        current = {
+            r[0]: r[1:] for r in c.execute(
+                f"SELECT id, date, amount, name, category FROM transactions WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+        }
+        deltas: Dict[Tuple[str, str, str], List[float]] = {}
+        for r in chunk:
+            old = current.get(r[0])
+            if old is None:
+                inserted += 1
+            else:
+                updated += 1
+                _add_rollup(deltas, *old, sign=-1)
+            new = (r[1], r[2], r[4], r[5])
+            _add_rollup(deltas, *new)
+            current[r[0]] = new
+        c.executemany(_TXN_UPSERT, chunk)
+        _write_rollups(c, deltas)
+    return {"inserted": inserted, "updated": updated}
+
+
+def upsert_transactions(txns: Iterable[Any], chunk_size: Optional[int] = None) -> Dict[str, int]:
+    """Upsert a batch of transactions in a single SQLite transaction on this thread's connection.
+
+    ``txns`` may hold raw payloads (dicts) or rows from ``normalize_transaction``.
+    Payloads that cannot be normalized are skipped and counted as ``failed``.
+    Offline tools use this; the API goes through ``writer`` with ``write_transactions``.
+    """
+    rows, failed = normalize_transactions(txns)
     with get_conn() as c:
-        c.execute(sql, (
-            txn_id, txn.get("date"), float(txn.get("amount")), currency, txn.get("name"),
-            category_str,
-            txn.get("account_id"),
-            json_dumps_safe(txn)
-        ))
+        try:
+            counts = write_transactions(c, rows, chunk_size)
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+    return {**counts, "failed": failed}
+
+
+def rollup_category(category: Optional[str]) -> str:
+    """Bucket used for category rollups: first element of a comma-joined Plaid category list."""
+    cat = str(category).split(',')[0].strip() if category else None
+    return cat or 'Uncategorized'
+
+
+def rollup_merchant(name: Optional[str]) -> str:
+    return name or 'Unknown'
+
+
+_ROLLUP_TABLES = (("spend_daily_category", "category"), ("spend_daily_merchant", "merchant"))
+
+_ROLLUP_UPSERT = (
+    "INSERT INTO {table}(day, {key}, spend, spend_count, income, income_count) VALUES(?,?,?,?,?,?) "
+    "ON CONFLICT(day, {key}) DO UPDATE SET spend=spend+excluded.spend, spend_count=spend_count+excluded.spend_count, "
+    "income=income+excluded.income, income_count=income_count+excluded.income_count"
+)
+
+
+def _add_rollup(deltas: Dict[Tuple[str, str, str], List[float]], date: Optional[str], amount: Optional[float],
+                name: Optional[str], category: Optional[str], sign: int = 1):
+    """Accumulate one transaction's contribution (sign=1) or its removal (sign=-1) into ``deltas``.
+
+    Positive amounts count as spend and negative ones as income, matching /bank/summary.
+    """
+    amt = float(amount or 0)
+    if not date or amt == 0:
+        return
+    day = str(date)[:10]
+    spend, spend_count = (amt, 1) if amt > 0 else (0.0, 0)
+    income, income_count = (-amt, 1) if amt < 0 else (0.0, 0)
+    for (table, _), bucket in zip(_ROLLUP_TABLES, (rollup_category(category), rollup_merchant(name))):
+        acc = deltas.setdefault((table, day, bucket), [0.0, 0, 0.0, 0])
+        acc[0] += sign * spend
+        acc[1] += sign * spend_count
+        acc[2] += sign * income
+        acc[3] += sign * income_count
+
+
+def _write_rollups(conn, deltas: Dict[Tuple[str, str, str], List[float]]):
+    for table, key in _ROLLUP_TABLES:
+        rows = [(day, bucket, *vals) for (t, day, bucket), vals in deltas.items() if t == table and any(vals)]
+        if not rows:
+            continue
+        conn.executemany(_ROLLUP_UPSERT.format(table=table, key=key), rows)
+        # Buckets whose last transaction moved away are dropped
+        conn.executemany(
+            f"DELETE FROM {table} WHERE day=? AND {key}=? AND spend_count<=0 AND income_count<=0",
+            [(r[0], r[1]) for r in rows if r[3] < 0 or r[5] < 0],
+        )
+
+
+def rebuild_spend_rollups() -> int:
+    """Recompute the daily rollups from the transactions table (for existing databases). Returns rows scanned."""
+    with get_conn() as c:
+        c.create_function("rollup_category", 1, rollup_category, deterministic=True)
+        c.create_function("rollup_merchant", 1, rollup_merchant, deterministic=True)
+        c.execute("DELETE FROM spend_daily_category")
+        c.execute("DELETE FROM spend_daily_merchant")
+        for table, key, expr in (
+            ("spend_daily_category", "category", "rollup_category(category)"),
+            ("spend_daily_merchant", "merchant", "rollup_merchant(name)"),
+        ):
+            c.execute(
+                f"INSERT INTO {table}(day, {key}, spend, spend_count, income, income_count) "
+                f"SELECT substr(date, 1, 10), {expr}, "
+                "SUM(CASE WHEN amount>0 THEN amount ELSE 0 END), SUM(amount>0), "
+                "SUM(CASE WHEN amount<0 THEN -amount ELSE 0 END), SUM(amount<0) "
+                "FROM transactions WHERE date IS NOT NULL AND date<>'' AND COALESCE(amount, 0)<>0 "
+                "GROUP BY 1, 2"
+            )
+        n = c.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
         c.commit()
+    return n
+
+
+def spending_summary(cutoff: str, mtd_start: str, top_n: int = 8) -> Dict[str, Any]:
+    """Aggregate the daily rollups from ``cutoff`` (inclusive ISO date).
+
+    Returns totals for the window and for days >= ``mtd_start``, plus the top
+    spend categories and merchants as ``(name, count, total)`` tuples.
+    """
+    with get_conn(readonly=True) as c:
+        total_spend, total_income, mtd_spend, mtd_income = c.execute(
+            "SELECT COALESCE(SUM(spend), 0), COALESCE(SUM(income), 0), "
+            "COALESCE(SUM(CASE WHEN day>=? THEN spend END), 0), COALESCE(SUM(CASE WHEN day>=? THEN income END), 0) "
+            "FROM spend_daily_category WHERE day>=?",
+            (mtd_start, mtd_start, cutoff),
+        ).fetchone()
+        top = {}
+        for table, key in (("spend_daily_category", "category"), ("spend_daily_merchant", "merchant")):
+            top[key] = c.execute(
+                f"SELECT {key}, SUM(spend_count), SUM(spend) AS total FROM {table} "
+                f"WHERE day>=? AND spend_count>0 GROUP BY {key} ORDER BY total DESC LIMIT ?",
+                (cutoff, top_n),
+            ).fetchall()
+    return {
+        "total_spend": total_spend,
+        "total_income": total_income,
+        "mtd_spend": mtd_spend,
+        "mtd_income": mtd_income,
+        "top_categories": top["category"],
+        "top_merchants": top["merchant"],
+    }
 
 
 def json_dumps_safe(obj: Any) -> str:
@@ -110,3 +751,16 @@ def json_dumps_safe(obj: Any) -> str:
         return json.dumps(obj)
     except Exception:
         return "{}"
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="FinScope SQLite maintenance")
+    parser.add_argument("command", choices=["init", "rebuild-rollups", "vacuum"])
+    args = parser.parse_args()
+    init_db()
+    if args.command == "rebuild-rollups":
+        print(f"Rebuilt spending rollups from {rebuild_spend_rollups()} transactions in {DB_PATH}")
+    elif args.command == "vacuum":
+        vacuum()
+        print(f"Vacuumed {DB_PATH}: {storage_stats()}")
@@ -0,0 +1,197 @@
+"""Server-side bucketing and decimation for timeseries queries.
+
+``timeseries_window`` picks the cheapest plan for a request: plain SQL
+aggregation for avg/min/max/sum/count buckets, vectorized NumPy reductions for
+first/last/OHLC buckets, and min/max-preserving LTTB decimation (MinMaxLTTB)
+when the caller caps the number of points. Output size follows the requested
+resolution rather than the number of stored rows.
+"""
+import re
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from db import (
+    TS_SQL_AGGS,
+    query_timeseries_buckets,
+    query_timeseries_extrema,
+    query_timeseries_points,
+    query_timeseries_stats,
+    timeseries_span,
+)
+import serialization
+
+AGGS = set(TS_SQL_AGGS) | {"first", "last", "ohlc"}
+
+_BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Candidate points kept per output point by the min/max pre-selection before LTTB
+MINMAX_RATIO = 4
+
+
+def parse_bucket(bucket: str) -> int:
+    """``"30s"``, ``"1m"``, ``"1h"``, ``"1d"``, ``"1w"`` -> seconds."""
+    m = re.fullmatch(r"\s*(\d+)\s*([smhdw])\s*", str(bucket or "").lower())
+    if not m or int(m.group(1)) <= 0:
+        raise ValueError(f"Invalid bucket '{bucket}'. Use e.g. 1m, 15m, 1h, 1d")
+    return int(m.group(1)) * _BUCKET_UNITS[m.group(2)]
+
+
+def epoch_labels(epochs: np.ndarray) -> np.ndarray:
+    """Unix seconds -> ISO-8601 UTC strings."""
+    return np.datetime_as_string(np.asarray(epochs, dtype="datetime64[s]"), unit="s", timezone="UTC")
+
+
+def bucket_reduce(epochs: np.ndarray, values: np.ndarray, bucket_secs: int, agg: str,
+                  low: Optional[np.ndarray] = None, high: Optional[np.ndarray] = None,
+                  last: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Aggregate time-ordered points into fixed buckets with ``np.ufunc.reduceat``.
+
+    When the inputs are themselves buckets (rollups), ``values`` holds their
+    first values and ``low``/``high``/``last`` the rest; first, last and ohlc
+    use them (they default to ``values``).
+    Returns ``{"buckets": start epochs, "values": ...}`` or, for ``ohlc``,
+    ``{"buckets", "open", "high", "low", "close"}``.
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    low, high, last = (values if a is None else np.asarray(a, dtype=np.float64) for a in (low, high, last))
+    if epochs.size == 0:
+        empty = np.empty(0)
+        return {"buckets": epochs, "values": empty} if agg != "ohlc" else {
+            "buckets": epochs, "open": empty, "high": empty, "low": empty, "close": empty}
+    if np.any(epochs[1:] < epochs[:-1]):
+        order = np.argsort(epochs, kind="stable")
+        epochs, values, low, high, last = epochs[order], values[order], low[order], high[order], last[order]
+    keys = (epochs // bucket_secs) * bucket_secs
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], keys.size] - 1
+    out: Dict[str, np.ndarray] = {"buckets": keys[starts]}
+    if agg == "ohlc":
+        out.update(
+            open=values[starts],
+            high=np.maximum.reduceat(high, starts),
+            low=np.minimum.reduceat(low, starts),
+            close=last[ends],
+        )
+    elif agg == "first":
+        out["values"] = values[starts]
+    elif agg == "last":
+        out["values"] = last[ends]
+    elif agg == "min":
+        out["values"] = np.minimum.reduceat(low, starts)
+    elif agg == "max":
+        out["values"] = np.maximum.reduceat(high, starts)
+    elif agg == "sum":
+        out["values"] = np.add.reduceat(values, starts)
+    elif agg == "count":
+        out["values"] = (ends - starts + 1).astype(np.float64)
+    elif agg == "avg":
+        out["values"] = np.add.reduceat(values, starts) / (ends - starts + 1)
+    else:
+        raise ValueError(f"Unsupported aggregation '{agg}'")
+    return out
+
+
+def minmax_indices(values: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Indices of the min and max of ``n_buckets`` equal-count slices, plus first/last (sorted, unique)."""
+    n = values.size
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+    width = -(-n // n_buckets)
+    padded = np.full(n_buckets * width, np.nan)
+    padded[:n] = values
+    grid = padded.reshape(n_buckets, width)
+    valid = ~np.isnan(grid).all(axis=1)
+    offsets = np.arange(n_buckets)[valid] * width
+    lo = np.nanargmin(grid[valid], axis=1) + offsets
+    hi = np.nanargmax(grid[valid], axis=1) + offsets
+    return np.unique(np.concatenate(([0, n - 1], lo, hi)))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``n_out`` visually representative points."""
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < edges.size else (n - 1, n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def decimate(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """MinMaxLTTB: min/max pre-selection (keeps spikes, bounds work) followed by LTTB."""
+    if x.size <= max_points:
+        return np.arange(x.size)
+    pre = minmax_indices(y, max(1, (max_points * MINMAX_RATIO) // 2))
+    return pre[lttb_indices(x[pre], y[pre], max_points)]
+
+
+def timeseries_window(
+    metric: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = None,
+    agg: str = "avg",
+    max_points: Optional[int] = None,
+    compact: bool = False,
+) -> Dict[str, Any]:
+    """Query a metric at the requested resolution; response keys mirror ``/timeseries/query``.
+
+    Columns are NumPy arrays (render with ``serialization.respond``); ``compact``
+    selects the compact encoding (see ``serialization.series``).
+    """
+    agg = (agg or "avg").lower()
+    if agg not in AGGS:
+        raise ValueError(f"Unsupported aggregation '{agg}'. Use one of {', '.join(sorted(AGGS))}")
+    if max_points is not None and max_points < 3:
+        raise ValueError("max_points must be >= 3")
+
+    if bucket:
+        secs = parse_bucket(bucket)
+        if agg in TS_SQL_AGGS:
+            rows = query_timeseries_buckets(metric, secs, agg, start, end)
+            arr = np.array(rows, dtype=np.float64).reshape(-1, 2)
+            cols = {"buckets": arr[:, 0].astype(np.int64), "values": arr[:, 1]}
+        else:
+            # Rolled-up ranges come back as buckets: their first/low/high/last feed the reduction
+            arr = np.array(query_timeseries_stats(metric, start, end), dtype=np.float64).reshape(-1, 5)
+            cols = bucket_reduce(arr[:, 0].astype(np.int64), arr[:, 1], secs, agg,
+                                 low=arr[:, 2], high=arr[:, 3], last=arr[:, 4])
+        if max_points:
+            series = cols["close"] if agg == "ohlc" else cols["values"]
+            keep = decimate(cols["buckets"].astype(np.float64), series, max_points)
+            cols = {k: v[keep] for k, v in cols.items()}
+        buckets = cols.pop("buckets")
+        return {"metric": metric, "bucket": bucket, "agg": agg, **serialization.series(buckets, cols, compact)}
+
+    if max_points:
+        first, last, count = timeseries_span(metric, start, end)
+        if count > max_points and first is not None:
+            # Pre-select each bucket's min and max point in SQL so only O(max_points) rows leave the DB
+            n_buckets = max(1, (max_points * MINMAX_RATIO) // 2)
+            secs = max(1, -(-(last - first + 1) // n_buckets))
+            pts = sorted(set(query_timeseries_extrema(metric, secs, start, end)))
+            arr = np.array(pts, dtype=np.float64).reshape(-1, 2)
+            keep = lttb_indices(arr[:, 0], arr[:, 1], max_points)
+            return {
+                "metric": metric,
+                **serialization.series(arr[keep, 0].astype(np.int64), {"values": arr[keep, 1]}, compact),
+                "max_points": max_points,
+            }
+
+    arr = np.array(query_timeseries_points(metric, start, end), dtype=np.float64).reshape(-1, 2)
+    return {"metric": metric, **serialization.series(arr[:, 0].astype(np.int64), {"values": arr[:, 1]}, compact)}
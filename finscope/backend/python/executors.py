@@ -0,0 +1,85 @@
+"""Bounded executor pools for blocking work called from async endpoints.
+
+Network fetches, SQLite access and CPU-bound model fitting each get their own
+pool so a slow upstream cannot starve DB reads (or vice versa), and none of
+them ever runs on the event loop. Pool sizes come from the environment:
+
+- ``PY_NET_WORKERS``  (default 16) - upstream market-data fetches
+- ``PY_DB_WORKERS``   (default 4)  - sqlite3 reads/writes
+- ``PY_CPU_WORKERS``  (default: CPU count) - numpy / scikit-learn work (threads)
+- ``PY_PROC_WORKERS`` (default: CPU count) - picklable heavy jobs (processes)
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+_CPUS = os.cpu_count() or 2
+
+POOL_SIZES = {
+    "net": int(os.environ.get("PY_NET_WORKERS", "16")),
+    "db": int(os.environ.get("PY_DB_WORKERS", "4")),
+    "cpu": int(os.environ.get("PY_CPU_WORKERS", str(_CPUS))),
+    "proc": int(os.environ.get("PY_PROC_WORKERS", str(_CPUS))),
+}
+
+_pools: Dict[str, Executor] = {}
+
+# Stage each pool's job time is recorded under in finscope_stage_seconds
+POOL_STAGES = {"net": "network", "db": "db", "cpu": "model_fit", "proc": "model_fit"}
+
+
+def get_pool(name: str) -> Executor:
+    """Return (creating on first use) the named pool."""
+    pool = _pools.get(name)
+    if pool is None:
+        size = max(1, POOL_SIZES[name])
+        if name == "proc":
+            pool = ProcessPoolExecutor(max_workers=size)
+        else:
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"finscope-{name}")
+        _pools[name] = pool
+    return pool
+
+
+async def run_in(name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(fn, *args, **kwargs)
+    if not metrics.METRICS_ENABLED:
+        return await loop.run_in_executor(get_pool(name), call)
+    metrics.POOL_IN_FLIGHT.inc(name)
+    try:
+        if name == "proc":
+            # Process-pool jobs cannot carry the request context; time them from here
+            with metrics.stage(POOL_STAGES[name]):
+                return await loop.run_in_executor(get_pool(name), call)
+        return await loop.run_in_executor(get_pool(name), metrics.bind(call, POOL_STAGES[name]))
+    finally:
+        metrics.POOL_IN_FLIGHT.dec(name)
+
+
+async def run_net(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await run_in("net", fn, *args, **kwargs)
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await run_in("db", fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await run_in("cpu", fn, *args, **kwargs)
+
+
+async def run_proc(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a module-level (picklable) function in the process pool."""
+    return await run_in("proc", fn, *args, **kwargs)
+
+
+def shutdown(wait: bool = False, names: Optional[list] = None):
+    for name in list(names or _pools.keys()):
+        pool = _pools.pop(name, None)
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
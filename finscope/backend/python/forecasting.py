@@ -0,0 +1,91 @@
+"""Trend forecasting for one or many price series.
+
+``linear_trend`` fits an ordinary-least-squares line to every series at once
+with closed-form, NaN-masked NumPy sums over a right-aligned price matrix (the
+same fit scikit-learn's LinearRegression produces, without a per-symbol
+model object) and returns prediction intervals from the residuals.
+``prophet_forecast`` is the opt-in alternative; it is a module-level function
+so it can run in the process pool.
+"""
+from statistics import NormalDist
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+MIN_POINTS = 20
+
+
+def stack_right_aligned(series: Sequence[Sequence[float]]) -> np.ndarray:
+    """Stack series of different lengths into an (n_max, k) matrix, NaN-padded at the top."""
+    n_max = max((len(s) for s in series), default=0)
+    mat = np.full((n_max, len(series)), np.nan)
+    for j, s in enumerate(series):
+        if len(s):
+            mat[n_max - len(s):, j] = np.asarray(s, dtype=np.float64)
+    return mat
+
+
+def linear_trend(series: Sequence[Sequence[float]], horizon: int, level: float = 0.95) -> Dict[str, np.ndarray]:
+    """Fit y = a + b*t per series (t = 0..n-1 within each series) and extrapolate ``horizon`` steps.
+
+    Returns arrays keyed ``forecast``, ``lower``, ``upper`` (shape (k, horizon)),
+    plus ``slope``, ``intercept``, ``resid_std`` and ``n`` (shape (k,)). The
+    interval is the OLS prediction interval at ``level`` under normal errors.
+    """
+    y = stack_right_aligned(series)
+    n_max, _ = y.shape
+    mask = ~np.isnan(y)
+    n = mask.sum(axis=0).astype(np.float64)
+    # Per-series time index: the first valid row of each column is t=0
+    t = np.arange(n_max, dtype=np.float64)[:, None] - (n_max - n)[None, :]
+    yz = np.where(mask, y, 0.0)
+    tz = np.where(mask, t, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = tz.sum(axis=0) / n
+        y_mean = yz.sum(axis=0) / n
+        dt = np.where(mask, t - t_mean, 0.0)
+        sxx = (dt * dt).sum(axis=0)
+        slope = (dt * (yz - y_mean)).sum(axis=0) / sxx
+        intercept = y_mean - slope * t_mean
+        resid = np.where(mask, y - (intercept + slope * t), 0.0)
+        resid_std = np.sqrt((resid * resid).sum(axis=0) / np.maximum(n - 2, 1))
+
+        steps = np.arange(1, horizon + 1, dtype=np.float64)[None, :]
+        t_future = (n - 1)[:, None] + steps
+        forecast = intercept[:, None] + slope[:, None] * t_future
+        z = NormalDist().inv_cdf(0.5 + level / 2)
+        se = resid_std[:, None] * np.sqrt(1 + 1 / n[:, None] + (t_future - t_mean[:, None]) ** 2 / sxx[:, None])
+    return {
+        "forecast": forecast,
+        "lower": forecast - z * se,
+        "upper": forecast + z * se,
+        "slope": slope,
+        "intercept": intercept,
+        "resid_std": resid_std,
+        "n": n,
+    }
+
+
+def prophet_forecast(dates: List[str], values: List[float], horizon: int, level: float = 0.95) -> Dict[str, List[float]]:
+    """Fit Prophet to one daily close series and forecast ``horizon`` business days (process-pool safe)."""
+    import pandas as pd
+    from prophet import Prophet
+
+    df = pd.DataFrame({"ds": pd.to_datetime(dates), "y": values})
+    model = Prophet(interval_width=level, daily_seasonality=False, yearly_seasonality=False)
+    model.fit(df)
+    future = model.make_future_dataframe(periods=horizon, freq="B", include_history=False)
+    pred = model.predict(future)
+    return {
+        "forecast": pred["yhat"].astype(float).tolist(),
+        "lower": pred["yhat_lower"].astype(float).tolist(),
+        "upper": pred["yhat_upper"].astype(float).tolist(),
+    }
+
+
+def horizon_points(path: Dict[str, Any], horizons: Sequence[int]) -> Dict[str, Dict[str, float]]:
+    """Pick the forecast/interval at each requested horizon (1-based steps) from a full path."""
+    return {
+        str(h): {k: float(path[k][h - 1]) for k in ("forecast", "lower", "upper")}
+        for h in horizons
+    }
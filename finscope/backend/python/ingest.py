@@ -0,0 +1,194 @@
+"""Streaming NDJSON / CSV ingest for the timeseries table.
+
+The request body is consumed chunk by chunk, parsed on the CPU pool and written
+in batches of ``TS_INGEST_CHUNK`` rows, so memory stays bounded no matter how
+large the upload is. Each batch is a ``write_timeseries`` job on the ``writer``
+queue and upserts on (source, metric, timestamp): retrying a batch is
+idempotent, so a body rejected with 503 part-way can simply be resent.
+
+NDJSON: one JSON object per line with ``metric``, ``timestamp``, ``value`` and
+optional ``source``, ``ingest_ts``, ``meta``. Timestamps are ISO-8601 (naive
+means UTC) or Unix seconds; a line whose timestamp does not parse is rejected.
+CSV: a header row naming the same columns, then one record per line (``meta``,
+if present, is a JSON object string); quoted fields may contain newlines.
+"""
+import csv
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from db import TS_INGEST_CHUNK, parse_epoch, write_timeseries
+from executors import run_cpu
+from writer import writer
+
+# Longest accepted record; protects the line buffer from bodies without newlines
+MAX_LINE_BYTES = 1024 * 1024
+# Per-row error messages echoed back (the count is always exact)
+MAX_REPORTED_ERRORS = 20
+
+
+def parse_record(rec: Dict[str, Any], now: int) -> Dict[str, Any]:
+    """Validate one decoded record into the dict shape ``write_timeseries`` expects."""
+    if not isinstance(rec, dict):
+        raise ValueError("record must be an object")
+    metric = rec.get("metric")
+    ts = rec.get("timestamp")
+    if not metric or not ts:
+        raise ValueError("metric and timestamp are required")
+    value = rec.get("value")
+    if value is None or value == "":
+        raise ValueError("value is required")
+    meta = rec.get("meta")
+    if isinstance(meta, str):
+        meta = json.loads(meta) if meta.strip() else None
+    return {
+        "source": str(rec.get("source") or ""),
+        "metric": str(metric),
+        "timestamp": parse_epoch(ts),
+        "value": float(value),
+        "ingest_ts": parse_epoch(rec["ingest_ts"]) if rec.get("ingest_ts") else now,
+        "meta": meta,
+    }
+
+
+class _Lines:
+    """Line source of the CSV reader; lines are pushed as whole records arrive."""
+
+    def __init__(self):
+        self.pending: Deque[str] = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.pending:
+            raise StopIteration
+        return self.pending.popleft()
+
+
+class _Parser:
+    """Decode and validate body lines into rows; ``feed`` runs on the CPU pool, one call per chunk.
+
+    CSV goes through a single ``csv.reader``, so a quoted field may span lines: a
+    record is handed to the reader once its quotes balance.
+    """
+
+    def __init__(self, fmt: str, now: int):
+        self.fmt = fmt
+        self.now = now
+        self.header: Optional[List[str]] = None
+        self.line = 0
+        self.rejected = 0
+        self.errors: List[str] = []
+        self._lines = _Lines()
+        self._csv = csv.reader(self._lines)
+        # Physical lines of a CSV record whose quoted field is still open, and where it started
+        self._record: List[str] = []
+        self._record_line = 0
+        self._record_bytes = 0
+
+    def reject(self, line: int, msg: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {msg}")
+
+    def feed(self, raws: List[bytes]) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for raw in raws:
+            self.line += 1
+            if len(raw) > MAX_LINE_BYTES:
+                raise ValueError(f"line {self.line} exceeds {MAX_LINE_BYTES} bytes")
+            text = raw.decode("utf-8-sig" if self.line == 1 else "utf-8", errors="replace")
+            if self.fmt == "ndjson":
+                text = text.strip()
+                if text:
+                    self._add(rows, self.line, lambda: json.loads(text))
+            elif self._record or text.strip():
+                self._csv_line(rows, text)
+        return rows
+
+    def finish(self):
+        """End of body: a CSV record whose quoted field never closed is rejected."""
+        if self._record:
+            self.reject(self._record_line, "unterminated quoted field")
+            self._record.clear()
+
+    def _csv_line(self, rows: List[Dict[str, Any]], text: str):
+        if not self._record:
+            self._record_line = self.line
+            self._record_bytes = 0
+        self._record.append(text + "\n")
+        self._record_bytes += len(text)
+        if self._record_bytes > MAX_LINE_BYTES:
+            raise ValueError(f"record at line {self._record_line} exceeds {MAX_LINE_BYTES} bytes")
+        if sum(part.count('"') for part in self._record) % 2:
+            return
+        self._lines.pending.extend(self._record)
+        self._record.clear()
+        self._add(rows, self._record_line, self._csv_record)
+
+    def _csv_record(self) -> Optional[Dict[str, Any]]:
+        cells = next(self._csv)
+        if self.header is None:
+            self.header = [h.strip() for h in cells]
+            return None
+        return dict(zip(self.header, cells))
+
+    def _add(self, rows: List[Dict[str, Any]], line: int, decode: Callable[[], Any]):
+        """Append the decoded record as a row, or count it as rejected (``decode`` returning None skips it)."""
+        try:
+            rec = decode()
+            if rec is not None:
+                rows.append(parse_record(rec, self.now))
+        except Exception as e:
+            self.reject(line, str(e) or e.__class__.__name__)
+
+
+async def ingest_stream(chunks: AsyncIterator[bytes], fmt: str = "ndjson", chunk_size: Optional[int] = None,
+                        durable: bool = True) -> Dict[str, Any]:
+    """Parse and store a streamed body; returns ``{"ingested", "rejected", "errors"}``.
+
+    Only byte buffering happens on the event loop; each chunk's lines are parsed
+    on the CPU pool. With ``durable`` False batches are acknowledged once queued,
+    and ``ingested`` counts queued rows.
+    """
+    fmt = (fmt or "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return {"error": f"Unsupported format '{fmt}'. Use ndjson or csv"}
+    chunk_size = max(1, chunk_size or TS_INGEST_CHUNK)
+    parser = _Parser(fmt, int(time.time()))
+    batch: List[Dict[str, Any]] = []
+    ingested = 0
+
+    async def flush():
+        nonlocal ingested
+        if batch:
+            rows = list(batch)
+            batch.clear()
+            n = await writer.write(write_timeseries, rows, durable=durable)
+            ingested += n if durable else len(rows)
+
+    buf = b""
+    try:
+        async for data in chunks:
+            buf += data
+            if b"\n" not in data:
+                if len(buf) > MAX_LINE_BYTES:
+                    return {"error": f"line {parser.line + 1} exceeds {MAX_LINE_BYTES} bytes",
+                            **_counts(ingested, parser)}
+                continue
+            *lines, buf = buf.split(b"\n")
+            batch.extend(await run_cpu(parser.feed, lines))
+            if len(batch) >= chunk_size:
+                await flush()
+        batch.extend(await run_cpu(parser.feed, [buf]) if buf else [])
+    except ValueError as e:
+        return {"error": str(e), **_counts(ingested, parser)}
+    parser.finish()
+    await flush()
+    return _counts(ingested, parser)
+
+
+def _counts(ingested: int, parser: _Parser) -> Dict[str, Any]:
+    return {"ingested": ingested, "rejected": parser.rejected, "errors": parser.errors}
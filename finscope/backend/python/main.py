@@ -1,47 +1,120 @@
-from fastapi import FastAPI, Body, Query
+# First, so cold-start accounting covers every import below
+import startup
+import asyncio
+import sqlite3
+from fastapi import FastAPI, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import pandas as pd
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LinearRegression
-from typing import List, Optional
-import yfinance as yf
-
+from typing import Dict, List, Optional, Union
 from agents.orchestrator import generate_report
-from db import init_db, insert_timeseries, query_timeseries, upsert_transaction, get_conn
+from db import close_all as close_db, init_db, normalize_transactions, parse_epoch, spending_summary, write_timeseries, write_transactions
+from market_data import demand as market_data_demand, get_history_async, get_history_many, singleflight_stats
+from executors import get_pool, run_cpu, run_db, run_net, run_proc, shutdown as shutdown_executors
+from anomaly import cached_flags, insights_for, isolation_flags, score_batch, stats as anomaly_stats, streams as anomaly_streams
+from forecasting import MIN_POINTS as FORECAST_MIN_POINTS, horizon_points, linear_trend, prophet_forecast
+from downsample import timeseries_window
+from ingest import ingest_stream, parse_record
+from multiquery import ARROW_MEDIA_TYPE, FORMATS, MultiQuery, arrow_available, columnar, stream_arrow, stream_ndjson
+import metrics
+import sectors
+from scheduler import WARM_ENABLED, WARM_TICKERS, Scheduler, parse_tickers, scheduler, setup as setup_scheduler
+import retention
+import montecarlo
+import response_cache
+from response_cache import cached
+import serialization
+from writer import WRITE_RETRY_AFTER, WriterBusy, writer
 from datetime import datetime, timezone
 import os
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from fastapi_cache.decorator import cache
-import redis.asyncio as aioredis
 
 # Create FastAPI app instance first
-app = FastAPI(title="FinScope Python Service")
+app = FastAPI(title="FinScope Python Service", default_response_class=serialization.FastJSONResponse)
+# Timeseries rollups/retention and the sector model run on their own loop, independent of
+# market-data warming (WARM_ENABLED); two slots so a slow sector refresh does not hold up rollups
+maintenance = Scheduler(concurrency=2)
+startup.mark("imports")
+metrics.register(metrics.CallbackGauge(
+    "finscope_startup_seconds", "Seconds from app import to each startup milestone.", startup.gauge, ("phase",)))
+
+@app.exception_handler(WriterBusy)
+async def _writer_busy(request: Request, exc: WriterBusy):
+    # Backpressure from the write queue: ask the client to retry rather than queueing without bound
+    return serialization.FastJSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": str(WRITE_RETRY_AFTER)})
 
 @app.on_event("startup")
 async def _startup():
-    init_db()
+    with startup.step("init_db"):
+        init_db()
+        writer.start()
+    if metrics.METRICS_ENABLED and metrics.PROFILE_SLOW_MS > 0:
+        metrics.profiler.start()
     # Configure caching
-    try:
-        redis_url = os.getenv('REDIS_URL')
-        if redis_url:
-            r = aioredis.from_url(redis_url, encoding="utf8", decode_responses=True)
-            FastAPICache.init(RedisBackend(r), prefix="finscope-cache")
-        else:
-            # In-memory fallback (simple backend inside fastapi-cache2)
-            from fastapi_cache.backends.inmemory import InMemoryBackend
-            FastAPICache.init(InMemoryBackend(), prefix="finscope-cache")
-    except Exception as e:
-        # Fallback to in-memory if Redis not available
+    with startup.step("response_cache"):
         try:
-            from fastapi_cache.backends.inmemory import InMemoryBackend
-            FastAPICache.init(InMemoryBackend(), prefix="finscope-cache")
-        except Exception:
-            pass
+            redis_url = os.getenv('REDIS_URL')
+            if redis_url:
+                # Only deployments that use Redis pay for importing it
+                import redis.asyncio as aioredis
+                from fastapi_cache.backends.redis import RedisBackend
+                r = aioredis.from_url(redis_url, encoding="utf8", decode_responses=True)
+                FastAPICache.init(RedisBackend(r), prefix="finscope-cache")
+            else:
+                # In-process fallback: LRU bounded by RESPONSE_CACHE_MAX_BYTES / RESPONSE_CACHE_MAX_ENTRIES
+                FastAPICache.init(response_cache.LRUBackend(), prefix="finscope-cache")
+        except Exception as e:
+            # Fallback to in-memory if Redis not available
+            FastAPICache.init(response_cache.LRUBackend(), prefix="finscope-cache")
+    # Keep hot tickers and derived models warm so requests rarely wait on the upstream
+    with startup.step("scheduler"):
+        setup_scheduler(scheduler)
+        if WARM_ENABLED:
+            app.state.scheduler = asyncio.create_task(scheduler.run())
+        if sectors.SECTOR_REFRESH_SECONDS > 0:
+            maintenance.add("sector_model", sectors.refresh, sectors.SECTOR_REFRESH_SECONDS)
+        if retention.TS_MAINTENANCE_SECONDS > 0:
+            # First pass a minute in, once startup traffic has settled
+            maintenance.add("timeseries", retention.run, retention.TS_MAINTENANCE_SECONDS,
+                            start_in=min(60.0, retention.TS_MAINTENANCE_SECONDS))
+        if maintenance.jobs:
+            app.state.maintenance = asyncio.create_task(maintenance.run())
+    startup.mark("ready")
+    if startup.WARMUP_ENABLED:
+        app.state.warmup = asyncio.create_task(startup.warmup(_warmup_steps()))
+
+def _warmup_steps():
+    """Cache-priming steps run after startup (heavy modules are preloaded before these)."""
+    async def hot_tickers():
+        # The scheduler keeps these fresh when it runs; otherwise load them once
+        if not WARM_ENABLED:
+            await run_net(get_history_many, [sym for sym, _ in parse_tickers(WARM_TICKERS)], period="1y", interval="1d")
+
+    def fit():
+        # A throwaway fit pays scikit-learn's first-call setup outside the detector cache
+        from sklearn.ensemble import IsolationForest
+        IsolationForest(n_estimators=10, random_state=0).fit(np.linspace(0.0, 1.0, 32).reshape(-1, 1))
+
+    async def first_fit():
+        await run_cpu(fit)
+
+    return [("hot_tickers", hot_tickers), ("sector_model", sectors.get_model), ("first_fit", first_fit)]
+
+@app.on_event("shutdown")
+async def _shutdown():
+    metrics.profiler.stop()
+    for name in ("scheduler", "maintenance", "warmup"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    # Commit whatever is still queued (fire-and-forget writes included) before closing
+    await asyncio.to_thread(writer.stop)
+    shutdown_executors()
+    close_db()
 
 @app.post("/report")
+@cached(expire=300)
 async def report(payload: dict = Body(...)):
     """Run all agents and return a unified financial insight report.
 
@@ -51,12 +124,15 @@ async def report(payload: dict = Body(...)):
     - { "portfolio": { "AAPL": [prices...], ... } }
     """
     symbols = None
+    weights = None
     # Prefer explicit symbols list
     if isinstance(payload.get("symbols"), list):
         symbols = [s for s in payload.get("symbols") if isinstance(s, str)]
     # Or extract from positions list
     elif isinstance(payload.get("positions"), list):
         symbols = [str(p.get("symbol")) for p in payload.get("positions") if isinstance(p, dict) and p.get("symbol")]
+        weights = {str(p["symbol"]).upper(): float(p["weight"]) for p in payload.get("positions")
+                   if isinstance(p, dict) and p.get("symbol") and p.get("weight")} or None
     # Or pass through portfolio dict
     portfolio = payload.get("portfolio") if isinstance(payload.get("portfolio"), dict) else None
     # If no inputs provided, default to SPY
@@ -64,7 +140,7 @@ async def report(payload: dict = Body(...)):
         symbols = ["SPY"]
 
     user_input = symbols if symbols else portfolio
-    report_obj = generate_report(user_input)
+    report_obj = await run_net(generate_report, user_input, weights)
     return {"report": report_obj}
 app.add_middleware(
     CORSMiddleware,
@@ -73,6 +149,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 class SeriesInput(BaseModel):
     labels: List[str]
@@ -86,7 +164,40 @@ class AnalyzeInput(BaseModel):
 async def health():
     return {"ok": True}
 
+@app.get("/stats")
+async def stats():
+    """In-process counters; ``coalesced`` counts history requests that shared an in-flight fetch."""
+    model = sectors.current()
+    return {
+        "market_data": {"singleflight": singleflight_stats()},
+        "anomaly": anomaly_stats(),
+        "response_cache": response_cache.stats(),
+        "sector_model": model.info() if model is not None else None,
+        "scheduler": {"jobs": scheduler.stats(), "demand": market_data_demand(limit=20)},
+        "writer": writer.stats(),
+        "timeseries_maintenance": retention.stats(),
+        "maintenance": {"jobs": maintenance.stats()},
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition: request latency, stage timers, cache hits, in-flight gauges."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profiles")
+async def debug_profiles():
+    """Folded-stack profiles of recent requests slower than ``PROFILE_SLOW_MS`` (when enabled)."""
+    if not (metrics.METRICS_ENABLED and metrics.PROFILE_SLOW_MS > 0):
+        return {"error": "Profiling is disabled. Set PROFILE_SLOW_MS to enable it."}
+    return {"threshold_ms": metrics.PROFILE_SLOW_MS, "profiles": metrics.profiler.recent()}
+
+@app.get("/debug/startup")
+async def debug_startup():
+    """Cold-start breakdown: heavy-module import times (and what triggered them), startup steps, warm-up progress."""
+    return startup.report()
+
 @app.post("/analyze")
+@cached(expire=300)
 async def analyze(payload: AnalyzeInput = Body(...)):
     # Z-score on portfolio and isolation forest anomalies using real data fallback
     try:
@@ -94,117 +205,197 @@ async def analyze(payload: AnalyzeInput = Body(...)):
             vals = payload.portfolio.values
         else:
             # Fallback to SPY close values (1mo, 1d) for a real series
-            hist = yf.Ticker("SPY").history(period="1mo", interval="1d", auto_adjust=False)
+            hist = await get_history_async("SPY", period="1mo", interval="1d")
             if hist is None or hist.empty:
                 return {"error": "No market data available for analysis"}
-            vals = hist['Close'].astype(float).tolist()
-        ser = np.array(vals)
+            vals = hist['Close'].to_numpy(dtype=np.float64)
+        ser = np.asarray(vals, dtype=np.float64)
         z = (ser - ser.mean()) / (ser.std() + 1e-9)
-        iso = IsolationForest(contamination=0.05, random_state=42)
-        iso.fit(ser.reshape(-1, 1))
-        scores = -iso.score_samples(ser.reshape(-1, 1))
-        anomalies = (scores > np.percentile(scores, 95)).tolist()
-
-        insights = []
-        if np.mean(z[-5:]) > 0.5:
-            insights.append("Portfolio trending upward lately vs baseline.")
-        if any(anomalies[-5:]):
-            insights.append("Recent anomaly detected; review recent exposures.")
+        # Identical series reuse their fitted detector; only new series pay for a forest fit
+        key, anomalies = cached_flags(ser)
+        if anomalies is None:
+            anomalies = await run_cpu(isolation_flags, ser, key)
 
-        return {
+        return serialization.respond({
             "z_score_last": float(z[-1]),
             "anomaly_flags": anomalies,
-            "insights": insights or ["No significant anomalies detected."]
-        }
+            "insights": insights_for(z, anomalies)
+        })
     except Exception as e:
         return {"error": str(e)}
 
+class StreamAnalyzeInput(BaseModel):
+    stream_id: str
+    values: List[float]
+    alpha: float = 0.1
+    threshold: float = 3.0
+    warmup: int = 10
+    reset: bool = False
+
+@app.post("/analyze/stream")
+async def analyze_stream(payload: StreamAnalyzeInput):
+    """Incremental EWMA z-score anomalies: post only the new points for a ``stream_id``."""
+    if not 0 < payload.alpha <= 1:
+        return {"error": "alpha must be in (0, 1]"}
+    return anomaly_streams.update(
+        payload.stream_id, payload.values, alpha=payload.alpha,
+        threshold=payload.threshold, warmup=payload.warmup, reset=payload.reset,
+    )
+
+class BatchSeriesInput(SeriesInput):
+    # An empty series has no z-scores (NumPy would warn on an all-NaN column)
+    values: List[float] = Field(min_length=1)
+
+class BatchAnalyzeInput(BaseModel):
+    portfolios: List[BatchSeriesInput]
+
+@app.post("/analyze/batch")
+async def analyze_batch(payload: BatchAnalyzeInput):
+    """Score many portfolio series in one vectorized pass; results follow the input order.
+
+    Flags are |z-score| above each series' 95th percentile, not the IsolationForest
+    used by /analyze, so the two can flag different points for the same series.
+    """
+    results = await run_cpu(score_batch, [p.values for p in payload.portfolios])
+    return {"results": results}
+
 @app.get("/forecast")
-@cache(expire=600)
+@cached(expire=600)
 async def forecast(symbol: str = "SPY", horizon: int = 14):
-    """Forecast using simple linear regression over recent market closes via yfinance."""
+    """Forecast using simple linear regression over recent market closes (closed-form OLS trend)."""
     # Pull recent history
-    hist = yf.Ticker(symbol).history(period="3mo", interval="1d", auto_adjust=False)
+    hist = await get_history_async(symbol, period="3mo", interval="1d")
     if hist is None or hist.empty:
         return {"error": f"No market data for {symbol}"}
     y = hist['Close'].astype(float).values
     n = len(y)
-    if n < 20:
+    if n < FORECAST_MIN_POINTS:
         return {"error": "Insufficient data for forecast"}
-    x = np.arange(n).reshape(-1, 1)
-    y2d = y.reshape(-1, 1)
-    lr = LinearRegression().fit(x, y2d)
-    future_idx = np.arange(n, n + horizon).reshape(-1, 1)
-    yhat = lr.predict(future_idx).flatten().tolist()
+    with metrics.stage("model_fit"):
+        yhat = linear_trend([y], horizon)["forecast"][0].tolist()
     labels = [str(idx) for idx in range(1, horizon + 1)]
     return {"symbol": symbol, "labels": labels, "forecast": yhat}
 
+class ForecastBatchInput(BaseModel):
+    symbols: List[str]
+    horizons: List[int] = [14]
+    model: str = "linear"
+    period: str = "3mo"
+    level: float = 0.95
+
+@app.post("/forecast/batch")
+async def forecast_batch(payload: ForecastBatchInput):
+    """Forecast many symbols in one call.
+
+    ``linear`` (default) solves every trend fit in one vectorized pass; ``prophet``
+    fits Prophet per symbol on the process pool. Each symbol gets the full path
+    up to the longest horizon, a prediction interval at ``level``, and the
+    values at each requested horizon.
+    """
+    horizons = sorted({int(h) for h in payload.horizons if int(h) > 0})
+    model = payload.model.lower()
+    if not horizons or not payload.symbols:
+        return {"error": "symbols and positive horizons are required"}
+    if model not in ("linear", "prophet"):
+        return {"error": "model must be 'linear' or 'prophet'"}
+    if not 0 < payload.level < 1:
+        return {"error": "level must be between 0 and 1"}
+    horizon = horizons[-1]
+    try:
+        hists, errors = await run_net(get_history_many, payload.symbols, period=payload.period, interval="1d")
+    except ValueError as e:
+        return {"error": str(e)}
+    closes = {}
+    for sym, hist in hists.items():
+        c = hist['Close'].astype(float).dropna()
+        if len(c) < FORECAST_MIN_POINTS:
+            errors[sym] = "Insufficient data for forecast"
+        else:
+            closes[sym] = c
+    syms = list(closes)
+    paths = {}
+    if model == "linear" and syms:
+        fit = await run_cpu(linear_trend, [closes[s].values for s in syms], horizon, payload.level)
+        for j, sym in enumerate(syms):
+            paths[sym] = {k: fit[k][j].tolist() for k in ("forecast", "lower", "upper")}
+    elif syms:
+        results = await asyncio.gather(*[
+            run_proc(prophet_forecast, [str(d.date()) for d in closes[s].index], closes[s].tolist(), horizon, payload.level)
+            for s in syms
+        ], return_exceptions=True)
+        for sym, res in zip(syms, results):
+            if isinstance(res, BaseException):
+                errors[sym] = str(res) or res.__class__.__name__
+            else:
+                paths[sym] = res
+    labels = [str(idx) for idx in range(1, horizon + 1)]
+    return {
+        "model": model,
+        "horizons": horizons,
+        "level": payload.level,
+        "forecasts": {
+            sym: {"symbol": sym, "labels": labels, **path, "by_horizon": horizon_points(path, horizons)}
+            for sym, path in paths.items()
+        },
+        "errors": errors,
+    }
+
 class SimInput(BaseModel):
     shift_pct: float = 10.0
     from_sector: str = "tech"
     to_sector: str = "energy"
+    # Full reallocation: current allocation (sector -> percent, remainder is cash) plus either
+    # a target allocation or a list of {from_sector, to_sector, shift_pct} moves
+    weights: Optional[Dict[str, float]] = None
+    target: Optional[Dict[str, float]] = None
+    shifts: Optional[List[dict]] = None
 
 @app.post("/simulate")
 async def simulate(sim: SimInput):
-    """Estimate impact of shifting allocation between sectors using recent returns/volatility of sector ETFs."""
-    sector_etf = {
-        "tech": "XLK",
-        "energy": "XLE",
-        "healthcare": "XLV",
-        "financials": "XLF",
-        "industrials": "XLI",
-        "materials": "XLB",
-        "utilities": "XLU",
-        "real_estate": "XLRE",
-        "consumer_discretionary": "XLY",
-        "consumer_staples": "XLP",
-        "communication": "XLC",
-    }
-    src = sector_etf.get(sim.from_sector.lower())
-    dst = sector_etf.get(sim.to_sector.lower())
-    if not src or not dst:
-        return {"error": "Unknown sector. Use keys like tech, energy, healthcare, financials, ..."}
+    """Estimate the change in portfolio risk/return from a sector reallocation.
+
+    Uses the precomputed sector ETF mean/covariance model, so no market data is fetched per call.
+    Without ``weights``, the legacy single shift is applied to a portfolio fully in ``from_sector``.
+    """
     try:
-        h_from = yf.Ticker(src).history(period="3mo", interval="1d", auto_adjust=False)
-        h_to = yf.Ticker(dst).history(period="3mo", interval="1d", auto_adjust=False)
-        if h_from.empty or h_to.empty:
-            return {"error": "No data for sector ETFs"}
-        r_from = h_from['Close'].pct_change().dropna()
-        r_to = h_to['Close'].pct_change().dropna()
-        mean_from = float(r_from.mean())
-        mean_to = float(r_to.mean())
-        vol_from = float(r_from.std())
-        vol_to = float(r_to.std())
-        # Approximate portfolio-level delta from shifting 'shift_pct' percentage points
-        w = sim.shift_pct / 100.0
-        expected_return_change_pct = round((mean_to - mean_from) * w * 100.0, 2)
-        expected_risk_change_pct = round((vol_to - vol_from) * w * 100.0, 2)
-        return {
-            "message": f"Shifted {sim.shift_pct}% from {sim.from_sector} ({src}) to {sim.to_sector} ({dst}).",
-            "expected_risk_change_pct": expected_risk_change_pct,
-            "expected_return_change_pct": expected_return_change_pct,
-        }
+        model = await sectors.get_model()
+        if sim.weights is None:
+            before = {sim.from_sector: 100.0}
+            after = sectors.apply_shifts(before, sim.shifts or [sim.model_dump(include={"from_sector", "to_sector", "shift_pct"})])
+        else:
+            before = sim.weights
+            after = sim.target if sim.target is not None else sectors.apply_shifts(before, sim.shifts or [])
+        out = model.compare(before, after)
+        if sim.weights is None and not sim.shifts:
+            src, dst = sectors.SECTOR_ETF[sim.from_sector.lower()], sectors.SECTOR_ETF[sim.to_sector.lower()]
+            message = f"Shifted {sim.shift_pct}% from {sim.from_sector} ({src}) to {sim.to_sector} ({dst})."
+        else:
+            message = "Reallocated portfolio across sectors."
+        return {"message": message, **out, "after_weights": {k: round(v, 4) for k, v in after.items() if v}}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/market")
-@cache(expire=120)
+@cached(expire=120)
 async def market(
+    request: Request,
     symbol: str = Query(..., description="Ticker symbol, e.g., SPY"),
     period: str = Query("1mo", description="yfinance period, e.g., 1mo, 3mo, 6mo, 1y"),
-    interval: str = Query("1d", description="yfinance interval, e.g., 1d, 1h")
+    interval: str = Query("1d", description="yfinance interval, e.g., 1d, 1h"),
+    format: Optional[str] = Query(None, description="compact: epoch offsets + float32 values instead of labels"),
 ):
-    """Fetch market time-series via yfinance. Returns labels (dates) and values (close)."""
+    """Fetch market time-series from the local bar store (topped up via yfinance). Returns labels (dates) and values (close)."""
     try:
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period=period, interval=interval, auto_adjust=False)
+        hist = await get_history_async(symbol, period=period, interval=interval)
         if hist is None or hist.empty:
             return {"error": "No data returned from yfinance"}
-        # Ensure index is string dates
-        labels = [str(x.date()) if hasattr(x, 'date') else str(x) for x in hist.index]
-        values = hist['Close'].astype(float).tolist()
-        last = float(values[-1]) if values else None
-        return {"symbol": symbol, "labels": labels, "values": values, "last": last}
+        # Index -> Unix seconds (intraday bars are UTC, daily bars naive dates); labels are the dates
+        epochs = hist.index.values.astype("datetime64[s]").astype(np.int64)
+        values = hist['Close'].to_numpy(dtype=np.float64)
+        last = float(values[-1]) if values.size else None
+        compact = serialization.encoding(request) == "compact"
+        body = serialization.series(epochs, {"values": values}, compact, label_unit="D")
+        return serialization.respond({"symbol": symbol, **body, "last": last}, compact)
     except Exception as e:
         return {"error": str(e)}
 
@@ -219,10 +410,13 @@ async def invest(payload: InvestInput):
         # compute class exposures (very simplified mapping)
         positions = payload.positions or []
         weights = {str(p.get('symbol')).upper(): float(p.get('weight')) for p in positions if p.get('symbol') and p.get('weight')}
-        # fetch recent vol for select ETFs as proxies
+        # fetch recent vol for select ETFs as proxies, and a year of history for the positions' tail risk
         proxies = {}
-        for sym in ['BND', 'IEF', 'SHY', 'SPY', 'QQQ', 'BTC-USD']:
-            hist = yf.Ticker(sym).history(period='3mo', interval='1d', auto_adjust=False)
+        (hists, _errors), (pos_hists, pos_errors) = await asyncio.gather(
+            run_net(get_history_many, ['BND', 'IEF', 'SHY', 'SPY', 'QQQ', 'BTC-USD'], period='3mo', interval='1d'),
+            run_net(get_history_many, list(weights), period='1y', interval='1d'),
+        )
+        for sym, hist in hists.items():
             if hist is None or hist.empty:
                 continue
             r = hist['Close'].pct_change().dropna()
@@ -254,9 +448,18 @@ async def invest(payload: InvestInput):
             signal = 'hold_review_next_week'
             rationale.append('No strong imbalance detected; maintain allocations and review weekly.')
             confidence = 0.5
+        tail_risk = None
+        if weights:
+            closes = {s: h['Close'] for s, h in pos_hists.items() if h is not None and not h.empty}
+            try:
+                tail_risk = await run_cpu(montecarlo.portfolio_tail_risk, closes, weights, seed=0)
+                tail_risk['missing'] = pos_errors
+            except ValueError as e:
+                tail_risk = {'error': str(e), 'missing': pos_errors}
         return {
             'portfolio': [{'ticker': s, 'weight': w} for s, w in weights.items()],
             'risk_exposure': { 'crypto': crypto_weight },
+            'tail_risk': tail_risk,
             'signal': signal,
             'rationale': ' '.join(rationale),
             'confidence': confidence
@@ -264,99 +467,194 @@ async def invest(payload: InvestInput):
     except Exception as e:
         return { 'error': str(e) }
 
+class MonteCarloInput(BaseModel):
+    positions: List[dict]
+    horizon_days: int = 21
+    n_paths: int = 10000
+    mode: str = "bootstrap"
+    levels: List[float] = [0.95, 0.99]
+    period: str = "1y"
+    seed: Optional[int] = None
+
+@app.post("/risk/montecarlo")
+async def risk_montecarlo(payload: MonteCarloInput):
+    """Monte Carlo VaR/CVaR and drawdown distribution for weighted positions ``[{symbol, weight}]``.
+
+    Pass ``seed`` to reproduce a run; the seed used is echoed back either way.
+    """
+    try:
+        weights = {str(p.get('symbol')).upper(): float(p.get('weight')) for p in payload.positions if p.get('symbol') and p.get('weight')}
+        if not weights:
+            return {"error": "positions must include symbol and weight"}
+        hists, errors = await run_net(get_history_many, list(weights), period=payload.period, interval='1d')
+        closes = {s: h['Close'] for s, h in hists.items() if h is not None and not h.empty}
+        executor = get_pool("proc") if payload.n_paths >= montecarlo.MC_PROC_PATHS else None
+        out = await run_cpu(
+            montecarlo.portfolio_tail_risk, closes, weights,
+            horizon=payload.horizon_days, n_paths=payload.n_paths, mode=payload.mode,
+            levels=payload.levels, seed=payload.seed, executor=executor,
+        )
+        out["missing"] = errors
+        return out
+    except Exception as e:
+        return {"error": str(e)}
+
 # --- Timeseries storage endpoints ---
 class TSRow(BaseModel):
     source: str
     metric: str
-    timestamp: str
+    timestamp: Union[str, float]
     value: float
-    ingest_ts: Optional[str] = None
+    ingest_ts: Optional[Union[str, float]] = None
     meta: Optional[dict] = None
 
+    @field_validator("timestamp", "ingest_ts")
+    @classmethod
+    def _epoch(cls, v):
+        # ISO-8601 (naive means UTC) or Unix seconds; stored as whole seconds
+        return parse_epoch(v) if v is not None else None
+
+DURABLE_DESCRIPTION = "Wait for the group commit (default); false acknowledges once the write is queued"
+
 @app.post("/timeseries/ingest")
-async def ts_ingest(rows: List[TSRow]):
-    now_iso = datetime.now(timezone.utc).isoformat()
+async def ts_ingest(rows: List[TSRow], durable: bool = Query(True, description=DURABLE_DESCRIPTION)):
+    now = int(datetime.now(timezone.utc).timestamp())
+    # Same checks as the streaming path, before anything is queued (a queued write cannot report them)
     payload = []
-    for r in rows:
-        payload.append({
-            "source": r.source,
-            "metric": r.metric,
-            "timestamp": r.timestamp,
-            "value": r.value,
-            "ingest_ts": r.ingest_ts or now_iso,
-            "meta": r.meta or {},
-        })
-    insert_timeseries(payload)
-    return {"ingested": len(payload)}
+    for i, r in enumerate(rows):
+        try:
+            payload.append(parse_record({"source": r.source, "metric": r.metric, "timestamp": r.timestamp,
+                                         "value": r.value, "ingest_ts": r.ingest_ts, "meta": r.meta}, now))
+        except ValueError as e:
+            return {"error": f"row {i}: {e}"}
+    n = await writer.write(write_timeseries, payload, durable=durable)
+    return {"ingested": n} if durable else {"queued": len(rows)}
+
+@app.post("/timeseries/ingest/stream")
+async def ts_ingest_stream(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson or csv (defaults from Content-Type)"),
+    durable: bool = Query(True, description=DURABLE_DESCRIPTION),
+):
+    """Bounded-memory bulk ingest of an NDJSON or CSV body; upserts on (source, metric, timestamp)."""
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    return await ingest_stream(request.stream(), fmt, durable=durable)
 
 @app.get("/timeseries/query")
-async def ts_query(metric: str, start: Optional[str] = None, end: Optional[str] = None):
-    rows = query_timeseries(metric, start, end)
-    labels = [r["timestamp"] for r in rows]
-    values = [r["value"] for r in rows]
-    return {"metric": metric, "labels": labels, "values": values}
+async def ts_query(
+    request: Request,
+    metric: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = Query(None, description="Bucket size, e.g. 1m, 15m, 1h, 1d"),
+    agg: str = Query("avg", description="Bucket aggregation: avg, min, max, sum, count, first, last, ohlc"),
+    max_points: Optional[int] = Query(None, description="Cap on returned points (min/max-preserving LTTB decimation)"),
+    format: Optional[str] = Query(None, description="compact: epoch offsets + float32 values instead of labels"),
+):
+    compact = serialization.encoding(request) == "compact"
+    try:
+        out = await run_db(timeseries_window, metric, start, end, bucket=bucket, agg=agg, max_points=max_points, compact=compact)
+    except ValueError as e:
+        return {"error": str(e)}
+    return serialization.respond(out, compact)
+
+@app.get("/timeseries/multi")
+async def ts_multi(
+    metric: List[str] = Query(..., description="Metric names; repeat the param or comma-separate"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = Query(None, description="Optional bucket size, e.g. 1m, 1h, 1d"),
+    agg: str = Query("avg", description="Bucket aggregation: avg, min, max, sum, count"),
+    ffill: bool = Query(False, description="Carry each metric's last value forward over gaps"),
+    format: str = Query("json", description="json (columnar), ndjson (streamed) or arrow (streamed Arrow IPC)"),
+):
+    """Several metrics aligned on one time axis, in one call."""
+    names = [m.strip() for item in metric for m in item.split(",") if m.strip()]
+    try:
+        q = MultiQuery(names, start, end, bucket=bucket, agg=agg, ffill=ffill)
+    except ValueError as e:
+        return {"error": str(e)}
+    fmt = (format or "json").lower()
+    if fmt == "ndjson":
+        return StreamingResponse(stream_ndjson(q), media_type="application/x-ndjson")
+    if fmt == "arrow":
+        if not arrow_available():
+            return {"error": "Arrow output requires pyarrow to be installed"}
+        return StreamingResponse(stream_arrow(q), media_type=ARROW_MEDIA_TYPE)
+    if fmt != "json":
+        return {"error": f"Unsupported format '{format}'. Use one of {', '.join(FORMATS)}"}
+    return await run_db(columnar, q)
+
+class RetentionPolicy(BaseModel):
+    metric: str
+    raw_days: Optional[float] = None
+    hourly_days: Optional[float] = None
+    daily_days: Optional[float] = None
+
+@app.get("/timeseries/retention")
+async def ts_retention():
+    """Retention defaults, per-metric overrides and the last maintenance run."""
+    return {"defaults": retention.defaults(), "policies": await run_db(retention.policies), "maintenance": retention.stats()}
+
+@app.put("/timeseries/retention")
+async def ts_set_retention(policy: RetentionPolicy):
+    """Override a metric's retention in days (0 keeps a tier forever; omitted tiers use the defaults, all omitted resets)."""
+    values = policy.model_dump(exclude={"metric"})
+    try:
+        effective = retention.validate(values)
+    except ValueError as e:
+        return {"error": str(e)}
+    await writer.write(retention.set_policy, policy.metric, values)
+    return {"metric": policy.metric, **effective}
+
+@app.post("/timeseries/maintenance")
+async def ts_maintenance():
+    """Run rollups, retention and incremental vacuum now (otherwise every ``TS_MAINTENANCE_SECONDS``)."""
+    return await retention.run()
 
 # --- Transactions storage (for Plaid) ---
 @app.post("/bank/transactions")
-async def bank_transactions(payload: dict = Body(...)):
+async def bank_transactions(payload: dict = Body(...), durable: bool = Query(True, description=DURABLE_DESCRIPTION)):
     txns = payload.get("transactions")
     if not isinstance(txns, list):
         return {"error": "transactions must be a list"}
-    for t in txns:
-        try:
-            upsert_transaction(t)
-        except Exception:
-            continue
-    return {"stored": len(txns)}
+    rows, failed = await run_cpu(normalize_transactions, txns)
+    try:
+        counts = await writer.write(write_transactions, rows, durable=durable)
+    except sqlite3.Error as e:
+        # WriterBusy is left to its handler (503 + Retry-After)
+        return {"error": str(e), "stored": 0, "inserted": 0, "updated": 0, "failed": len(txns)}
+    if not durable:
+        return {"queued": len(rows), "failed": failed}
+    return {"stored": counts["inserted"] + counts["updated"], **counts, "failed": failed}
 
 # --- Bank summary aggregates (last N days)
 @app.get("/bank/summary")
-@cache(expire=60)
+@cached(expire=60)
 async def bank_summary(days: int = 30):
+    return await run_db(_bank_summary, days)
+
+def _bank_summary(days: int):
     try:
         # derive date cutoff and month-to-date start
         from datetime import date, timedelta
         today = date.today()
         cutoff = (today - timedelta(days=max(1, days))).isoformat()
         mtd_start = today.replace(day=1).isoformat()
-        by_category = {}
-        by_merchant = {}
-        total_spend = 0.0
-        total_income = 0.0
-        mtd_spend = 0.0
-        mtd_income = 0.0
-        with get_conn() as c:
-            cur = c.execute("SELECT date, name, amount, category FROM transactions WHERE date>=?", (cutoff,))
-            for d, name, amount, category in cur.fetchall():
-                amt = float(amount or 0)
-                # Positive amounts = spend; negative = income/credits (Plaid often uses positive for outflow)
-                if amt > 0:
-                    total_spend += amt
-                    if d >= mtd_start:
-                        mtd_spend += amt
-                    # categorize spend only
-                    cat = None
-                    if category:
-                        cat = str(category).split(',')[0].strip()
-                    cat = cat or 'Uncategorized'
-                    by_category.setdefault(cat, {'count': 0, 'total': 0.0})
-                    by_category[cat]['count'] += 1
-                    by_category[cat]['total'] += amt
-                    nm = name or 'Unknown'
-                    by_merchant.setdefault(nm, {'count': 0, 'total': 0.0})
-                    by_merchant[nm]['count'] += 1
-                    by_merchant[nm]['total'] += amt
-                elif amt < 0:
-                    total_income += abs(amt)
-                    if d >= mtd_start:
-                        mtd_income += abs(amt)
+        # Aggregate pre-computed daily rollups (maintained by upsert_transaction) instead of raw rows.
+        # Positive amounts = spend; negative = income/credits (Plaid often uses positive for outflow)
+        agg = spending_summary(cutoff, mtd_start, top_n=8)
+        total_spend = float(agg['total_spend'])
+        total_income = float(agg['total_income'])
+        mtd_spend = float(agg['mtd_spend'])
+        mtd_income = float(agg['mtd_income'])
         # format top lists
-        top_categories = sorted([
-            {'category': k, 'count': v['count'], 'total': round(v['total'], 2)} for k, v in by_category.items()
-        ], key=lambda x: x['total'], reverse=True)[:8]
-        top_merchants = sorted([
-            {'merchant': k, 'count': v['count'], 'total': round(v['total'], 2)} for k, v in by_merchant.items()
-        ], key=lambda x: x['total'], reverse=True)[:8]
+        top_categories = [
+            {'category': k, 'count': int(n), 'total': round(t, 2)} for k, n, t in agg['top_categories']
+        ]
+        top_merchants = [
+            {'merchant': k, 'count': int(n), 'total': round(t, 2)} for k, n, t in agg['top_merchants']
+        ]
         # recurring = merchants with >=3 transactions within the window
         recurring = [m for m in top_merchants if m['count'] >= 3]
         # savings insights
@@ -0,0 +1,384 @@
+"""Shared market-data layer backed by an incremental SQLite OHLCV store.
+
+Every endpoint and agent that needs price history goes through ``get_history``.
+Bars are persisted per (symbol, interval, bar date) and only the bars missing
+since the last stored one are requested upstream; any ``period`` is then served
+from the local table. When the upstream fails, stored history is returned.
+"""
+import importlib
+import logging
+import os
+import functools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from db import get_conn, init_db
+from executors import get_pool
+from singleflight import SingleFlight
+from writer import writer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# Seconds before a stored (symbol, interval) is considered stale and topped up
+MARKET_DATA_TTL = float(os.environ.get("MARKET_DATA_TTL", "300"))
+# Batched fetches: max symbols in flight per call, and seconds allowed per symbol
+MARKET_FETCH_CONCURRENCY = int(os.environ.get("MARKET_FETCH_CONCURRENCY", "8"))
+MARKET_FETCH_TIMEOUT = float(os.environ.get("MARKET_FETCH_TIMEOUT", "20"))
+# Distinct (symbol, interval) keys whose request counts are remembered for the warm-up scheduler
+MARKET_DEMAND_KEYS = int(os.environ.get("MARKET_DEMAND_KEYS", "512"))
+
+COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+_PERIOD_OFFSETS = {
+    "1d": {"days": 1},
+    "5d": {"days": 5},
+    "1mo": {"months": 1},
+    "3mo": {"months": 3},
+    "6mo": {"months": 6},
+    "1y": {"years": 1},
+    "2y": {"years": 2},
+    "5y": {"years": 5},
+    "10y": {"years": 10},
+}
+
+# (symbol, start, end, interval) -> DataFrame indexed by bar timestamp with COLUMNS
+PriceSource = Callable[[str, datetime, Optional[datetime], str], "pd.DataFrame"]
+
+
+def yfinance_source(symbol: str, start: datetime, end: Optional[datetime], interval: str) -> "pd.DataFrame":
+    """Default upstream: Yahoo Finance via yfinance."""
+    import yfinance as yf
+    return yf.Ticker(symbol).history(start=start, end=end, interval=interval, auto_adjust=False)
+
+
+def _load_source(spec: Optional[str]) -> PriceSource:
+    """Resolve ``MARKET_DATA_SOURCE`` ("package.module:callable") to a price source."""
+    if not spec:
+        return yfinance_source
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "source")
+
+
+_source: Optional[PriceSource] = None
+_schema_ready = False
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+# Coalesces concurrent get_history calls for the same (symbol, period, interval)
+_flight = SingleFlight()
+metrics.register(metrics.CallbackGauge(
+    "finscope_market_fetches_in_flight", "Distinct history fetches currently running.", lambda: {(): _flight.in_flight()}))
+# (symbol, interval) -> {"period", "count", "last"}: what callers actually ask for
+_demand: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_demand_lock = threading.Lock()
+
+
+def get_price_source() -> PriceSource:
+    global _source
+    if _source is None:
+        _source = _load_source(os.environ.get("MARKET_DATA_SOURCE"))
+    return _source
+
+
+def set_price_source(source: Optional[PriceSource]):
+    """Swap the upstream price source (e.g. a local stub in tests/benchmarks). ``None`` restores the default."""
+    global _source
+    _source = source
+
+
+def _ensure_schema():
+    global _schema_ready
+    if not _schema_ready:
+        init_db()
+        _schema_ready = True
+
+
+def normalize_symbol(symbol: str) -> str:
+    return str(symbol or "").strip().upper()
+
+
+def is_intraday(interval: str) -> bool:
+    return (interval.endswith("m") and not interval.endswith("mo")) or interval.endswith("h")
+
+
+def period_start(period: str, now: Optional["pd.Timestamp"] = None) -> "pd.Timestamp":
+    """Translate a yfinance ``period`` string into an absolute UTC start timestamp."""
+    import pandas as pd
+    now = now if now is not None else pd.Timestamp.now(tz="UTC")
+    if period == "max":
+        return pd.Timestamp("1970-01-01", tz="UTC")
+    if period == "ytd":
+        return pd.Timestamp(year=now.year, month=1, day=1, tz="UTC")
+    offset = _PERIOD_OFFSETS.get(period)
+    if offset is None:
+        raise ValueError(f"Unsupported period: {period}")
+    return now - pd.DateOffset(**offset)
+
+
+def _bar_key(ts, interval: str) -> str:
+    import pandas as pd
+    ts = pd.Timestamp(ts)
+    if is_intraday(interval):
+        ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+        return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return ts.strftime("%Y-%m-%d")
+
+
+def _bar_keys(index, interval: str):
+    import pandas as pd
+    idx = pd.DatetimeIndex(index)
+    if is_intraday(interval):
+        idx = idx.tz_localize("UTC") if idx.tz is None else idx.tz_convert("UTC")
+        return idx.strftime("%Y-%m-%dT%H:%M:%SZ")
+    # Daily+ bars are keyed by exchange-local date, before any tz conversion
+    return idx.strftime("%Y-%m-%d")
+
+
+def _sync_state(symbol: str, interval: str) -> Optional[Tuple[str, str, float]]:
+    with get_conn(readonly=True) as c:
+        row = c.execute(
+            "SELECT covered_from, last_ts, fetched_at FROM ohlcv_sync WHERE symbol=? AND interval=?",
+            (symbol, interval),
+        ).fetchone()
+    return tuple(row) if row else None
+
+
+def store_bars(symbol: str, interval: str, hist: "pd.DataFrame", covered_from: Optional[str] = None,
+               tail: bool = True):
+    """Upsert upstream bars and advance the sync watermark for (symbol, interval).
+
+    ``tail`` says the fetch reached the present; only then does ``fetched_at`` move,
+    so a bounded backfill does not postpone the next top-up.
+    """
+    import pandas as pd
+    _ensure_schema()
+    hist = hist if hist is not None else pd.DataFrame()
+    keys = _bar_keys(hist.index, interval) if len(hist) else []
+    cols = [hist[c].astype(float).tolist() if c in hist else [None] * len(hist) for c in COLUMNS]
+    if len(hist) and "Adj Close" not in hist and "Close" in hist:
+        cols[4] = cols[3]
+    rows = [(symbol, interval, k, *vals) for k, *vals in zip(keys, *cols)]
+    # Durable: callers read the bars back right after storing them
+    writer.submit(_write_bars, symbol, interval, rows, covered_from, time.time() if tail else None).result()
+
+
+def _write_bars(c, symbol: str, interval: str, rows: List[tuple], covered_from: Optional[str],
+                fetched_at: Optional[float]):
+    """Writer job for ``store_bars``."""
+    if rows:
+        c.executemany(
+            "INSERT INTO ohlcv_bars(symbol, interval, ts, open, high, low, close, adj_close, volume) "
+            "VALUES(?,?,?,?,?,?,?,?,?) "
+            "ON CONFLICT(symbol, interval, ts) DO UPDATE SET open=excluded.open, high=excluded.high, "
+            "low=excluded.low, close=excluded.close, adj_close=excluded.adj_close, volume=excluded.volume",
+            rows,
+        )
+    c.execute(
+        "INSERT INTO ohlcv_sync(symbol, interval, covered_from, last_ts, fetched_at) "
+        "SELECT ?, ?, ?, MAX(ts), ? FROM ohlcv_bars WHERE symbol=? AND interval=? "
+        "ON CONFLICT(symbol, interval) DO UPDATE SET "
+        "covered_from=MIN(COALESCE(ohlcv_sync.covered_from, excluded.covered_from), "
+        "COALESCE(excluded.covered_from, ohlcv_sync.covered_from)), "
+        "last_ts=excluded.last_ts, fetched_at=COALESCE(excluded.fetched_at, ohlcv_sync.fetched_at)",
+        (symbol, interval, covered_from, fetched_at, symbol, interval),
+    )
+
+
+def load_bars(symbol: str, interval: str, start_key: Optional[str] = None) -> "pd.DataFrame":
+    """Read stored bars (oldest first) as a yfinance-shaped DataFrame."""
+    import pandas as pd
+    _ensure_schema()
+    q = "SELECT ts, open, high, low, close, adj_close, volume FROM ohlcv_bars WHERE symbol=? AND interval=?"
+    params = [symbol, interval]
+    if start_key:
+        q += " AND ts>=?"; params.append(start_key)
+    q += " ORDER BY ts ASC"
+    with get_conn(readonly=True) as c:
+        rows = c.execute(q, params).fetchall()
+    df = pd.DataFrame(rows, columns=["ts"] + COLUMNS)
+    df.index = pd.to_datetime(df.pop("ts"), utc=is_intraday(interval))
+    df.index.name = "Date"
+    return df
+
+
+def sync(symbol: str, start: "pd.Timestamp", interval: str = "1d", force: bool = False) -> bool:
+    """Bring the local store up to date for ``symbol`` from ``start``; returns True if upstream was hit."""
+    import pandas as pd
+    _ensure_schema()
+    start_key = _bar_key(start, interval)
+    state = _sync_state(symbol, interval)
+    source = get_price_source()
+    fetched = False
+    if state is None or state[0] is None or start_key < state[0]:
+        # Backfill the part of the window we have never covered (or everything, first time)
+        end = None
+        if state is not None and state[0] is not None:
+            end = pd.Timestamp(state[0]).to_pydatetime()
+        with metrics.stage("upstream_fetch"):
+            hist = source(symbol, start.to_pydatetime(), end, interval)
+        store_bars(symbol, interval, hist, covered_from=start_key, tail=end is None)
+        fetched = True
+        if end is None:
+            return fetched
+    # A backfill only reaches covered_from, so the tail may still need a top-up
+    if force or (time.time() - (state[2] or 0)) > MARKET_DATA_TTL:
+        # Top up from the last stored bar (inclusive, so a still-forming bar is refreshed)
+        with metrics.stage("upstream_fetch"):
+            hist = source(symbol, pd.Timestamp(state[1] or state[0]).to_pydatetime(), None, interval)
+        store_bars(symbol, interval, hist)
+        fetched = True
+    return fetched
+
+
+def _get_history(symbol: str, period: str, interval: str, force: bool = False) -> "pd.DataFrame":
+    start = period_start(period)
+    try:
+        sync(symbol, start, interval, force=force)
+    except Exception as e:
+        stored = load_bars(symbol, interval, _bar_key(start, interval))
+        if stored.empty:
+            raise
+        log.warning("market data refresh failed for %s %s, serving stored bars: %s", symbol, interval, e)
+        return stored
+    return load_bars(symbol, interval, _bar_key(start, interval))
+
+
+def _record_demand(symbol: str, period: str, interval: str):
+    """Count a request; the widest period asked for is kept so one refresh covers them all."""
+    try:
+        start = period_start(period)
+    except ValueError:
+        return
+    key = (symbol, interval)
+    with _demand_lock:
+        entry = _demand.get(key)
+        if entry is None:
+            if len(_demand) >= MARKET_DEMAND_KEYS:
+                del _demand[min(_demand, key=lambda k: _demand[k]["last"])]
+            entry = _demand[key] = {"period": period, "count": 0, "last": 0.0}
+        elif period != entry["period"] and start < period_start(entry["period"]):
+            entry["period"] = period
+        entry["count"] += 1
+        entry["last"] = time.time()
+
+
+def demand(since: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Requested (symbol, interval) keys, most requested first; ``since`` is a unix time cutoff."""
+    with _demand_lock:
+        rows = [{"symbol": k[0], "interval": k[1], **v} for k, v in _demand.items()
+                if since is None or v["last"] >= since]
+    rows.sort(key=lambda r: (-r["count"], -r["last"]))
+    return rows[:limit] if limit else rows
+
+
+def refresh_history(symbol: str, period: str = "1mo", interval: str = "1d") -> bool:
+    """Top up the store now regardless of ``MARKET_DATA_TTL`` (for background warming; not counted as demand).
+
+    Returns True if the upstream was hit.
+    """
+    symbol = normalize_symbol(symbol)
+    return _flight.do(("refresh", symbol, period, interval),
+                      functools.partial(sync, symbol, period_start(period), interval, True))
+
+
+def get_history(symbol: str, period: str = "1mo", interval: str = "1d", force: bool = False) -> "pd.DataFrame":
+    """Return OHLCV history for ``symbol`` over ``period`` at ``interval``, served from the local store.
+
+    Only missing bars are fetched upstream. If the upstream errors, whatever is
+    stored locally is returned; the error propagates only when nothing is stored.
+    Concurrent calls for the same key share one fetch, so treat the returned
+    frame as read-only.
+    """
+    symbol = normalize_symbol(symbol)
+    _record_demand(symbol, period, interval)
+    return _flight.do((symbol, period, interval), functools.partial(_get_history, symbol, period, interval, force))
+
+
+async def get_history_async(symbol: str, period: str = "1mo", interval: str = "1d", force: bool = False) -> "pd.DataFrame":
+    """``get_history`` for async callers: runs on the network pool, coalesced with any in-flight fetch."""
+    symbol = normalize_symbol(symbol)
+    _record_demand(symbol, period, interval)
+    # bind: the fetch keeps the request context, so its upstream_fetch stage is labelled with the endpoint
+    return await _flight.do_async(
+        (symbol, period, interval),
+        metrics.bind(functools.partial(_get_history, symbol, period, interval, force), "network"),
+        executor=get_pool("net"),
+    )
+
+
+def singleflight_stats():
+    """Counters for coalesced history fetches (calls, executions, coalesced, errors, in_flight)."""
+    return _flight.stats()
+
+
+
+def _get_fetch_pool() -> ThreadPoolExecutor:
+    global _fetch_pool
+    if _fetch_pool is None:
+        _fetch_pool = ThreadPoolExecutor(max_workers=max(1, MARKET_FETCH_CONCURRENCY), thread_name_prefix="md-fetch")
+    return _fetch_pool
+
+
+def get_history_many(
+    symbols: Iterable[str],
+    period: str = "1mo",
+    interval: str = "1d",
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[Dict[str, "pd.DataFrame"], Dict[str, str]]:
+    """Fetch history for many symbols concurrently.
+
+    At most ``concurrency`` symbols are in flight at once, and the whole batch
+    shares one deadline ``timeout`` seconds after the call. Returns
+    ``(results, errors)``: histories for the symbols that succeeded and an error
+    message per symbol that failed, so one bad ticker never sinks the batch. A
+    symbol still queued or running at the deadline is served from the local
+    store, or reported as timed out when nothing is stored. ``timeout`` bounds
+    the whole batch, not each symbol, so queued symbols cannot extend the wait.
+    Raises ValueError for an unsupported ``period`` before anything is fetched.
+    """
+    queue = list(dict.fromkeys(normalize_symbol(s) for s in symbols if normalize_symbol(s)))
+    results: Dict[str, "pd.DataFrame"] = {}
+    errors: Dict[str, str] = {}
+    if not queue:
+        return results, errors
+    period_start(period)
+    limit = max(1, concurrency or MARKET_FETCH_CONCURRENCY)
+    timeout = MARKET_FETCH_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    pool = _get_fetch_pool()
+
+    pending = {}
+    queue.reverse()
+    while queue or pending:
+        while queue and len(pending) < limit:
+            sym = queue.pop()
+            pending[pool.submit(metrics.bind(functools.partial(get_history, sym, period=period, interval=interval)))] = sym
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        done, _ = wait(list(pending), timeout=left, return_when=FIRST_COMPLETED)
+        for fut in done:
+            sym = pending.pop(fut)
+            try:
+                results[sym] = fut.result()
+            except Exception as e:
+                errors[sym] = str(e) or e.__class__.__name__
+    late = list(pending.values()) + queue
+    if not late:
+        return results, errors
+    # Past the deadline: running workers keep going in the background and their bars still land in the store
+    start_key = _bar_key(period_start(period), interval)
+    for sym in late:
+        stored = load_bars(sym, interval, start_key)
+        if stored.empty:
+            errors[sym] = f"timed out after {timeout:g}s"
+        else:
+            log.warning("market data fetch for %s %s timed out, serving stored bars", sym, interval)
+            results[sym] = stored
+    return results, errors
@@ -0,0 +1,333 @@
+"""In-process metrics in Prometheus text format, plus an opt-in slow-request profiler.
+
+- ``MetricsMiddleware`` (pure ASGI) records per-endpoint latency histograms,
+  request counts by status, the in-flight gauge and fastapi-cache hit/miss
+  (from the ``X-FastAPI-Cache`` header the ``@cache`` decorator sets).
+- ``stage(name)`` times a block into ``finscope_stage_seconds{endpoint, stage}``;
+  the endpoint is taken from the request being served, including work handed
+  to the executor pools. Stages: ``upstream_fetch``, ``db``, ``db_write``, ``model_fit``,
+  ``network`` (network-pool jobs) and ``serialize``.
+- With ``PROFILE_SLOW_MS`` set, a sampler thread snapshots thread stacks every
+  ``PROFILE_SAMPLE_MS`` and requests slower than the threshold keep a folded
+  stack profile, served at ``/debug/profiles``. A profile holds only samples
+  from the threads that served the request (the event loop, and pool threads
+  while running work handed over through ``bind``).
+
+``METRICS_ENABLED=0`` turns all of it into no-ops.
+"""
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally, deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+PROFILE_SAMPLE_MS = float(os.environ.get("PROFILE_SAMPLE_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ASGI scope of the request being served (routing fills in scope["route"])
+_current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("finscope_scope", default=None)
+# (thread id, start, end) of pool work done for the request, when profiling; filled in by ``bind``
+_current_spans: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("finscope_spans", default=None)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str):
+        self.inc(*labels, amount=-1.0)
+
+
+class CallbackGauge(Metric):
+    """Gauge whose samples are read when /metrics is scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Dict[Tuple[str, ...], float]], labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            items = sorted(self.fn().items())
+        except Exception:
+            items = []
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                # per-bucket counts (+Inf last), then sum and count
+                s = self._series[labels] = [0.0] * (len(self.buckets) + 3)
+            s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        out = self.header()
+        for labels, s in items:
+            running = 0.0
+            for le, n in zip(self.buckets + (float("inf"),), s):
+                running += n
+                le_label = 'le="+Inf"' if le == float("inf") else f'le="{le:g}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le_label)} {running:g}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {s[-2]:.6f}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {s[-1]:g}")
+        return out
+
+
+REGISTRY: List[Metric] = []
+
+
+def register(metric: Metric) -> Metric:
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = register(Histogram("finscope_http_request_duration_seconds", "Request latency by endpoint.", ("endpoint", "method")))
+REQUESTS = register(Counter("finscope_http_requests_total", "Requests by endpoint and status code.", ("endpoint", "method", "status")))
+IN_FLIGHT = register(Gauge("finscope_http_requests_in_flight", "Requests currently being served."))
+CACHE = register(Counter("finscope_cache_requests_total", "Response-cache lookups by endpoint and result.", ("endpoint", "result")))
+STAGE_SECONDS = register(Histogram("finscope_stage_seconds", "Time spent per stage of request handling.", ("endpoint", "stage")))
+POOL_IN_FLIGHT = register(Gauge("finscope_pool_tasks_in_flight", "Tasks queued or running per executor pool.", ("pool",)))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def endpoint_label(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, endpoint_label(_current_scope.get()), name)
+
+
+@contextmanager
+def _stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def stage(name: str):
+    """Context manager timing a block as stage ``name`` of the current request."""
+    return _stage(name) if METRICS_ENABLED else nullcontext()
+
+
+def _run_span(fn: Callable[[], Any]) -> Any:
+    """Call ``fn``, noting this thread and time span against the request in context (for the profiler)."""
+    spans = _current_spans.get()
+    if spans is None:
+        return fn()
+    t0 = time.time()
+    try:
+        return fn()
+    finally:
+        spans.append((threading.get_ident(), t0, time.time()))
+
+
+def bind(fn: Callable[[], Any], stage_name: Optional[str] = None) -> Callable[[], Any]:
+    """Wrap a zero-arg callable for another thread: it keeps the request context (and is timed as ``stage_name``)."""
+    if not METRICS_ENABLED:
+        return fn
+    ctx = contextvars.copy_context()
+    if stage_name is None:
+        return lambda: ctx.run(_run_span, fn)
+
+    def call():
+        t0 = time.perf_counter()
+        try:
+            return ctx.run(_run_span, fn)
+        finally:
+            ctx.run(observe_stage, stage_name, time.perf_counter() - t0)
+    return call
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (streaming responses pass straight through)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _current_scope.set(scope)
+        spans: list = []
+        spans_token = _current_spans.set(spans) if PROFILE_SLOW_MS > 0 else None
+        status = {"code": 500, "cache": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                for k, v in message.get("headers", ()):
+                    if k.lower() == b"x-fastapi-cache":
+                        status["cache"] = v.decode().lower()
+            await send(message)
+
+        IN_FLIGHT.inc()
+        loop_thread = threading.get_ident()
+        start = time.perf_counter()
+        wall_start = time.time()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            endpoint = endpoint_label(scope)
+            method = scope.get("method", "")
+            REQUEST_SECONDS.observe(elapsed, endpoint, method)
+            REQUESTS.inc(endpoint, method, str(status["code"]))
+            if status["cache"]:
+                CACHE.inc(endpoint, status["cache"])
+            if PROFILE_SLOW_MS > 0 and elapsed * 1000 >= PROFILE_SLOW_MS:
+                wall_end = time.time()
+                spans.append((loop_thread, wall_start, wall_end))
+                profiler.capture(endpoint, scope.get("path", ""), wall_start, wall_end, elapsed, spans)
+            if spans_token is not None:
+                _current_spans.reset(spans_token)
+            _current_scope.reset(token)
+
+
+# --- sampling profiler ---
+
+_IDLE_FUNCS = {"wait", "select", "poll", "epoll", "_worker", "get", "sleep", "accept", "_wait_for_tstate_lock"}
+
+
+class SamplingProfiler:
+    """Background stack sampler; keeps a short ring of samples to attribute to slow requests."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_MS, keep: int = PROFILE_KEEP, horizon_s: float = 120.0):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.samples: deque = deque(maxlen=int(horizon_s / self.interval))
+        self.profiles: deque = deque(maxlen=keep)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="finscope-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            for tid, frame in sys._current_frames().items():
+                if tid == me or frame.f_code.co_name in _IDLE_FUNCS:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 64:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples.append((now, tid, ";".join(reversed(stack))))
+
+    def capture(self, endpoint: str, path: str, start: float, end: float, elapsed: float,
+                spans: Optional[List[Tuple[int, float, float]]] = None):
+        """Keep the samples taken on the request's threads while they worked on it.
+
+        ``spans`` are (thread id, start, end): the event-loop thread for the whole
+        request plus pool threads entered through ``bind``. Without spans every
+        thread's samples in the window are kept. The event loop is shared, so its
+        samples can include other requests' coroutines.
+        """
+        def own(t: float, tid: int) -> bool:
+            return spans is None or any(s_tid == tid and s0 <= t <= s1 for s_tid, s0, s1 in spans)
+
+        stacks = _Tally(s for t, tid, s in list(self.samples) if start <= t <= end and own(t, tid))
+        self.profiles.append({
+            "endpoint": endpoint,
+            "path": path,
+            "at": end,
+            "duration_ms": round(elapsed * 1000, 1),
+            "samples": sum(stacks.values()),
+            "sample_interval_ms": self.interval * 1000,
+            "threads": "process" if spans is None else len({tid for tid, _, _ in spans}),
+            # Folded stacks (flamegraph.pl / speedscope input), heaviest first
+            "stacks": [{"stack": s, "count": n} for s, n in stacks.most_common(50)],
+        })
+
+    def recent(self) -> List[Dict[str, Any]]:
+        return list(self.profiles)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,162 @@
+"""Monte Carlo tail risk (VaR / CVaR / drawdown) for a weighted portfolio.
+
+Paths are generated in NumPy in chunks of at most ``MC_CHUNK_PATHS`` paths
+and ``MC_CHUNK_CELLS`` return cells, so memory stays bounded by the chunk, not
+the path count. Two modes:
+
+- ``bootstrap``: resample whole days of historical asset returns (keeps the
+  empirical cross-asset correlation and fat tails).
+- ``mvn``: draw correlated normal returns from the sample mean/covariance.
+
+Every chunk gets its own child of ``SeedSequence(seed)``, so results depend
+only on the inputs and ``seed``, whether chunks run inline or spread across
+the process pool.
+"""
+import os
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MC_CHUNK_PATHS = int(os.environ.get("MC_CHUNK_PATHS", "20000"))
+# Upper bound on simulated return cells (paths x days x assets) held per chunk (~8 bytes each)
+MC_CHUNK_CELLS = int(os.environ.get("MC_CHUNK_CELLS", "4000000"))
+MC_MAX_PATHS = int(os.environ.get("MC_MAX_PATHS", "1000000"))
+# Path counts at or above this are split across the process pool
+MC_PROC_PATHS = int(os.environ.get("MC_PROC_PATHS", "200000"))
+
+MODES = ("bootstrap", "mvn")
+MIN_OBSERVATIONS = 10
+
+
+def returns_matrix(closes: Dict[str, Any]) -> Tuple[List[str], np.ndarray]:
+    """Daily simple returns over the dates all series share -> (symbols, (T, k) array).
+
+    Accepts symbol -> pandas Series (aligned on the index) or plain price lists
+    (aligned on their most recent points).
+    """
+    import pandas as pd
+    closes = {s: c for s, c in closes.items() if c is not None and len(c)}
+    if not closes:
+        return [], np.empty((0, 0))
+    if all(isinstance(c, pd.Series) for c in closes.values()):
+        frame = pd.concat(closes, axis=1, join="inner").sort_index().astype(float)
+    else:
+        n = min(len(c) for c in closes.values())
+        frame = pd.DataFrame({s: np.asarray(c, dtype=np.float64)[-n:] for s, c in closes.items()})
+    rets = frame.pct_change().dropna()
+    return list(frame.columns), rets.to_numpy(dtype=np.float64)
+
+
+def _mvn_factor(cov: np.ndarray) -> np.ndarray:
+    """A matrix L with L @ L.T == cov (Cholesky, or eigen-decomposition if cov is only semi-definite)."""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        vals, vecs = np.linalg.eigh(cov)
+        return vecs * np.sqrt(np.clip(vals, 0.0, None))
+
+
+def simulate_chunk(returns: np.ndarray, weights: np.ndarray, horizon: int, n_paths: int,
+                   mode: str, seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Simulate ``n_paths`` portfolio paths -> (horizon returns, max drawdowns), both (n_paths,).
+
+    Module-level so it can run in the process pool.
+    """
+    rng = np.random.default_rng(seed)
+    if mode == "bootstrap":
+        # Weights are fixed, so resampling days of the portfolio return series is the same
+        # as resampling days of the asset matrix, at 1/k of the cost
+        port = returns @ weights
+        daily = port[rng.integers(0, port.size, size=(n_paths, horizon))]
+    else:
+        mu = returns.mean(axis=0)
+        factor = _mvn_factor(np.atleast_2d(np.cov(returns, rowvar=False)))
+        z = rng.standard_normal((n_paths, horizon, mu.size))
+        daily = (z @ factor.T + mu) @ weights
+    wealth = np.cumprod(1.0 + daily, axis=1)
+    peak = np.maximum(np.maximum.accumulate(wealth, axis=1), 1.0)
+    drawdown = (1.0 - wealth / peak).max(axis=1)
+    return wealth[:, -1] - 1.0, drawdown
+
+
+def _tail(losses: np.ndarray, level: float) -> Dict[str, float]:
+    var = float(np.quantile(losses, level))
+    tail = losses[losses >= var]
+    return {"var_pct": round(var * 100.0, 4), "cvar_pct": round(float(tail.mean()) * 100.0, 4)}
+
+
+def simulate(returns: np.ndarray, weights: Sequence[float], horizon: int = 21, n_paths: int = 10000,
+             mode: str = "bootstrap", levels: Sequence[float] = (0.95, 0.99), seed: Optional[int] = None,
+             executor: Optional[Executor] = None) -> Dict[str, Any]:
+    """Run the simulation and summarize the distribution of horizon returns and drawdowns.
+
+    VaR/CVaR are reported as positive loss percentages at each confidence ``level``.
+    Chunks are mapped over ``executor`` when one is given, otherwise run inline.
+    """
+    mode = (mode or "bootstrap").lower()
+    if mode not in MODES:
+        raise ValueError(f"Unsupported mode '{mode}'. Use one of {', '.join(MODES)}")
+    returns = np.asarray(returns, dtype=np.float64)
+    w = np.asarray(weights, dtype=np.float64)
+    if returns.ndim != 2 or returns.shape[1] != w.size:
+        raise ValueError("returns must be (observations, assets) matching weights")
+    if returns.shape[0] < MIN_OBSERVATIONS:
+        raise ValueError(f"Need at least {MIN_OBSERVATIONS} overlapping daily returns, got {returns.shape[0]}")
+    if not 1 <= n_paths <= MC_MAX_PATHS:
+        raise ValueError(f"n_paths must be between 1 and {MC_MAX_PATHS}")
+    if horizon < 1:
+        raise ValueError("horizon must be >= 1")
+    if any(not 0 < lv < 1 for lv in levels):
+        raise ValueError("levels must be between 0 and 1")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 63))
+
+    width = horizon * (w.size if mode == "mvn" else 1)
+    chunk = max(1, min(MC_CHUNK_PATHS, MC_CHUNK_CELLS // width))
+    sizes = [chunk] * (n_paths // chunk)
+    if n_paths % chunk:
+        sizes.append(n_paths % chunk)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = ([returns] * len(sizes), [w] * len(sizes), [horizon] * len(sizes), sizes, [mode] * len(sizes), seeds)
+    parts = list(executor.map(simulate_chunk, *args)) if executor is not None else list(map(simulate_chunk, *args))
+    ret = np.concatenate([p[0] for p in parts])
+    dd = np.concatenate([p[1] for p in parts])
+
+    losses = -ret
+    return {
+        "mode": mode,
+        "horizon_days": horizon,
+        "n_paths": n_paths,
+        "seed": seed,
+        "observations": int(returns.shape[0]),
+        "expected_return_pct": round(float(ret.mean()) * 100.0, 4),
+        "tail": {f"{lv:g}": _tail(losses, lv) for lv in levels},
+        "return_percentiles_pct": {f"p{q}": round(float(v) * 100.0, 4)
+                                   for q, v in zip((1, 5, 50, 95, 99), np.percentile(ret, (1, 5, 50, 95, 99)))},
+        "max_drawdown_pct": {
+            "mean": round(float(dd.mean()) * 100.0, 4),
+            **{f"p{q}": round(float(v) * 100.0, 4) for q, v in zip((50, 95, 99), np.percentile(dd, (50, 95, 99)))},
+        },
+    }
+
+
+def normalize_weights(weights: Dict[str, float], symbols: List[str]) -> np.ndarray:
+    """Weights for ``symbols`` scaled to sum to 1 (fractions of the invested portfolio)."""
+    w = np.array([float(weights.get(s, 0.0)) for s in symbols])
+    total = w.sum()
+    if total <= 0:
+        raise ValueError("Weights must sum to a positive number")
+    return w / total
+
+
+def portfolio_tail_risk(closes: Dict[str, Sequence[float]], weights: Optional[Dict[str, float]] = None,
+                        **kwargs) -> Dict[str, Any]:
+    """Tail risk for price histories keyed by symbol; equal-weighted when ``weights`` is omitted."""
+    symbols, rets = returns_matrix(closes)
+    if not symbols:
+        raise ValueError("No price history for portfolio symbols")
+    w = normalize_weights(weights if weights is not None else {s: 1.0 for s in symbols}, symbols)
+    out = simulate(rets, w, **kwargs)
+    out["weights"] = {s: round(float(x), 6) for s, x in zip(symbols, w)}
+    return out
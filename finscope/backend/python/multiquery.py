@@ -0,0 +1,167 @@
+"""Multi-metric timeseries queries aligned on a shared time axis.
+
+Each metric is read with its own ordered cursor (served by the (series, t)
+keys of each storage tier) and the cursors are k-way merged, so rows come out
+aligned without a sort or a full result in memory. Output formats:
+
+- ``json``   columnar: ``{"labels": [...], "columns": {metric: [...]}}``
+- ``ndjson`` streamed: a header object, then one ``[timestamp, v1, v2, ...]`` array per line
+- ``arrow``  streamed Arrow IPC record batches (requires ``pyarrow``)
+"""
+import heapq
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from db import TS_SQL_AGGS, iter_metric_points, open_reader, parse_epoch
+from downsample import epoch_labels, parse_bucket
+from executors import run_db
+
+FORMATS = ("json", "ndjson", "arrow")
+MAX_METRICS = 50
+# Aligned rows per streamed chunk (one DB-pool hop per chunk)
+STREAM_BATCH_ROWS = int(os.environ.get("TS_STREAM_BATCH", "2000"))
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+_START = object()
+
+
+def _tagged(points: Iterator[Tuple[Any, float]], idx: int) -> Iterator[Tuple[Any, int, float]]:
+    for key, value in points:
+        yield key, idx, value
+
+
+def aligned_rows(conn, metrics: List[str], start: Optional[str] = None, end: Optional[str] = None,
+                 bucket_secs: Optional[int] = None, agg: str = "avg",
+                 ffill: bool = False) -> Iterator[Tuple[Any, List[Optional[float]]]]:
+    """Yield ``(key, [value per metric])`` over the union of timestamps (or buckets), in time order.
+
+    Missing values are ``None``, or the metric's previous value when ``ffill``.
+    """
+    streams = [_tagged(iter_metric_points(conn, m, start, end, bucket_secs, agg), i) for i, m in enumerate(metrics)]
+    n = len(metrics)
+    last: List[Optional[float]] = [None] * n
+    key_now: Any = _START
+    row: List[Optional[float]] = []
+    for key, idx, value in heapq.merge(*streams, key=lambda p: (p[0], p[1])):
+        if key != key_now:
+            if key_now is not _START:
+                yield key_now, row
+            key_now = key
+            row = list(last) if ffill else [None] * n
+        row[idx] = value
+        if ffill and value is not None:
+            last[idx] = value
+    if key_now is not _START:
+        yield key_now, row
+
+
+class MultiQuery:
+    """Validated request parameters plus the row iterator they produce."""
+
+    def __init__(self, metrics: List[str], start: Optional[str] = None, end: Optional[str] = None,
+                 bucket: Optional[str] = None, agg: str = "avg", ffill: bool = False):
+        self.metrics = list(dict.fromkeys(m for m in metrics if m))
+        if not self.metrics:
+            raise ValueError("At least one metric is required")
+        if len(self.metrics) > MAX_METRICS:
+            raise ValueError(f"At most {MAX_METRICS} metrics per query")
+        self.agg = (agg or "avg").lower()
+        self.bucket = bucket
+        self.bucket_secs = parse_bucket(bucket) if bucket else None
+        if self.bucket_secs and self.agg not in TS_SQL_AGGS:
+            raise ValueError(f"Aligned buckets support agg in {', '.join(sorted(TS_SQL_AGGS))}")
+        for ts in (start, end):
+            if ts:
+                parse_epoch(ts)
+        self.start, self.end, self.ffill = start, end, ffill
+
+    def rows(self, conn) -> Iterator[Tuple[Any, List[Optional[float]]]]:
+        return aligned_rows(conn, self.metrics, self.start, self.end, self.bucket_secs, self.agg, self.ffill)
+
+    def labels(self, keys: List[Any]) -> List[str]:
+        return epoch_labels(keys).tolist()
+
+    def header(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"metrics": self.metrics, "columns": ["timestamp"] + self.metrics}
+        if self.bucket:
+            out.update(bucket=self.bucket, agg=self.agg)
+        return out
+
+
+def _take(it: Iterator, n: int) -> List:
+    out = []
+    for item in it:
+        out.append(item)
+        if len(out) >= n:
+            break
+    return out
+
+
+def columnar(q: MultiQuery) -> Dict[str, Any]:
+    """Materialize the aligned result as columnar JSON (for modest ranges)."""
+    conn = open_reader()
+    try:
+        keys: List[Any] = []
+        cols: List[List[Optional[float]]] = [[] for _ in q.metrics]
+        for key, row in q.rows(conn):
+            keys.append(key)
+            for col, v in zip(cols, row):
+                col.append(v)
+    finally:
+        conn.close()
+    out: Dict[str, Any] = {"metrics": q.metrics, "labels": q.labels(keys), "columns": dict(zip(q.metrics, cols))}
+    if q.bucket:
+        out.update(bucket=q.bucket, agg=q.agg)
+    return out
+
+
+async def _batches(q: MultiQuery) -> AsyncIterator[List[Tuple[Any, List[Optional[float]]]]]:
+    # The cursor is advanced on the DB pool, one chunk per hop; the dedicated connection
+    # tolerates the hops landing on different threads.
+    conn = await run_db(open_reader)
+    try:
+        it = q.rows(conn)
+        while True:
+            batch = await run_db(_take, it, STREAM_BATCH_ROWS)
+            if not batch:
+                break
+            yield batch
+    finally:
+        conn.close()
+
+
+async def stream_ndjson(q: MultiQuery) -> AsyncIterator[bytes]:
+    yield (json.dumps(q.header()) + "\n").encode()
+    async for batch in _batches(q):
+        labels = q.labels([k for k, _ in batch])
+        yield "".join(json.dumps([t, *row]) + "\n" for t, (_, row) in zip(labels, batch)).encode()
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def stream_arrow(q: MultiQuery) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+
+    ts_type = pa.timestamp("s", tz="UTC")
+    schema = pa.schema([("timestamp", ts_type)] + [(m, pa.float64()) for m in q.metrics])
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for batch in _batches(q):
+            keys = [k for k, _ in batch]
+            arrays = [pa.array(keys, type=ts_type)]
+            arrays += [pa.array([row[i] for _, row in batch], type=pa.float64()) for i in range(len(q.metrics))]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate(0)
+    # End-of-stream marker (and the schema, if there were no rows)
+    yield sink.getvalue()
@@ -0,0 +1,320 @@
+"""Response cache for the API: bounded LRU backend, normalized keys, stale-while-revalidate.
+
+``cached(expire, stale)`` replaces fastapi-cache's ``@cache`` on the endpoints:
+
+- Keys are built from the endpoint path and its validated arguments (query
+  params and POST bodies alike), normalized (symbols upper-cased, dict keys
+  sorted) and hashed, so ``spy``/``SPY`` or reordered JSON share one entry.
+- Responses are stored pre-serialized. For ``expire`` seconds they are
+  served as ``HIT``; for a further ``stale`` seconds they are served as
+  ``STALE`` immediately while one background task per key recomputes them.
+  Concurrent misses for the same key share a single computation.
+- Results carrying an ``error`` are not cached, nor are partial ones (non-empty
+  ``warnings`` or an agent status other than "ok", e.g. a degraded /report),
+  so a failed refresh keeps serving the previous (stale) entry. Responses other than a 200
+  ``FastJSONResponse`` are passed through uncached.
+- The response encoding (``serialization.encoding``: ``format`` param or
+  Accept header) is part of the key, and the media type is stored with the body.
+
+The store is whatever ``FastAPICache`` was initialized with: Redis when
+``REDIS_URL`` is set, otherwise ``LRUBackend``, bounded by
+``RESPONSE_CACHE_MAX_BYTES`` / ``RESPONSE_CACHE_MAX_ENTRIES``.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi_cache import FastAPICache
+from fastapi_cache.types import Backend
+from pydantic import BaseModel
+
+import metrics
+import serialization
+
+log = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+# Stale window as a multiple of ``expire`` when an endpoint does not set one (0 disables serving stale)
+RESPONSE_CACHE_STALE_FACTOR = float(os.environ.get("RESPONSE_CACHE_STALE_FACTOR", "1"))
+
+# Argument names whose values are ticker symbols (matched case-insensitively, also inside bodies)
+SYMBOL_KEYS = {"symbol", "symbols", "ticker", "tickers"}
+# Bodies whose keys are symbols (``{"portfolio": {"aapl": [...]}}``)
+SYMBOL_MAP_KEYS = {"portfolio"}
+
+EVICTIONS = metrics.register(metrics.Counter(
+    "finscope_response_cache_evictions_total", "Response-cache entries dropped, by reason.", ("reason",)))
+
+
+class LRUBackend(Backend):
+    """In-process fastapi-cache backend bounded by total bytes and entry count, least recently used out first."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max(1, max_bytes)
+        self.max_entries = max(1, max_entries)
+        # key -> (value, expires_at monotonic)
+        self._data: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evicted_capacity": 0, "evicted_expired": 0, "rejected": 0}
+
+    def _drop(self, key: str, reason: str):
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value) + len(key)
+        self._stats[f"evicted_{reason}"] += 1
+        EVICTIONS.inc(reason)
+
+    def _lookup(self, key: str) -> Optional[Tuple[bytes, float]]:
+        item = self._data.get(key)
+        if item is None:
+            self._stats["misses"] += 1
+            return None
+        if item[1] <= time.monotonic():
+            self._drop(key, "expired")
+            self._stats["misses"] += 1
+            return None
+        self._data.move_to_end(key)
+        self._stats["hits"] += 1
+        return item
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        item = self._lookup(key)
+        if item is None:
+            return 0, None
+        return max(0, int(item[1] - time.monotonic())), item[0]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._lookup(key)
+        return item[0] if item is not None else None
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        if isinstance(value, str):
+            value = value.encode()
+        size = len(value) + len(key)
+        if size > self.max_bytes:
+            self._stats["rejected"] += 1
+            return
+        if key in self._data:
+            old, _ = self._data.pop(key)
+            self._bytes -= len(old) + len(key)
+        expires = time.monotonic() + expire if expire else math.inf
+        self._data[key] = (value, expires)
+        self._bytes += size
+        self._stats["sets"] += 1
+        while self._bytes > self.max_bytes or len(self._data) > self.max_entries:
+            oldest = next(iter(self._data))
+            self._drop(oldest, "expired" if self._data[oldest][1] <= time.monotonic() else "capacity")
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        if key is not None:
+            keys = [key] if key in self._data else []
+        else:
+            keys = [k for k in self._data if not namespace or k.startswith(namespace)]
+        for k in keys:
+            value, _ = self._data.pop(k)
+            self._bytes -= len(value) + len(k)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, entries=len(self._data), bytes=self._bytes,
+                    max_bytes=self.max_bytes, max_entries=self.max_entries)
+
+
+def normalize(value: Any, name: Optional[str] = None) -> Any:
+    """Canonical, JSON-able form of an endpoint argument for cache keys."""
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    lname = name.lower() if isinstance(name, str) else None
+    if isinstance(value, str):
+        return value.strip().upper() if lname in SYMBOL_KEYS else value
+    if isinstance(value, dict):
+        if lname in SYMBOL_MAP_KEYS:
+            return {str(k).strip().upper(): normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]).strip().upper())}
+        return {str(k): normalize(v, k) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        # A list keeps its parent's name, so "symbols": ["spy"] is normalized too
+        return [normalize(v, name) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return jsonable_encoder(value)
+
+
+def cache_key(path: str, arguments: Dict[str, Any]) -> str:
+    canonical = json.dumps(normalize(arguments), sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(canonical.encode()).hexdigest()[:32]
+    return f"{FastAPICache.get_prefix()}:{path}:{digest}"
+
+
+def _pack(body: bytes, etag: str, media_type: str) -> bytes:
+    return f"{time.time():.3f} {etag} {media_type}\n".encode() + body
+
+
+def _unpack(raw: Any) -> Tuple[float, str, str, bytes]:
+    if isinstance(raw, str):
+        raw = raw.encode()
+    head, _, body = raw.partition(b"\n")
+    # Entries written before the media type was stored have two fields
+    stored_at, etag, media_type = (head.decode().split(" ", 2) + [serialization.JSON_MEDIA_TYPE])[:3]
+    return float(stored_at), etag, media_type, body
+
+
+def _serialize(content: Any) -> bytes:
+    with metrics.stage("serialize"):
+        return serialization.dumps(content)
+
+
+_inflight: Dict[str, asyncio.Task] = {}
+_stats = {"hit": 0, "stale": 0, "miss": 0, "refreshes": 0, "refresh_errors": 0, "coalesced": 0, "uncacheable": 0}
+
+
+def _partial(result: dict) -> bool:
+    """True for a degraded result (non-empty ``warnings`` or an agent not "ok", also under ``report``).
+
+    Such a result reflects a transient failure and must not be pinned for every caller.
+    """
+    for part in (result, result.get("report")):
+        if not isinstance(part, dict):
+            continue
+        agents = part.get("agents")
+        if part.get("warnings") or (isinstance(agents, dict) and any(s != "ok" for s in agents.values())):
+            return True
+    return False
+
+
+def _rendered(result: Any) -> Optional[Tuple[bytes, str]]:
+    """``(body, media_type)`` to store for an endpoint result, or None when it must not be cached."""
+    if isinstance(result, serialization.FastJSONResponse):
+        return (result.body, result.media_type) if result.status_code == 200 else None
+    if isinstance(result, Response) or (isinstance(result, dict) and ("error" in result or _partial(result))):
+        return None
+    return _serialize(result), serialization.JSON_MEDIA_TYPE
+
+
+async def _compute(key: str, fn: Callable, args, kwargs, ttl: int) -> Tuple[Any, Optional[bytes], Optional[str], Optional[str]]:
+    """Run the endpoint and store its response; returns ``(result, body, etag, media_type)`` (body None when not cached)."""
+    result = await fn(*args, **kwargs)
+    rendered = _rendered(result)
+    if rendered is None:
+        _stats["uncacheable"] += 1
+        return result, None, None, None
+    body, media_type = rendered
+    etag = 'W/"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    try:
+        await FastAPICache.get_backend().set(key, _pack(body, etag, media_type), ttl)
+    except Exception as e:
+        log.warning("response cache write failed for %s: %s", key, e)
+    return result, body, etag, media_type
+
+
+def _single(key: str, fn: Callable, args, kwargs, ttl: int) -> "asyncio.Task":
+    """The in-flight computation for ``key``, started if there is none."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_compute(key, fn, args, kwargs, ttl))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None))
+    else:
+        _stats["coalesced"] += 1
+    return task
+
+
+def _refresh(key: str, fn: Callable, args, kwargs, ttl: int):
+    if key in _inflight:
+        return
+    _stats["refreshes"] += 1
+
+    def done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None or task.result()[1] is None:
+            _stats["refresh_errors"] += 1
+            log.warning("background refresh of %s failed: %s", key, exc or "uncacheable result")
+    _single(key, fn, args, kwargs, ttl).add_done_callback(done)
+
+
+def _respond(body: bytes, etag: str, media_type: str, status: str, max_age: int, request: Request) -> Response:
+    headers = {"X-FastAPI-Cache": status, "Cache-Control": f"max-age={max(0, max_age)}", "ETag": etag, "Vary": "Accept"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def cached(expire: int, stale: Optional[int] = None):
+    """Cache an endpoint's JSON response for ``expire`` seconds, then serve it stale for ``stale`` more while refreshing."""
+    stale = int(expire * RESPONSE_CACHE_STALE_FACTOR) if stale is None else stale
+
+    def decorator(fn: Callable):
+        sig = inspect.signature(fn)
+        request_param = next((p.name for p in sig.parameters.values() if p.annotation is Request), None)
+        params = list(sig.parameters.values())
+        if request_param is None:
+            params.append(inspect.Parameter("_cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs[request_param] if request_param else kwargs.pop("_cache_request")
+            for k, v in kwargs.items():
+                if k.lower() in SYMBOL_KEYS and isinstance(v, str):
+                    kwargs[k] = v.strip().upper()
+            directives = request.headers.get("cache-control", "").lower()
+            if not FastAPICache._init or "no-store" in directives:
+                return await fn(*args, **kwargs)
+            # ``format`` is folded into the negotiated encoding, so ?format=compact and the Accept header share an entry
+            arguments = {k: v for k, v in kwargs.items() if k not in (request_param, "format")}
+            arguments["_encoding"] = serialization.encoding(request)
+            key = cache_key(request.url.path, arguments)
+            ttl = expire + stale
+            raw = None
+            if "no-cache" not in directives:
+                try:
+                    raw = await FastAPICache.get_backend().get(key)
+                except Exception as e:
+                    log.warning("response cache read failed for %s: %s", key, e)
+            if raw is not None:
+                stored_at, etag, media_type, body = _unpack(raw)
+                age = time.time() - stored_at
+                if age < expire:
+                    _stats["hit"] += 1
+                    return _respond(body, etag, media_type, "HIT", int(expire - age), request)
+                if age < ttl:
+                    _stats["stale"] += 1
+                    _refresh(key, fn, args, kwargs, ttl)
+                    return _respond(body, etag, media_type, "STALE", 0, request)
+            _stats["miss"] += 1
+            result, body, etag, media_type = await asyncio.shield(_single(key, fn, args, kwargs, ttl))
+            if body is None:
+                return result
+            return _respond(body, etag, media_type, "MISS", expire, request)
+
+        wrapper.__signature__ = sig.replace(parameters=params)
+        return wrapper
+    return decorator
+
+
+def stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = dict(_stats, in_flight=len(_inflight))
+    backend = FastAPICache._backend
+    out["backend"] = backend.stats() if isinstance(backend, LRUBackend) else type(backend).__name__ if backend else None
+    return out
+
+
+def _backend_gauge() -> Dict[Tuple[str, ...], float]:
+    backend = FastAPICache._backend
+    if not isinstance(backend, LRUBackend):
+        return {}
+    return {("bytes",): backend._bytes, ("entries",): len(backend._data)}
+
+
+metrics.register(metrics.CallbackGauge(
+    "finscope_response_cache_size", "In-process response-cache size (bytes and entries).", _backend_gauge, ("unit",)))
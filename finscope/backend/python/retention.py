@@ -0,0 +1,200 @@
+"""Retention, tiered rollups and compaction for stored timeseries.
+
+Each metric keeps raw points for ``raw_days``, hourly buckets for
+``hourly_days`` and daily buckets for ``daily_days`` (0 keeps a tier forever).
+Defaults come from ``TS_*_RETENTION_DAYS``; per-metric overrides live in the
+``ts_retention`` table (``PUT /timeseries/retention``). A bucket keeps count,
+sum, min, max and its first/last values, so every query aggregation can still
+be answered from it.
+
+``run()`` (every ``TS_MAINTENANCE_SECONDS``) walks the series. Raw points older
+than the raw cutoff are folded into hourly buckets and deleted. Hourly buckets
+older than the hourly cutoff are folded into daily ones, and expired daily
+buckets are dropped. Each step is a ``writer`` job of at most about
+``TS_ROLLUP_BATCH`` rows, so maintenance interleaves with ingest instead of
+holding the write lock. The same job moves the series' ``raw_from`` /
+``hourly_from`` boundary, so a query sees every range exactly once. Points that
+arrive late for a range already rolled up are merged into its bucket on the next
+run. Last, ``PRAGMA incremental_vacuum`` gives up to ``TS_VACUUM_PAGES`` freed
+pages back to the filesystem.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import db
+from executors import run_db
+from writer import writer
+
+log = logging.getLogger(__name__)
+
+TS_RAW_RETENTION_DAYS = float(os.environ.get("TS_RAW_RETENTION_DAYS", "30"))
+TS_HOURLY_RETENTION_DAYS = float(os.environ.get("TS_HOURLY_RETENTION_DAYS", "365"))
+TS_DAILY_RETENTION_DAYS = float(os.environ.get("TS_DAILY_RETENTION_DAYS", "0"))
+# Seconds between maintenance runs (0 disables the background job)
+TS_MAINTENANCE_SECONDS = float(os.environ.get("TS_MAINTENANCE_SECONDS", "3600"))
+# Rows folded per writer job
+TS_ROLLUP_BATCH = int(os.environ.get("TS_ROLLUP_BATCH", "20000"))
+TS_VACUUM_PAGES = int(os.environ.get("TS_VACUUM_PAGES", "5000"))
+
+HOUR, DAY = 3600, 86400
+TIERS = ("raw_days", "hourly_days", "daily_days")
+
+# Folding a late batch into an existing bucket
+_MERGE = """
+ON CONFLICT(series_id, tier, t) DO UPDATE SET
+  n = n + excluded.n,
+  sum = CASE WHEN sum IS NULL THEN excluded.sum WHEN excluded.sum IS NULL THEN sum ELSE sum + excluded.sum END,
+  min = COALESCE(MIN(min, excluded.min), min, excluded.min),
+  max = COALESCE(MAX(max, excluded.max), max, excluded.max),
+  first = CASE WHEN excluded.first_t < first_t THEN excluded.first ELSE first END,
+  first_t = MIN(first_t, excluded.first_t),
+  last = CASE WHEN excluded.last_t >= last_t THEN excluded.last ELSE last END,
+  last_t = MAX(last_t, excluded.last_t)
+"""
+
+_ROLL_RAW = """
+INSERT INTO ts_rollups(series_id, tier, t, n, sum, min, max, first, first_t, last, last_t)
+SELECT g.series_id, 3600, g.b, g.n, g.total, g.lo, g.hi,
+       (SELECT value FROM ts_points WHERE series_id = g.series_id AND t = g.first_t), g.first_t,
+       (SELECT value FROM ts_points WHERE series_id = g.series_id AND t = g.last_t), g.last_t
+  FROM (SELECT series_id, (t / 3600) * 3600 AS b, COUNT(value) AS n, SUM(value) AS total,
+               MIN(value) AS lo, MAX(value) AS hi, MIN(t) AS first_t, MAX(t) AS last_t
+          FROM ts_points WHERE series_id = ? AND t < ? GROUP BY b) AS g
+ WHERE true
+""" + _MERGE
+
+_ROLL_HOURLY = """
+INSERT INTO ts_rollups(series_id, tier, t, n, sum, min, max, first, first_t, last, last_t)
+SELECT g.series_id, 86400, g.b, g.n, g.total, g.lo, g.hi,
+       (SELECT first FROM ts_rollups WHERE series_id = g.series_id AND tier = 3600 AND t = (g.first_t / 3600) * 3600), g.first_t,
+       (SELECT last FROM ts_rollups WHERE series_id = g.series_id AND tier = 3600 AND t = (g.last_t / 3600) * 3600), g.last_t
+  FROM (SELECT series_id, (t / 86400) * 86400 AS b, SUM(n) AS n, SUM(sum) AS total,
+               MIN(min) AS lo, MAX(max) AS hi, MIN(first_t) AS first_t, MAX(last_t) AS last_t
+          FROM ts_rollups WHERE series_id = ? AND tier = 3600 AND t < ? GROUP BY b) AS g
+ WHERE true
+""" + _MERGE
+
+# Source rows of each fold: (table filter, rolled-up SQL, boundary column, bucket width)
+_STEPS = {
+    "raw": ("FROM ts_points WHERE series_id = ?", _ROLL_RAW, "raw_from", HOUR),
+    "hourly": ("FROM ts_rollups WHERE series_id = ? AND tier = 3600", _ROLL_HOURLY, "hourly_from", DAY),
+}
+
+_lock: Optional[asyncio.Lock] = None
+_stats: Dict[str, Any] = {"runs": 0, "last_run": None}
+
+
+def defaults() -> Dict[str, float]:
+    return {"raw_days": TS_RAW_RETENTION_DAYS, "hourly_days": TS_HOURLY_RETENTION_DAYS,
+            "daily_days": TS_DAILY_RETENTION_DAYS}
+
+
+def validate(policy: Dict[str, Optional[float]]) -> Dict[str, float]:
+    """Fill a partial policy from the defaults; a tier must not expire before the one rolled into it."""
+    out = {k: float(policy[k]) if policy.get(k) is not None else v for k, v in defaults().items()}
+    if any(v < 0 for v in out.values()):
+        raise ValueError("Retention days must be >= 0 (0 keeps a tier forever)")
+    for shorter, longer in (("raw_days", "hourly_days"), ("hourly_days", "daily_days")):
+        if out[shorter] and out[longer] and out[shorter] > out[longer]:
+            raise ValueError(f"{longer} must be 0 (forever) or at least {shorter}")
+    return out
+
+
+def policies() -> Dict[str, Dict[str, Optional[float]]]:
+    """Per-metric overrides as stored (None: the default)."""
+    with db.get_conn(readonly=True) as c:
+        rows = c.execute(f"SELECT metric, {', '.join(TIERS)} FROM ts_retention ORDER BY metric").fetchall()
+    return {r[0]: dict(zip(TIERS, r[1:])) for r in rows}
+
+
+def set_policy(c, metric: str, policy: Dict[str, Optional[float]]):
+    """Writer job: store ``metric``'s overrides (all None removes them)."""
+    if all(policy.get(k) is None for k in TIERS):
+        c.execute("DELETE FROM ts_retention WHERE metric=?", (metric,))
+        return
+    c.execute(
+        f"INSERT INTO ts_retention(metric, {', '.join(TIERS)}) VALUES(?,?,?,?) "
+        "ON CONFLICT(metric) DO UPDATE SET raw_days=excluded.raw_days, hourly_days=excluded.hourly_days, "
+        "daily_days=excluded.daily_days",
+        (metric, *(policy.get(k) for k in TIERS)),
+    )
+
+
+def cutoffs(policy: Dict[str, float], now: float) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Epochs before which raw points are rolled up, hourly buckets are rolled up and daily buckets are dropped (None: never)."""
+    def before(days: float, align: int) -> Optional[int]:
+        return int(now - days * DAY) // align * align if days else None
+
+    raw = before(policy["raw_days"], HOUR)
+    hourly = before(policy["hourly_days"], DAY) if raw is not None else None
+    if hourly is None:
+        return raw, None, None
+    return raw, min(hourly, raw // DAY * DAY), before(policy["daily_days"], DAY)
+
+
+def fold(c, step: str, sid: int, cutoff: int, batch: int) -> Tuple[int, bool]:
+    """Writer job: fold the oldest ~``batch`` rows of one tier before ``cutoff`` into the next; returns (rows, more left)."""
+    source, sql, boundary, width = _STEPS[step]
+    first = c.execute(f"SELECT MIN(t) {source} AND t < ?", (sid, cutoff)).fetchone()[0]
+    if first is None:
+        return 0, False
+    nth = c.execute(f"SELECT t {source} AND t < ? ORDER BY t LIMIT 1 OFFSET ?", (sid, cutoff, batch)).fetchone()
+    # Whole buckets only, and at least the first one even when it alone holds more than a batch
+    upto = cutoff if nth is None else min(cutoff, max(nth[0] // width * width, first // width * width + width))
+    c.execute(sql, (sid, upto))
+    n = c.execute(f"DELETE {source} AND t < ?", (sid, upto)).rowcount
+    c.execute(f"UPDATE ts_series SET {boundary} = MAX({boundary}, ?) WHERE id = ?", (upto, sid))
+    return n, upto < cutoff
+
+
+def expire(c, sid: int, cutoff: int) -> int:
+    """Writer job: drop the series' daily buckets before ``cutoff``."""
+    return c.execute("DELETE FROM ts_rollups WHERE series_id = ? AND tier = 86400 AND t < ?", (sid, cutoff)).rowcount
+
+
+def _series():
+    with db.get_conn(readonly=True) as c:
+        return c.execute("SELECT id, metric FROM ts_series ORDER BY id").fetchall()
+
+
+async def run() -> Dict[str, Any]:
+    """One maintenance pass over every series; returns what it did (also kept for ``stats()``)."""
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        t0 = time.perf_counter()
+        now = time.time()
+        overrides = await run_db(policies)
+        out: Dict[str, Any] = {"series": 0, "raw_rolled": 0, "hourly_rolled": 0, "daily_expired": 0, "errors": {}}
+        for sid, metric in await run_db(_series):
+            out["series"] += 1
+            try:
+                raw, hourly, daily = cutoffs(validate(overrides.get(metric, {})), now)
+            except ValueError as e:
+                # A stored override that no longer fits the defaults; leave the metric alone
+                out["errors"][metric] = str(e)
+                continue
+            for step, cutoff in (("raw", raw), ("hourly", hourly)):
+                more = cutoff is not None
+                while more:
+                    n, more = await writer.write(fold, step, sid, cutoff, TS_ROLLUP_BATCH)
+                    out[f"{step}_rolled"] += n
+            if daily is not None:
+                out["daily_expired"] += await writer.write(expire, sid, daily)
+        out["vacuumed_pages"] = await run_db(db.incremental_vacuum, TS_VACUUM_PAGES)
+        out["storage"] = await run_db(db.storage_stats)
+        out["seconds"] = round(time.perf_counter() - t0, 3)
+        out["finished_at"] = time.time()
+        _stats["runs"] += 1
+        _stats["last_run"] = out
+        if out["raw_rolled"] or out["hourly_rolled"] or out["daily_expired"]:
+            log.info("timeseries maintenance: %s", out)
+        return out
+
+
+def stats() -> Dict[str, Any]:
+    return dict(_stats, running=_lock is not None and _lock.locked())
@@ -0,0 +1,195 @@
+"""Background refresh scheduler that keeps hot market data warm.
+
+Jobs are async callables run on an interval with random jitter; a failing
+job backs off exponentially (capped) and recovers on its own. The app
+registers:
+
+- one job per warm ticker: the configured ``WARM_TICKERS`` plus the
+  (symbol, interval) keys callers actually request (``market_data.demand``),
+  refreshed every ``WARM_REFRESH_SECONDS`` -- shorter than
+  ``MARKET_DATA_TTL`` -- so user requests find fresh bars in the local store
+  instead of waiting on the upstream;
+- any ``extra`` jobs passed to ``setup``.
+
+Jobs that must run whatever ``WARM_ENABLED`` says (the sector model behind
+/simulate, timeseries maintenance) live on main's separate ``maintenance``
+scheduler.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import market_data
+from executors import run_net
+
+log = logging.getLogger(__name__)
+
+# "SYMBOL" or "SYMBOL:period", comma separated; the period should cover what endpoints ask for
+WARM_TICKERS = os.environ.get("WARM_TICKERS", "SPY:1y,QQQ:1y,DIA:1y,BND:1y,IEF:1y,SHY:1y,BTC-USD:1y,^VIX:6mo")
+WARM_REFRESH_SECONDS = float(os.environ.get("WARM_REFRESH_SECONDS", str(market_data.MARKET_DATA_TTL * 0.8)))
+WARM_JITTER = float(os.environ.get("WARM_JITTER", "0.1"))
+WARM_CONCURRENCY = int(os.environ.get("WARM_CONCURRENCY", "4"))
+# Requested keys seen within this window (seconds) are kept warm, up to WARM_DEMAND_LIMIT of them
+WARM_DEMAND_WINDOW = float(os.environ.get("WARM_DEMAND_WINDOW", "3600"))
+WARM_DEMAND_LIMIT = int(os.environ.get("WARM_DEMAND_LIMIT", "50"))
+WARM_DEMAND_SYNC_SECONDS = float(os.environ.get("WARM_DEMAND_SYNC_SECONDS", "60"))
+WARM_BACKOFF_MAX = float(os.environ.get("WARM_BACKOFF_MAX", "1800"))
+WARM_ENABLED = os.environ.get("WARM_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def parse_tickers(spec: str, default_period: str = "1y") -> List[Tuple[str, str]]:
+    """``"SPY:1y,QQQ"`` -> ``[("SPY", "1y"), ("QQQ", default_period)]``."""
+    out = []
+    for item in (spec or "").split(","):
+        sym, _, period = item.strip().partition(":")
+        if sym.strip():
+            out.append((market_data.normalize_symbol(sym), period.strip() or default_period))
+    return out
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[], Awaitable[Any]], interval: float,
+                 jitter: float = WARM_JITTER, pinned: bool = True, start_in: Optional[float] = None):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        # Unpinned jobs come from observed demand and are dropped when it goes away
+        self.pinned = pinned
+        if start_in is None:
+            # Soon, but spread out so jobs registered together do not fire together
+            start_in = random.uniform(0, min(interval * jitter, 5.0))
+        self.next_run = time.monotonic() + start_in
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_ok: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def delay(self) -> float:
+        base = self.interval if not self.failures else min(WARM_BACKOFF_MAX, self.interval * 2 ** self.failures)
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_ok": self.last_ok,
+            "last_error": self.last_error,
+            "next_in": round(max(0.0, self.next_run - time.monotonic()), 1),
+        }
+
+
+class Scheduler:
+    def __init__(self, concurrency: int = WARM_CONCURRENCY):
+        self.jobs: Dict[str, Job] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._concurrency = max(1, concurrency)
+        self._wake: Optional[asyncio.Event] = None
+
+    def add(self, name: str, fn: Callable[[], Awaitable[Any]], interval: float,
+            jitter: float = WARM_JITTER, pinned: bool = True, start_in: Optional[float] = None) -> Job:
+        job = self.jobs.get(name)
+        if job is None:
+            job = self.jobs[name] = Job(name, fn, interval, jitter, pinned, start_in)
+            if self._wake is not None:
+                self._wake.set()
+        return job
+
+    def remove(self, name: str):
+        self.jobs.pop(name, None)
+
+    async def _run(self, job: Job):
+        try:
+            async with self._sem:
+                await job.fn()
+            job.failures = 0
+            job.last_ok = time.time()
+            job.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e) or e.__class__.__name__
+            log.warning("scheduled job %s failed (%d in a row): %s", job.name, job.failures, job.last_error)
+        finally:
+            job.runs += 1
+            job.running = False
+            job.next_run = time.monotonic() + job.delay()
+
+    async def run(self):
+        """Main loop: start due jobs, then sleep until the next one is due (or a job is added)."""
+        self._sem = asyncio.Semaphore(self._concurrency)
+        self._wake = asyncio.Event()
+        tasks = set()
+        try:
+            while True:
+                now = time.monotonic()
+                for job in list(self.jobs.values()):
+                    if not job.running and job.next_run <= now:
+                        job.running = True
+                        task = asyncio.create_task(self._run(job))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                idle = [j.next_run for j in self.jobs.values() if not j.running]
+                timeout = min(60.0, max(0.05, min(idle) - time.monotonic())) if idle else 60.0
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: job.info() for name, job in sorted(self.jobs.items())}
+
+
+def _ticker_job_name(symbol: str, interval: str) -> str:
+    return f"history:{symbol}:{interval}"
+
+
+def add_ticker(sched: Scheduler, symbol: str, period: str, interval: str = "1d", pinned: bool = True,
+               start_in: Optional[float] = None) -> Job:
+    async def refresh():
+        await run_net(market_data.refresh_history, symbol, period, interval)
+    return sched.add(_ticker_job_name(symbol, interval), refresh, WARM_REFRESH_SECONDS, pinned=pinned, start_in=start_in)
+
+
+def sync_demand(sched: Scheduler):
+    """Warm the most requested keys of the last ``WARM_DEMAND_WINDOW`` seconds; drop ones no longer asked for.
+
+    Only the top-up matters once a key is warm: history further back than the
+    refresh period was already backfilled by the request that asked for it.
+    """
+    wanted = {}
+    for row in market_data.demand(since=time.time() - WARM_DEMAND_WINDOW, limit=WARM_DEMAND_LIMIT):
+        wanted[_ticker_job_name(row["symbol"], row["interval"])] = row
+    for name, job in list(sched.jobs.items()):
+        if name.startswith("history:") and not job.pinned and name not in wanted:
+            sched.remove(name)
+    for name, row in wanted.items():
+        if name not in sched.jobs:
+            # The request that created the demand just refreshed it; the first top-up is due one interval later
+            start_in = max(0.0, row["last"] + WARM_REFRESH_SECONDS - time.time())
+            add_ticker(sched, row["symbol"], row["period"], row["interval"], pinned=False, start_in=start_in)
+
+
+def setup(sched: Scheduler, extra: Optional[Dict[str, Tuple[Callable[[], Awaitable[Any]], float]]] = None):
+    """Register the warm tickers, the demand tracker and any ``extra`` ``name -> (fn, interval)`` jobs."""
+    for symbol, period in parse_tickers(WARM_TICKERS):
+        add_ticker(sched, symbol, period)
+
+    async def demand_job():
+        sync_demand(sched)
+    sched.add("demand", demand_job, WARM_DEMAND_SYNC_SECONDS, start_in=WARM_DEMAND_SYNC_SECONDS)
+    for name, (fn, interval) in (extra or {}).items():
+        sched.add(name, fn, interval)
+
+
+scheduler = Scheduler()
@@ -0,0 +1,153 @@
+"""Precomputed sector return/covariance model for /simulate.
+
+The daily-return mean vector and covariance matrix of the sector ETFs are
+rebuilt by the maintenance scheduler every ``SECTOR_REFRESH_SECONDS`` from the
+local bar store, so a simulation is a few in-memory NumPy products: portfolio
+return is ``w @ mu`` and risk is ``sqrt(w @ cov @ w)``, which accounts for
+correlation between sectors. Weights are percentages of the portfolio; any remainder is
+treated as cash (no return, no risk).
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+from executors import run_net
+from market_data import get_history_many
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SECTOR_ETF = {
+    "tech": "XLK",
+    "energy": "XLE",
+    "healthcare": "XLV",
+    "financials": "XLF",
+    "industrials": "XLI",
+    "materials": "XLB",
+    "utilities": "XLU",
+    "real_estate": "XLRE",
+    "consumer_discretionary": "XLY",
+    "consumer_staples": "XLP",
+    "communication": "XLC",
+}
+
+SECTOR_PERIOD = os.environ.get("SECTOR_PERIOD", "3mo")
+SECTOR_REFRESH_SECONDS = float(os.environ.get("SECTOR_REFRESH_SECONDS", "3600"))
+
+
+class SectorModel:
+    """Immutable snapshot: sectors, mean daily returns, covariance of daily returns."""
+
+    def __init__(self, sectors: List[str], mu: np.ndarray, cov: np.ndarray, n_obs: int,
+                 as_of: str, errors: Optional[Dict[str, str]] = None):
+        self.sectors = sectors
+        self.index = {s: i for i, s in enumerate(sectors)}
+        self.mu = mu
+        self.cov = cov
+        self.n_obs = n_obs
+        self.as_of = as_of
+        self.errors = errors or {}
+
+    @classmethod
+    def from_closes(cls, closes: Dict[str, "pd.Series"], errors: Optional[Dict[str, str]] = None) -> "SectorModel":
+        """Build from per-sector close series; returns are taken over the dates all sectors share."""
+        import pandas as pd
+        frame = pd.concat(closes, axis=1, join="inner").sort_index()
+        rets = frame.pct_change().dropna()
+        if len(rets) < 2:
+            raise ValueError("Not enough overlapping history for sector ETFs")
+        arr = rets.to_numpy(dtype=np.float64)
+        return cls(
+            sectors=list(frame.columns),
+            mu=arr.mean(axis=0),
+            cov=np.atleast_2d(np.cov(arr, rowvar=False)),
+            n_obs=len(rets),
+            as_of=datetime.now(timezone.utc).isoformat(),
+            errors=errors,
+        )
+
+    def vector(self, weights: Dict[str, float]) -> np.ndarray:
+        """Sector -> percent mapping as a weight vector (fractions) in model order."""
+        w = np.zeros(len(self.sectors))
+        for sector, pct in weights.items():
+            key = sector.lower()
+            if key not in self.index:
+                if key in SECTOR_ETF:
+                    raise ValueError(f"No data for sector '{sector}' ({SECTOR_ETF[key]})")
+                raise ValueError(f"Unknown sector '{sector}'. Use keys like {', '.join(list(SECTOR_ETF)[:4])}, ...")
+            w[self.index[key]] += float(pct) / 100.0
+        return w
+
+    def stats(self, w: np.ndarray) -> Dict[str, float]:
+        """Expected daily return and volatility (percent) of a weight vector."""
+        return {
+            "return_pct": float(w @ self.mu) * 100.0,
+            "risk_pct": float(np.sqrt(max(float(w @ self.cov @ w), 0.0))) * 100.0,
+        }
+
+    def compare(self, before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Any]:
+        w0, w1 = self.vector(before), self.vector(after)
+        if (w0 < -1e-12).any() or (w1 < -1e-12).any():
+            raise ValueError("Allocations must be non-negative")
+        s0, s1 = self.stats(w0), self.stats(w1)
+        return {
+            "expected_risk_change_pct": round(s1["risk_pct"] - s0["risk_pct"], 2),
+            "expected_return_change_pct": round(s1["return_pct"] - s0["return_pct"], 2),
+            "before": {k: round(v, 4) for k, v in s0.items()},
+            "after": {k: round(v, 4) for k, v in s1.items()},
+            "model": {"as_of": self.as_of, "observations": self.n_obs},
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {"sectors": len(self.sectors), "observations": self.n_obs, "as_of": self.as_of, "errors": self.errors}
+
+
+def apply_shifts(weights: Dict[str, float], shifts: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Move ``shift_pct`` points from ``from_sector`` to ``to_sector`` for each shift, in order."""
+    out = {k.lower(): float(v) for k, v in weights.items()}
+    for s in shifts:
+        pct = float(s.get("shift_pct", 0.0))
+        src, dst = str(s.get("from_sector", "")).lower(), str(s.get("to_sector", "")).lower()
+        if out.get(src, 0.0) + 1e-9 < pct:
+            raise ValueError(f"Cannot shift {pct}% out of {src}: only {out.get(src, 0.0)}% allocated")
+        out[src] = out.get(src, 0.0) - pct
+        out[dst] = out.get(dst, 0.0) + pct
+    return out
+
+
+_model: Optional[SectorModel] = None
+_refresh_lock: Optional[asyncio.Lock] = None
+
+
+def current() -> Optional[SectorModel]:
+    return _model
+
+
+async def refresh() -> SectorModel:
+    """Rebuild the model from the bar store (fetching only what is stale) and swap it in."""
+    global _model
+    symbols = list(SECTOR_ETF.values())
+    hists, errors = await run_net(get_history_many, symbols, period=SECTOR_PERIOD, interval="1d")
+    closes = {}
+    for sector, sym in SECTOR_ETF.items():
+        h = hists.get(sym)
+        if h is not None and not h.empty:
+            closes[sector] = h["Close"].astype(float)
+    if not closes:
+        raise RuntimeError(f"No data for sector ETFs: {errors}")
+    _model = SectorModel.from_closes(closes, errors)
+    return _model
+
+
+async def get_model() -> SectorModel:
+    """The current model, building it on first use if the background refresh has not run yet."""
+    global _refresh_lock
+    if _model is not None:
+        return _model
+    if _refresh_lock is None:
+        _refresh_lock = asyncio.Lock()
+    async with _refresh_lock:
+        return _model if _model is not None else await refresh()
@@ -0,0 +1,107 @@
+"""JSON rendering for the API, with NumPy-native series payloads.
+
+``FastJSONResponse`` is the app's default response class. It renders with
+orjson, which writes NumPy arrays (float, int, bool, datetime64) straight from
+their buffers, so endpoints can hand back arrays and pandas objects without
+converting them element by element. NaN and infinities become ``null``.
+Without orjson it falls back to the stdlib encoder (arrays via ``tolist()``).
+
+FastAPI runs ``jsonable_encoder`` over plain return values, which cannot handle
+arrays, so series endpoints return ``respond(...)`` instead of a dict.
+
+Series endpoints also offer a compact encoding, chosen with ``?format=compact``
+or ``Accept: application/vnd.finscope.compact+json``: ``labels`` is replaced by
+``t0`` (Unix seconds of the first point) and ``offsets`` (integer seconds from
+``t0``), and values are sent as float32 (about 7 significant digits).
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+COMPACT_MEDIA_TYPE = "application/vnd.finscope.compact+json"
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(obj: Any) -> Any:
+    # pandas Series/Index -> ndarray; anything orjson cannot take natively -> Python values
+    if hasattr(obj, "to_numpy"):
+        return obj.to_numpy()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by ``dumps``, timed as the ``serialize`` stage."""
+
+    def render(self, content: Any) -> bytes:
+        with metrics.stage("serialize"):
+            return dumps(content)
+
+
+def encoding(request: Optional[Request]) -> str:
+    """``"compact"`` when the request asks for it (``format`` query param first, then Accept), else ``"json"``."""
+    if request is None:
+        return "json"
+    fmt = request.query_params.get("format")
+    if fmt:
+        return "compact" if fmt.strip().lower() == "compact" else "json"
+    return "compact" if COMPACT_MEDIA_TYPE in request.headers.get("accept", "") else "json"
+
+
+def iso_labels(epochs: np.ndarray, unit: str = "s") -> list:
+    """Unix seconds -> ISO-8601 UTC strings (``unit="D"`` gives plain dates)."""
+    stamps = np.asarray(epochs, dtype=np.int64).astype("datetime64[s]")
+    if unit == "D":
+        return np.datetime_as_string(stamps.astype("datetime64[D]")).tolist()
+    return np.datetime_as_string(stamps, unit=unit, timezone="UTC").tolist()
+
+
+def series(epochs: np.ndarray, columns: Mapping[str, Any], compact: bool = False,
+           labels: Optional[Sequence[Any]] = None, label_unit: str = "s") -> Dict[str, Any]:
+    """Time axis plus value columns for a series response.
+
+    JSON: ``labels`` (``labels`` if given, else ISO strings of ``epochs``) and
+    the columns as they are. Compact: ``t0``/``offsets`` and float32 columns.
+    """
+    if compact:
+        epochs = np.asarray(epochs, dtype=np.int64)
+        t0 = int(epochs[0]) if epochs.size else None
+        out: Dict[str, Any] = {"encoding": "compact", "t0": t0, "offsets": epochs - (t0 or 0)}
+        out.update((k, np.asarray(v, dtype=np.float32)) for k, v in columns.items())
+        return out
+    out = {"labels": labels if labels is not None else iso_labels(epochs, label_unit)}
+    out.update(columns)
+    return out
+
+
+def respond(content: Any, compact: bool = False, status_code: int = 200) -> FastJSONResponse:
+    """Render ``content`` (arrays allowed) without going through ``jsonable_encoder``."""
+    return FastJSONResponse(content, status_code=status_code, headers={"Vary": "Accept"},
+                            media_type=COMPACT_MEDIA_TYPE if compact else JSON_MEDIA_TYPE)
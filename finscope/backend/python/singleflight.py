@@ -0,0 +1,64 @@
+"""In-process single-flight: concurrent callers for the same key share one execution.
+
+Works for both thread callers (``do``) and asyncio callers (``do_async``);
+both paths share the same in-flight table, so a sync batch fetch and an async
+endpoint asking for the same key still trigger only one upstream call.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    def _claim(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            self._stats["calls"] += 1
+            fut = self._calls.get(key)
+            if fut is not None:
+                self._stats["coalesced"] += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self._stats["executions"] += 1
+            return fut, True
+
+    def _run(self, key: Hashable, fut: Future, fn: Callable[[], Any]):
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._calls.pop(key, None)
+            fut.set_exception(e)
+        else:
+            with self._lock:
+                self._calls.pop(key, None)
+            fut.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run ``fn`` unless a call for ``key`` is already in flight; either way return its result."""
+        fut, leader = self._claim(key)
+        if leader:
+            self._run(key, fut, fn)
+        return fut.result()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any], executor: Optional[Executor] = None) -> Any:
+        """Async variant: the leader runs ``fn`` on ``executor``; followers await without holding a thread."""
+        fut, leader = self._claim(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(executor, self._run, key, fut, fn)
+        return await asyncio.wrap_future(fut)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,191 @@
+"""Cold-start accounting and the post-start warm-up.
+
+``main`` imports this module first, so its clock starts before anything heavy.
+pandas, scikit-learn, yfinance and redis are imported lazily by the code that
+needs them; an import hook records when each heavy package was first loaded,
+how long it took, and what triggered it (module import, startup, warm-up or a
+request). ``step(name)`` times startup work, and ``report()`` (served at
+``/debug/startup``) puts it together.
+
+The warm-up runs as a background task once startup has finished, i.e. while
+the server is already answering requests: it preloads ``WARMUP_MODULES`` and
+then runs the app's cache-priming steps. ``WARMUP_ENABLED=0`` skips it.
+"""
+import asyncio
+import contextvars
+import importlib
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+T0 = time.perf_counter()
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1").lower() not in ("0", "false", "no")
+# Seconds to wait after startup before warming, so the first requests are not competing with it
+WARMUP_DELAY = float(os.environ.get("WARMUP_DELAY", "0.5"))
+WARMUP_MODULES = os.environ.get("WARMUP_MODULES", "numpy,pandas,sklearn.ensemble")
+
+# Top-level packages whose first import is timed
+WATCHED = ("numpy", "pandas", "sklearn", "scipy", "yfinance", "redis", "pyarrow", "prophet")
+
+# What the process is doing (import -> startup -> request); the warm-up task overrides it for its own work
+_phase = "import"
+_override: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("finscope_startup_phase", default=None)
+_modules: Dict[str, Dict[str, Any]] = {}
+_steps: Dict[str, float] = {}
+_marks: Dict[str, float] = {}
+_warmup: Dict[str, Any] = {"enabled": WARMUP_ENABLED, "status": "pending", "steps_ms": {}, "errors": {}}
+_lock = threading.Lock()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name: str):
+        self.loader = loader
+        self.name = name
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        t0 = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            # Hand the module back to its real loader (importlib.resources etc. look at it)
+            module.__loader__ = self.loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self.loader
+            with _lock:
+                _modules[self.name] = {
+                    "ms": _ms(time.perf_counter() - t0),
+                    "at_ms": _ms(t0 - T0),
+                    "loaded_by": _override.get() or _phase,
+                }
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Wraps the loader of ``WATCHED`` packages to time their first import (submodules included)."""
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in WATCHED or name in _modules:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, name)
+                return spec
+        return None
+
+
+if not any(isinstance(f, _ImportTimer) for f in sys.meta_path):
+    sys.meta_path.insert(0, _ImportTimer())
+# Anything imported before this module (e.g. by the server) was loaded at process start
+for _name in WATCHED:
+    if _name in sys.modules and _name not in _modules:
+        _modules[_name] = {"ms": None, "at_ms": None, "loaded_by": "preloaded"}
+
+
+def mark(name: str):
+    """Record that ``name`` (e.g. "imports", "ready") was reached, relative to when this module loaded."""
+    global _phase
+    _marks[name] = time.perf_counter() - T0
+    if name == "imports":
+        _phase = "startup"
+    elif name == "ready":
+        _phase = "request"
+
+
+@contextmanager
+def step(name: str):
+    """Time a startup step."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps[name] = time.perf_counter() - t0
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since the OS started this process (Linux only), covering the server's own imports."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return None
+
+
+_process_offset: Optional[float] = None
+_age = _process_age()
+if _age is not None:
+    # How long the process had been running when this module was imported
+    _process_offset = max(0.0, _age - (time.perf_counter() - T0))
+
+
+async def _load_module(name: str):
+    await asyncio.to_thread(importlib.import_module, name)
+
+
+async def warmup(steps: List[Tuple[str, Callable[[], Awaitable[Any]]]], delay: float = WARMUP_DELAY):
+    """Preload ``WARMUP_MODULES``, then run ``steps`` (name, async fn) in order; failures are recorded, not raised."""
+    _override.set("warmup")
+    await asyncio.sleep(delay)
+    _warmup["status"] = "running"
+    t0 = time.perf_counter()
+    plan = [(f"import:{m}", lambda m=m: _load_module(m)) for m in WARMUP_MODULES.split(",") if m.strip()]
+    for name, fn in plan + list(steps):
+        s0 = time.perf_counter()
+        try:
+            await fn()
+        except asyncio.CancelledError:
+            _warmup["status"] = "cancelled"
+            raise
+        except Exception as e:
+            _warmup["errors"][name] = str(e) or e.__class__.__name__
+            log.warning("warm-up step %s failed: %s", name, _warmup["errors"][name])
+        _warmup["steps_ms"][name] = _ms(time.perf_counter() - s0)
+    _warmup["total_ms"] = _ms(time.perf_counter() - t0)
+    _warmup["finished_at_ms"] = _ms(time.perf_counter() - T0)
+    _warmup["status"] = "done"
+
+
+def report() -> Dict[str, Any]:
+    with _lock:
+        modules = {k: dict(v) for k, v in sorted(_modules.items())}
+    out: Dict[str, Any] = {
+        "pid": os.getpid(),
+        # Process start -> this module (interpreter + server imports), then app-relative milestones
+        "before_app_ms": _ms(_process_offset) if _process_offset is not None else None,
+        "marks_ms": {k: _ms(v) for k, v in _marks.items()},
+        "startup_steps_ms": {k: _ms(v) for k, v in _steps.items()},
+        "modules": modules,
+        "not_loaded": [m for m in WATCHED if m not in modules],
+        "warmup": dict(_warmup),
+    }
+    if "ready" in _marks and _process_offset is not None:
+        out["process_to_ready_ms"] = _ms(_process_offset + _marks["ready"])
+    return out
+
+
+def gauge() -> Dict[Tuple[str, ...], float]:
+    """Seconds to each milestone, for ``finscope_startup_seconds{phase}``."""
+    out = {(k,): round(v, 4) for k, v in _marks.items()}
+    if "finished_at_ms" in _warmup:
+        out[("warmup",)] = _warmup["finished_at_ms"] / 1000.0
+    return out
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+import time
+
+# The service modules are flat and read DB_DIR at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DB_DIR"] = tempfile.mkdtemp(prefix="finscope-test-")
+os.environ.setdefault("WARM_ENABLED", "0")
+os.environ.setdefault("WARMUP_ENABLED", "0")
+# No background jobs while app tests run
+os.environ.setdefault("TS_MAINTENANCE_SECONDS", "0")
+os.environ.setdefault("SECTOR_REFRESH_SECONDS", "0")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+import market_data  # noqa: E402
+
+
+class StubSource:
+    """Business-day bars from ``start`` up to ``end`` (or today); records every call."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+        self.delay = 0.0
+
+    def __call__(self, symbol, start, end, interval):
+        self.calls.append((symbol, pd.Timestamp(start), None if end is None else pd.Timestamp(end), interval))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        stop = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz="UTC")
+        idx = pd.bdate_range(pd.Timestamp(start).tz_localize(None) if pd.Timestamp(start).tzinfo else pd.Timestamp(start),
+                             stop.tz_localize(None) if stop.tzinfo else stop, inclusive="left", normalize=True)
+        close = 100 + np.arange(len(idx), dtype=float)
+        return pd.DataFrame({"Open": close, "High": close + 1, "Low": close - 1, "Close": close,
+                             "Adj Close": close, "Volume": 1000.0}, index=idx)
+
+
+@pytest.fixture
+def source():
+    stub = StubSource()
+    market_data.set_price_source(stub)
+    yield stub
+    market_data.set_price_source(None)
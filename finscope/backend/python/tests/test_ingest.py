@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+import ingest
+import main
+
+
+def test_ingest_rejects_an_invalid_row_before_queueing():
+    with TestClient(main.app) as client:
+        r = client.post("/timeseries/ingest", json=[
+            {"source": "t", "metric": "ok", "timestamp": "2024-01-01T00:00:00Z", "value": 1.0},
+            {"source": "t", "metric": "", "timestamp": "2024-01-01T00:00:00Z", "value": 1.0},
+        ])
+    assert r.status_code == 200
+    assert r.json() == {"error": "row 1: metric and timestamp are required"}
+
+
+def test_stream_rejects_an_overlong_ndjson_line_that_arrives_with_a_newline(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_LINE_BYTES", 64)
+    line = b'{"metric": "long", "timestamp": 1704067200, "value": 1, "meta": {"pad": "' + b"x" * 100 + b'"}}\n'
+    with TestClient(main.app) as client:
+        r = client.post("/timeseries/ingest/stream", content=line + b'{"metric": "long", "timestamp": 1704067260, "value": 2}\n',
+                        headers={"content-type": "application/x-ndjson"})
+    assert r.json()["error"] == "line 1 exceeds 64 bytes"
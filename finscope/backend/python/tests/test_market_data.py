@@ -0,0 +1,82 @@
+import time
+
+import pandas as pd
+import pytest
+
+import market_data
+
+
+def test_top_up_fetches_only_after_newest_stored_bar(source):
+    first = market_data.get_history("TOPUP", period="1mo")
+    assert len(source.calls) == 1 and source.calls[0][2] is None
+    newest = first.index.max()
+
+    market_data.get_history("TOPUP", period="1mo", force=True)
+    assert len(source.calls) == 2
+    _, start, end, _ = source.calls[1]
+    assert end is None
+    # Inclusive of the newest bar, so a still-forming bar is refreshed
+    assert start.strftime("%Y-%m-%d") == newest.strftime("%Y-%m-%d")
+
+
+def test_longer_period_backfills_before_covered_from(source):
+    market_data.get_history("BACKFILL", period="1mo")
+    covered_from = market_data._sync_state("BACKFILL", "1d")[0]
+
+    hist = market_data.get_history("BACKFILL", period="6mo")
+    assert len(source.calls) == 2
+    _, start, end, _ = source.calls[1]
+    assert end is not None and end.strftime("%Y-%m-%d") == covered_from
+    assert start < pd.Timestamp(covered_from, tz="UTC")
+    assert market_data._sync_state("BACKFILL", "1d")[0] < covered_from
+    assert hist.index.min() < pd.Timestamp(covered_from)
+
+
+def test_stored_bars_served_when_upstream_raises(source):
+    stored = market_data.get_history("FALLBACK", period="1mo")
+    assert not stored.empty
+
+    source.fail = True
+    hist = market_data.get_history("FALLBACK", period="1mo", force=True)
+    assert len(source.calls) == 2
+    pd.testing.assert_frame_equal(hist, stored)
+
+
+def test_upstream_error_propagates_when_nothing_is_stored(source):
+    source.fail = True
+    with pytest.raises(RuntimeError):
+        market_data.get_history("NOTHING", period="1mo")
+
+
+def test_history_many_shares_one_deadline(source):
+    market_data.get_history("SLOWSTORED", period="1mo")
+    source.delay = 0.5
+    t0 = time.monotonic()
+    # One slot: with a per-task timeout the queued symbols would never time out
+    results, errors = market_data.get_history_many(["SLOWSTORED", "SLOWA", "SLOWB"], period="1mo",
+                                                   concurrency=1, timeout=0.2)
+    assert time.monotonic() - t0 < 0.45
+    assert list(results) == ["SLOWSTORED"] and not results["SLOWSTORED"].empty
+    assert set(errors) == {"SLOWA", "SLOWB"}
+
+
+def test_history_many_rejects_unsupported_period_before_fetching(source):
+    with pytest.raises(ValueError):
+        market_data.get_history_many(["SPY", "QQQ"], period="2mo")
+    assert source.calls == []
+
+
+def test_backfill_keeps_fetched_at_and_tops_up_a_stale_tail(source, monkeypatch):
+    market_data.get_history("STALETAIL", period="1mo")
+    fetched_at = market_data._sync_state("STALETAIL", "1d")[2]
+
+    market_data.get_history("STALETAIL", period="3mo")
+    assert len(source.calls) == 2
+    assert market_data._sync_state("STALETAIL", "1d")[2] == fetched_at
+
+    monkeypatch.setattr(market_data, "MARKET_DATA_TTL", 0)
+    market_data.get_history("STALETAIL", period="6mo")
+    # Backfill of the older range, then a top-up of the tail in the same call
+    assert len(source.calls) == 4
+    assert source.calls[2][2] is not None and source.calls[3][2] is None
+    assert market_data._sync_state("STALETAIL", "1d")[2] > fetched_at
@@ -0,0 +1,19 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+
+
+@pytest.fixture
+def client(source):
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_forecast_upstream_fetch_is_labelled_with_the_endpoint(client):
+    assert client.get("/forecast", params={"symbol": "STAGEFC"}).status_code == 200
+    text = metrics.render()
+    assert re.search(r'finscope_stage_seconds_count\{endpoint="/forecast",stage="upstream_fetch"\} [1-9]', text)
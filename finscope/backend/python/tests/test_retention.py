@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import db
+import retention
+from retention import DAY, HOUR
+from writer import writer
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    db.init_db()
+
+
+def put(metric, points):
+    db.insert_timeseries({"source": "", "metric": metric, "timestamp": t, "value": v} for t, v in points)
+
+
+def series(metric):
+    with db.get_conn(readonly=True) as c:
+        sid = c.execute("SELECT id FROM ts_series WHERE metric=?", (metric,)).fetchone()[0]
+        raw = c.execute("SELECT t, value FROM ts_points WHERE series_id=? ORDER BY t", (sid,)).fetchall()
+        rollups = c.execute("SELECT tier, t, n, sum, min, max, first, last FROM ts_rollups WHERE series_id=? "
+                            "ORDER BY tier, t", (sid,)).fetchall()
+    return raw, rollups
+
+
+def test_run_rolls_raw_into_hourly_and_hourly_into_daily():
+    now = int(time.time())
+    hour = (now - 40 * DAY) // HOUR * HOUR
+    day = (now - 400 * DAY) // DAY * DAY
+    recent = (now - DAY, 9.0)
+    put("ret.tiers", [(hour + 60, 1.0), (hour + 120, 3.0), (hour + 180, 2.0),
+                      (day + HOUR, 4.0), (day + 2 * HOUR, 6.0), recent])
+
+    out = asyncio.run(retention.run())
+    assert out["raw_rolled"] >= 5 and out["hourly_rolled"] >= 2
+
+    raw, rollups = series("ret.tiers")
+    assert raw == [recent]
+    # Values are sent out of time order: first/last follow the timestamps
+    assert rollups == [(HOUR, hour, 3, 6.0, 1.0, 3.0, 1.0, 2.0), (DAY, day, 2, 10.0, 4.0, 6.0, 4.0, 6.0)]
+    assert db.query_timeseries_points("ret.tiers") == [(day, 5.0), (hour, 2.0), recent]
+
+
+def test_late_points_merge_into_an_existing_bucket():
+    hour = (int(time.time()) - 40 * DAY) // HOUR * HOUR
+    put("ret.late", [(hour + 60, 1.0)])
+    asyncio.run(retention.run())
+    put("ret.late", [(hour + 30, 5.0)])
+    asyncio.run(retention.run())
+
+    raw, rollups = series("ret.late")
+    assert raw == []
+    assert rollups == [(HOUR, hour, 2, 6.0, 1.0, 5.0, 5.0, 1.0)]
+
+
+def test_per_metric_policy_expires_old_daily_buckets():
+    now = int(time.time())
+    asyncio.run(writer.write(retention.set_policy, "ret.expire", {"raw_days": 1, "hourly_days": 2, "daily_days": 10}))
+    kept = (now - 5 * DAY) // DAY * DAY
+    put("ret.expire", [(now - 20 * DAY, 1.0), (kept + HOUR, 2.0), (now - 60, 3.0)])
+
+    out = asyncio.run(retention.run())
+    assert out["daily_expired"] >= 1
+
+    raw, rollups = series("ret.expire")
+    assert raw == [(now - 60, 3.0)]
+    assert [(tier, t, n) for tier, t, n, *_ in rollups] == [(DAY, kept, 1)]
+
+
+def test_validate_rejects_a_tier_expiring_before_the_one_rolled_into_it():
+    with pytest.raises(ValueError):
+        retention.validate({"raw_days": 30, "hourly_days": 7})
+    assert retention.validate({"daily_days": 0})["daily_days"] == 0
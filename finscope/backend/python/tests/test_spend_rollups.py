@@ -0,0 +1,47 @@
+import pytest
+
+import db
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    db.init_db()
+
+
+def rollups(table, key, day):
+    with db.get_conn(readonly=True) as c:
+        rows = c.execute(f"SELECT {key}, spend, spend_count, income, income_count FROM {table} WHERE day=?",
+                         (day,)).fetchall()
+    # Buckets emptied by corrections stay behind as zero rows
+    return {r[0]: tuple(r[1:]) for r in rows if any(r[1:])}
+
+
+def txn(id, date, amount, name="Cafe", category="Food,Coffee"):
+    return {"id": id, "date": date, "amount": amount, "name": name, "category": category}
+
+
+def test_update_moves_amount_between_buckets():
+    counts = db.upsert_transactions([txn("r1", "2031-01-01", 50.0), txn("r2", "2031-01-01", 5.0)])
+    assert counts == {"inserted": 2, "updated": 0, "failed": 0}
+    assert rollups("spend_daily_category", "category", "2031-01-01") == {"Food": (55.0, 2, 0.0, 0)}
+
+    counts = db.upsert_transactions([txn("r1", "2031-01-02", 20.0, name="Airline", category="Travel")])
+    assert counts == {"inserted": 0, "updated": 1, "failed": 0}
+    assert rollups("spend_daily_category", "category", "2031-01-01") == {"Food": (5.0, 1, 0.0, 0)}
+    assert rollups("spend_daily_category", "category", "2031-01-02") == {"Travel": (20.0, 1, 0.0, 0)}
+    assert rollups("spend_daily_merchant", "merchant", "2031-01-02") == {"Airline": (20.0, 1, 0.0, 0)}
+
+
+def test_refund_moves_from_spend_to_income_and_duplicates_in_a_batch_count_once():
+    db.upsert_transactions([txn("r3", "2031-02-01", 30.0), txn("r3", "2031-02-01", -30.0), {"amount": 1}])
+    assert rollups("spend_daily_category", "category", "2031-02-01") == {"Food": (0.0, 0, 30.0, 1)}
+
+
+def test_incremental_rollups_match_a_rebuild():
+    db.upsert_transactions([txn("r4", "2031-03-01", 12.5), txn("r5", "2031-03-01", -3.0, name=None, category=None)])
+    db.upsert_transactions([txn("r4", "2031-03-02", 7.5)])
+    days = ("2031-03-01", "2031-03-02")
+    before = {(t, d): rollups(t, k, d) for t, k in db._ROLLUP_TABLES for d in days}
+    db.rebuild_spend_rollups()
+    assert {(t, d): rollups(t, k, d) for t, k in db._ROLLUP_TABLES for d in days} == before
+    assert before[("spend_daily_merchant", "2031-03-01")] == {"Unknown": (0.0, 0, 3.0, 1)}
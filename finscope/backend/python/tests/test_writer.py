@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db
+import writer as writer_mod
+from writer import Writer, WriterBusy
+
+
+@pytest.fixture
+def w():
+    db.init_db()
+    # A long linger so jobs queued back to back share one group commit
+    wr = Writer(batch_wait_ms=50)
+    wr.submit(lambda c: c.execute("CREATE TABLE IF NOT EXISTS writer_test(k TEXT PRIMARY KEY)")).result()
+    wr.submit(lambda c: c.execute("DELETE FROM writer_test")).result()
+    yield wr
+    wr.stop()
+
+
+def insert(c, key):
+    c.execute("INSERT INTO writer_test(k) VALUES(?)", (key,))
+    return key
+
+
+def keys():
+    with db.get_conn(readonly=True) as c:
+        return sorted(r[0] for r in c.execute("SELECT k FROM writer_test"))
+
+
+def test_failing_job_raises_to_its_caller_and_rolls_back_alone(w):
+    ok = w.submit(insert, "a")
+    bad = w.submit(insert, "a")  # primary-key clash inside the same group
+    other = w.submit(insert, "b")
+    assert ok.result() == "a" and other.result() == "b"
+    with pytest.raises(Exception, match="UNIQUE"):
+        bad.result()
+    assert keys() == ["a", "b"]
+    assert w.stats()["failed"] == 1
+
+
+def test_durable_write_returns_the_result_and_queued_write_returns_none(w):
+    async def run():
+        return await w.write(insert, "d"), await w.write(insert, "q", durable=False)
+
+    assert asyncio.run(run()) == ("d", None)
+    w.stop()  # drains the queue: the fire-and-forget job is committed too
+    assert keys() == ["d", "q"]
+
+
+def test_full_queue_raises_writer_busy(monkeypatch):
+    db.init_db()
+    monkeypatch.setattr(writer_mod, "WRITE_ENQUEUE_TIMEOUT_MS", 20)
+    wr = Writer(max_queue=1, batch_max=1)
+    started, release = threading.Event(), threading.Event()
+
+    def block(c):
+        started.set()
+        release.wait(5)
+
+    try:
+        running = wr.submit(block)
+        started.wait(5)
+        wr.submit(lambda c: None)  # fills the single queue slot
+        with pytest.raises(WriterBusy):
+            asyncio.run(wr.write(lambda c: None))
+        assert wr.stats()["rejected"] == 1
+    finally:
+        release.set()
+        running.result()
+        wr.stop()
+
+
+def test_writer_busy_is_a_503_with_retry_after(monkeypatch):
+    import main
+
+    async def busy(*args, **kwargs):
+        raise WriterBusy("Write queue is full")
+
+    monkeypatch.setattr(main.writer, "write", busy)
+    with TestClient(main.app) as client:
+        r = client.post("/timeseries/ingest", json=[{"source": "t", "metric": "m", "timestamp": "2024-01-01T00:00:00Z", "value": 1.0}])
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == str(writer_mod.WRITE_RETRY_AFTER)
+
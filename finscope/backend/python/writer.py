@@ -0,0 +1,243 @@
+"""Single-writer group commit for SQLite writes.
+
+Every API write to ``finscope.db`` is a job ``fn(conn, *args)`` on a bounded
+queue, run by one writer thread that owns the process's only read-write
+connection. The thread takes whatever is queued (up to ``WRITE_BATCH_MAX``
+jobs, lingering ``WRITE_BATCH_WAIT_MS`` for more), runs each job inside its
+own SAVEPOINT, so a failing job rolls back alone, and commits the group with
+one COMMIT (one fsync). Across uvicorn workers each group commit holds an
+exclusive ``fcntl`` lock on ``finscope.db.lock``. Processes then queue on the
+lock instead of racing SQLite's busy handler into "database is locked".
+
+Callers choose the acknowledgement:
+
+- durable (default): ``await write(...)`` returns the job's result once its
+  group has committed;
+- fire-and-forget (``durable=False``): returns as soon as the job is queued;
+  failures are logged and counted.
+
+When the queue is full a write waits up to ``WRITE_ENQUEUE_TIMEOUT_MS`` for
+room, then raises ``WriterBusy`` (the API answers 503 with Retry-After).
+"""
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import metrics
+
+log = logging.getLogger(__name__)
+
+WRITE_QUEUE_MAX = int(os.environ.get("WRITE_QUEUE_MAX", "1024"))
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "256"))
+# How long the writer lingers for more jobs after the first of a group (0 commits whatever is queued)
+WRITE_BATCH_WAIT_MS = float(os.environ.get("WRITE_BATCH_WAIT_MS", "2"))
+WRITE_ENQUEUE_TIMEOUT_MS = float(os.environ.get("WRITE_ENQUEUE_TIMEOUT_MS", "2000"))
+# Seconds clients are told to wait (Retry-After) when the queue is full
+WRITE_RETRY_AFTER = int(os.environ.get("WRITE_RETRY_AFTER", "1"))
+
+JOBS = metrics.register(metrics.Counter(
+    "finscope_db_write_jobs_total", "Write jobs by outcome (committed, failed, rejected).", ("outcome",)))
+GROUP_SIZE = metrics.register(metrics.Histogram(
+    "finscope_db_group_commit_jobs", "Jobs per group commit.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)))
+COMMIT_SECONDS = metrics.register(metrics.Histogram(
+    "finscope_db_group_commit_seconds", "Group-commit time: lock wait, jobs and COMMIT.", ("phase",)))
+
+
+class WriterBusy(RuntimeError):
+    """The write queue stayed full for ``WRITE_ENQUEUE_TIMEOUT_MS``."""
+
+
+_STOP = object()
+
+
+class Writer:
+    def __init__(self, max_queue: int = WRITE_QUEUE_MAX, batch_max: int = WRITE_BATCH_MAX,
+                 batch_wait_ms: float = WRITE_BATCH_WAIT_MS):
+        self.batch_max = max(1, batch_max)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._stats = {"jobs": 0, "failed": 0, "rejected": 0, "groups": 0, "largest_group": 0, "fire_and_forget_failed": 0}
+
+    # --- producer side ---
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="finscope-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        """Queue ``fn(conn, *args, **kwargs)``; blocks up to ``timeout`` (default ``WRITE_ENQUEUE_TIMEOUT_MS``) for room."""
+        self.start()
+        fut: Future = Future()
+        wait = WRITE_ENQUEUE_TIMEOUT_MS / 1000 if timeout is None else timeout
+        try:
+            self._queue.put((fn, args, kwargs, fut), block=wait > 0, timeout=wait if wait > 0 else None)
+        except queue.Full:
+            self._reject()
+        return fut
+
+    async def write(self, fn: Callable[..., Any], *args, durable: bool = True, **kwargs) -> Any:
+        """Queue a job from the event loop; returns its result once committed (``durable``), else None once queued."""
+        self.start()
+        fut: Future = Future()
+        job = (fn, args, kwargs, fut)
+        deadline = time.monotonic() + WRITE_ENQUEUE_TIMEOUT_MS / 1000
+        delay = 0.005
+        # Poll for room rather than blocking the loop in queue.put
+        while True:
+            try:
+                self._queue.put_nowait(job)
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    self._reject()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        if not durable:
+            fut.add_done_callback(self._log_failure)
+            return None
+        with metrics.stage("db_write"):
+            return await asyncio.wrap_future(fut)
+
+    def _reject(self):
+        self._stats["rejected"] += 1
+        JOBS.inc("rejected")
+        raise WriterBusy(f"Write queue is full ({self._queue.maxsize} jobs); retry in {WRITE_RETRY_AFTER}s")
+
+    def _log_failure(self, fut: Future):
+        exc = fut.exception()
+        if exc is not None:
+            self._stats["fire_and_forget_failed"] += 1
+            log.warning("fire-and-forget write failed: %s", exc)
+
+    def stop(self, timeout: float = 10.0):
+        """Commit everything already queued, then stop the thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            log.warning("writer did not drain its queue within %.1fs; %d jobs not committed", timeout, self._queue.qsize())
+            return
+        thread.join(max(0.0, deadline - time.monotonic()))
+        self._thread = None
+
+    # --- writer thread ---
+
+    def _take(self) -> Tuple[List[tuple], bool]:
+        """The next group of jobs (blocking for the first); ``stop`` is True once the sentinel was seen."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        jobs = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(jobs) < self.batch_max:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return jobs, True
+            jobs.append(item)
+        return jobs, False
+
+    def _run(self):
+        try:
+            conn = db.open_writer()
+            lock_fd = db.open_lock()
+        except Exception as e:
+            # Fail what is queued rather than leave callers waiting; the next write starts a new thread
+            log.error("writer could not open %s: %s", db.DB_PATH, e)
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                if item is not _STOP and item[3].set_running_or_notify_cancel():
+                    self._finish(item[3], False, e)
+        try:
+            stop = False
+            while not stop:
+                jobs, stop = self._take()
+                if jobs:
+                    self._commit(conn, lock_fd, jobs)
+        finally:
+            os.close(lock_fd)
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, lock_fd: int, jobs: List[tuple]):
+        t0 = time.perf_counter()
+        results: List[Tuple[Future, bool, Any]] = []
+        try:
+            with db.hold_lock(lock_fd):
+                t1 = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                for i, (fn, args, kwargs, fut) in enumerate(jobs):
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    conn.execute(f"SAVEPOINT job{i}")
+                    try:
+                        results.append((fut, True, fn(conn, *args, **kwargs)))
+                        conn.execute(f"RELEASE job{i}")
+                    except Exception as e:
+                        conn.execute(f"ROLLBACK TO job{i}")
+                        conn.execute(f"RELEASE job{i}")
+                        results.append((fut, False, e))
+                t2 = time.perf_counter()
+                conn.execute("COMMIT")
+        except Exception as e:
+            # The group could not be committed: every job in it fails
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            log.warning("group commit of %d jobs failed: %s", len(jobs), e)
+            for _, _, _, fut in jobs:
+                if fut.running() or (not fut.done() and fut.set_running_or_notify_cancel()):
+                    self._finish(fut, False, e)
+            return
+        t3 = time.perf_counter()
+        for fut, ok, value in results:
+            self._finish(fut, ok, value)
+        self._stats["groups"] += 1
+        self._stats["largest_group"] = max(self._stats["largest_group"], len(jobs))
+        GROUP_SIZE.observe(len(jobs))
+        COMMIT_SECONDS.observe(t1 - t0, "lock_wait")
+        COMMIT_SECONDS.observe(t2 - t1, "jobs")
+        COMMIT_SECONDS.observe(t3 - t2, "commit")
+
+    def _finish(self, fut: Future, ok: bool, value: Any):
+        self._stats["jobs"] += 1
+        if ok:
+            JOBS.inc("committed")
+            fut.set_result(value)
+        else:
+            self._stats["failed"] += 1
+            JOBS.inc("failed")
+            fut.set_exception(value)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats, queued=self._queue.qsize(), max_queue=self._queue.maxsize,
+                    running=self._thread is not None and self._thread.is_alive())
+
+
+writer = Writer()
+metrics.register(metrics.CallbackGauge(
+    "finscope_db_write_queue", "Write jobs waiting for the writer thread.", lambda: {(): writer._queue.qsize()}))